@@ -0,0 +1,182 @@
+"""
+Benchmark event loop: asyncio standard vs uvloop
+
+Per ogni loop avvia un processo separato (utils.event_loop.run, come main.py)
+con Telegram finto e InMemoryNotificationQueue, e misura:
+
+- throughput dispatch: worker_loop -> process_notification -> notifier
+- latenza "handler": round trip di una risposta Telegram (send_notification_with_retry)
+  avviata ogni --probe-interval durante lo svuotamento della coda
+- lag dell'event loop (utils.loop_monitor; con asyncio anche il rilevatore
+  di callback lente è attivo, come in produzione)
+
+uvloop non installato: viene riportato e confrontato solo asyncio.
+
+Uso:
+    python benchmarks/bench_event_loop.py --notifications 5000 --latency 0.02
+    python benchmarks/bench_event_loop.py --loops asyncio,uvloop --runs 3
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import subprocess
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_telegram import FakeTelegramServer  # noqa: E402
+from benchmarks.synthetic import DEFAULT_MIX, make_events, parse_mix  # noqa: E402
+
+
+def _percentile(values: List[float], q: float) -> float:
+    """Percentile esatto (nearest-rank)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q * len(ordered))) - 1))
+    return ordered[index]
+
+
+async def _synthetic_user_info(telegram_id: int) -> dict:
+    return {"telegram_id": telegram_id, "username": f"user{telegram_id}", "first_name": "Bench",
+            "last_name": "User", "business_name": None, "created_at": None}
+
+
+async def run_one(args) -> Dict[str, Any]:
+    """Un run nel processo corrente (loop già selezionato)"""
+    server = FakeTelegramServer(latency=args.latency, jitter=args.latency / 4)
+    await server.start()
+    os.environ.update({
+        "TELEGRAM_API_BASE_URL": server.base_url,
+        "ADMIN_BOT_TOKEN": "bench-token",
+        "ADMIN_CHAT_ID": "-1000000000001",
+        "ADMIN_WORKER_BATCH_PAUSE_SEC": "0",
+    })
+
+    import worker
+    from lifecycle_cards import LifecycleCardStore
+    from notification_queue import InMemoryNotificationQueue, set_notification_queue
+    from notifier import send_notification_with_retry
+    from utils.loop_monitor import LoopMonitor
+    from utils.rate_limiter import RateLimiter
+
+    worker._fetch_user_info = _synthetic_user_info
+    worker.lifecycle_cards = LifecycleCardStore(persist=False)
+
+    queue = InMemoryNotificationQueue()
+    set_notification_queue(queue)
+    for event_type, telegram_id, correlation_id, payload in make_events(args.notifications, mix=args.mix, seed=args.seed):
+        await queue.enqueue(event_type, telegram_id, payload, correlation_id=correlation_id)
+
+    rate_limiter = RateLimiter(global_limit_per_min=1_000_000, min_error_interval_sec=0)
+    monitor = LoopMonitor(interval=0.05)
+    monitor.start()
+    handler_latencies: List[float] = []
+    stop_event = asyncio.Event()
+
+    async def probe_handlers():
+        while not stop_event.is_set():
+            start = time.perf_counter()
+            await send_notification_with_retry("probe", "bench-probe", max_retries=0)
+            handler_latencies.append(time.perf_counter() - start)
+            await asyncio.sleep(args.probe_interval)
+
+    start = time.perf_counter()
+    worker_task = asyncio.create_task(worker.worker_loop(rate_limiter, stop_event))
+    probe_task = asyncio.create_task(probe_handlers())
+    try:
+        while (await queue.stats())["pending"]:
+            if time.perf_counter() - start > args.timeout:
+                raise TimeoutError(f"Coda non svuotata in {args.timeout}s")
+            await asyncio.sleep(0.02)
+        elapsed = time.perf_counter() - start
+    finally:
+        stop_event.set()
+        await asyncio.gather(worker_task, probe_task, return_exceptions=True)
+        snapshot = monitor.snapshot()
+        await monitor.stop()
+        await server.stop()
+
+    return {
+        "notifications_per_sec": args.notifications / elapsed,
+        "handler_p50_ms": _percentile(handler_latencies, 0.50) * 1000,
+        "handler_p99_ms": _percentile(handler_latencies, 0.99) * 1000,
+        "loop_lag_p99_ms": (snapshot["p99"] or 0.0) * 1000,
+        "loop_lag_max_ms": (snapshot["max"] or 0.0) * 1000,
+    }
+
+
+def _child_argv(args, loop_name: str) -> List[str]:
+    return [
+        sys.executable, os.path.abspath(__file__),
+        "--child", loop_name,
+        "--notifications", str(args.notifications),
+        "--mix", ",".join(f"{name}={weight}" for name, weight in args.mix.items()),
+        "--latency", str(args.latency),
+        "--probe-interval", str(args.probe_interval),
+        "--timeout", str(args.timeout),
+        "--seed", str(args.seed),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark asyncio vs uvloop (dispatch e latenza handler)")
+    parser.add_argument("--loops", default="asyncio,uvloop", help="loop da confrontare")
+    parser.add_argument("--runs", type=int, default=1, help="run per loop (si tiene il migliore)")
+    parser.add_argument("--notifications", type=int, default=5000)
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX)
+    parser.add_argument("--latency", type=float, default=0.02, help="latenza Telegram finto (s)")
+    parser.add_argument("--probe-interval", type=float, default=0.05, help="intervallo richieste handler (s)")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--child", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    if args.child:
+        from utils import event_loop
+        selected, _ = event_loop.select_event_loop(args.child)
+        if selected != args.child:
+            print(json.dumps({"loop": selected, "unavailable": True}))
+            return
+        results = event_loop.run(run_one(args), args.child)
+        print(json.dumps({"loop": selected, **results}))
+        return
+
+    rows: Dict[str, Dict[str, Any]] = {}
+    for loop_name in [name.strip() for name in args.loops.split(",") if name.strip()]:
+        best = None
+        for _ in range(args.runs):
+            output = subprocess.run(_child_argv(args, loop_name), capture_output=True, text=True, check=True)
+            result = json.loads(output.stdout.strip().splitlines()[-1])
+            if result.get("unavailable"):
+                print(f"⚠️  {loop_name} non disponibile (non installato): escluso dal confronto")
+                break
+            if best is None or result["notifications_per_sec"] > best["notifications_per_sec"]:
+                best = result
+        if best:
+            rows[loop_name] = best
+
+    print(f"\nEvent loop ({args.notifications} notifiche, latenza Telegram {args.latency * 1000:.0f} ms):")
+    print(f"  {'loop':<10}{'notifiche/s':>12}{'handler p50':>13}{'handler p99':>13}{'lag p99':>10}{'lag max':>10}")
+    for loop_name, row in rows.items():
+        print(
+            f"  {loop_name:<10}{row['notifications_per_sec']:12.1f}"
+            f"{row['handler_p50_ms']:10.1f} ms{row['handler_p99_ms']:10.1f} ms"
+            f"{row['loop_lag_p99_ms']:7.1f} ms{row['loop_lag_max_ms']:7.1f} ms"
+        )
+
+    if "asyncio" in rows and "uvloop" in rows:
+        base, fast = rows["asyncio"], rows["uvloop"]
+        speedup = fast["notifications_per_sec"] / base["notifications_per_sec"] - 1
+        latency = fast["handler_p99_ms"] / base["handler_p99_ms"] - 1 if base["handler_p99_ms"] else 0.0
+        print(f"\n  uvloop vs asyncio: throughput {speedup * 100:+.1f}%, handler p99 {latency * 100:+.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Benchmark overhead di logging per notifica processata
+
+Simula i log emessi dal worker per ogni notifica inviata (notifier + worker)
+e misura il tempo speso nel thread chiamante (cioè sull'event loop) con:
+- legacy: log_with_context eager + StreamHandler sincrono
+- sync: log_with_context lazy + StreamHandler sincrono
+- queue: log_with_context lazy + QueueHandler/QueueListener (setup_colored_logging)
+- disabled: livello WARNING, i log INFO vengono scartati
+
+Uso:
+    python benchmarks/bench_logging.py [--notifications 20000] [--output /dev/null]
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import logging
+import argparse
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import logging_config  # noqa: E402
+from utils.logging import log_with_context  # noqa: E402
+
+worker_logger = logging.getLogger("worker")
+app_logger = logging.getLogger("app")
+
+
+def legacy_log_with_context(level, message, correlation_id=None, notification_id=None, **extra):
+    """Implementazione precedente: serializzazione eager anche con livello disabilitato"""
+    if correlation_id is None:
+        correlation_id = str(uuid.uuid4())
+    payload = {
+        "level": level.upper(),
+        "message": message,
+        "timestamp": datetime.utcnow().isoformat(),
+        "correlation_id": correlation_id,
+        **extra
+    }
+    if notification_id:
+        payload["notification_id"] = notification_id
+    app_logger.log(getattr(logging, level.upper(), logging.INFO), json.dumps(payload))
+
+
+def legacy_notification(i: int):
+    """Log per notifica con le chiamate eager originali"""
+    notification_id = f"00000000-0000-0000-0000-{i:012d}"
+    legacy_log_with_context(
+        "info", f"Notifica {notification_id} inviata con successo",
+        correlation_id=f"corr-{i}", notification_id=notification_id, attempt=1
+    )
+    legacy_log_with_context(
+        "info", f"Notifica {notification_id} processata con successo",
+        correlation_id=f"corr-{i}", notification_id=notification_id, event_type="onboarding_completed"
+    )
+    worker_logger.debug(f"Batch completato: {i} processate, 0 saltate")
+
+
+def lazy_notification(i: int):
+    """Log per notifica con le chiamate lazy attuali"""
+    notification_id = f"00000000-0000-0000-0000-{i:012d}"
+    log_with_context(
+        "info", "Notifica %s inviata con successo", notification_id,
+        correlation_id=f"corr-{i}", notification_id=notification_id, attempt=1
+    )
+    log_with_context(
+        "info", "Notifica %s processata con successo", notification_id,
+        correlation_id=f"corr-{i}", notification_id=notification_id, event_type="onboarding_completed"
+    )
+    worker_logger.debug("Batch completato: %d processate, %d saltate", i, 0)
+
+
+def configure(mode: str, stream):
+    """Configura root logger per lo scenario"""
+    os.environ["ADMIN_LOG_ASYNC"] = "true" if mode == "queue" else "false"
+    original_stdout = sys.stdout
+    sys.stdout = stream
+    try:
+        root = logging_config.setup_colored_logging("bench")
+    finally:
+        sys.stdout = original_stdout
+    root.setLevel(logging.WARNING if mode == "disabled" else logging.INFO)
+
+
+def run(mode: str, notifications: int, output: str) -> float:
+    """Microsecondi per notifica spesi nel thread chiamante"""
+    with open(output, "w") as stream:
+        configure(mode, stream)
+        emit = legacy_notification if mode == "legacy" else lazy_notification
+
+        start = time.perf_counter()
+        for i in range(notifications):
+            emit(i)
+        elapsed = time.perf_counter() - start
+
+        # Svuota la coda prima di chiudere il file (fuori dalla misura)
+        logging_config.stop_logging()
+    return elapsed / notifications * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark overhead logging per notifica")
+    parser.add_argument("--notifications", type=int, default=20000)
+    parser.add_argument("--output", default=os.devnull, help="Destinazione log (default: /dev/null)")
+    args = parser.parse_args()
+
+    results = {}
+    for mode in ("legacy", "sync", "queue", "disabled"):
+        results[mode] = run(mode, args.notifications, args.output)
+
+    print(f"Overhead logging per notifica ({args.notifications} notifiche):")
+    for mode, micros in results.items():
+        print(f"  {mode:<9} {micros:8.2f} µs  ({results['legacy'] / micros:.1f}x vs legacy)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+"""
+Benchmark pipeline notifiche: worker_loop -> process_notification -> templates
+-> RateLimiter -> send_notification_with_retry -> Telegram finto
+
+La coda è InMemoryNotificationQueue (default) oppure Postgres locale (--database-url):
+in quel caso vengono inserite righe con correlation_id "bench-..." e rimosse a fine run.
+Le info utente sono sintetiche (la tabella users appartiene al bot principale).
+
+Riporta notifiche/s, latenza p50/p99 (per notifica e da inserimento a invio)
+e memoria allocata per 10k notifiche. Con --save-baseline salva i risultati
+in benchmarks/baseline_pipeline.json; senza, li confronta con la baseline.
+
+Uso:
+    python benchmarks/bench_pipeline.py --notifications 10000 --latency 0.02 --rate-429 0.01
+    python benchmarks/bench_pipeline.py --save-baseline
+    python benchmarks/bench_pipeline.py --database-url postgresql://localhost/gioia_bench
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import platform
+import tracemalloc
+from datetime import datetime
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_telegram import FakeTelegramServer  # noqa: E402
+from benchmarks.synthetic import DEFAULT_MIX, make_events, parse_mix  # noqa: E402
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline_pipeline.json")
+
+# Metriche confrontate con la baseline: (chiave, True se più alto è meglio)
+COMPARED_METRICS = [
+    ("notifications_per_sec", True),
+    ("process_p50_ms", False),
+    ("process_p99_ms", False),
+    ("memory_per_10k_mb", False),
+]
+
+
+def _percentile(values: List[float], q: float) -> float:
+    """Percentile esatto (nearest-rank)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q * len(ordered))) - 1))
+    return ordered[index]
+
+
+async def _synthetic_user_info(telegram_id: int) -> dict:
+    return {
+        "telegram_id": telegram_id,
+        "username": f"user{telegram_id}",
+        "first_name": "Bench",
+        "last_name": "User",
+        "business_name": f"Enoteca {telegram_id}",
+        "created_at": None,
+    }
+
+
+class PostgresQueue:
+    """Seed e pulizia delle righe di benchmark su admin_notifications"""
+
+    async def seed(self, events):
+        from db import get_db_pool, ensure_admin_notifications_table
+        await ensure_admin_notifications_table()
+        pool = await get_db_pool()
+        async with pool.acquire() as conn:
+            await conn.executemany(
+                """
+                INSERT INTO admin_notifications (event_type, telegram_id, correlation_id, payload)
+                VALUES ($1, $2, $3, $4::jsonb)
+                """,
+                [
+                    (event_type, telegram_id, f"bench-{correlation_id}", json.dumps(payload))
+                    for event_type, telegram_id, correlation_id, payload in events
+                ]
+            )
+
+    async def pending_count(self) -> int:
+        from db import get_db_pool
+        pool = await get_db_pool()
+        async with pool.acquire() as conn:
+            return await conn.fetchval(
+                "SELECT COUNT(*) FROM admin_notifications WHERE status = 'pending' AND correlation_id LIKE 'bench-%'"
+            )
+
+    async def cleanup(self):
+        from db import get_db_pool
+        pool = await get_db_pool()
+        async with pool.acquire() as conn:
+            await conn.execute("DELETE FROM admin_notifications WHERE correlation_id LIKE 'bench-%'")
+
+
+async def run_pass(args, server: FakeTelegramServer, measure_memory: bool) -> Dict[str, Any]:
+    """Un run completo: seed coda, worker_loop fino a coda vuota"""
+    import worker
+    from utils.rate_limiter import RateLimiter
+    from utils.ttl_cache import TTLCache
+    from utils.dedup import SlidingWindowDeduplicator
+    from lifecycle_cards import LifecycleCardStore
+    from notification_queue import (
+        InMemoryNotificationQueue,
+        PostgresNotificationQueue,
+        set_notification_queue
+    )
+
+    events = make_events(args.notifications, mix=args.mix, users=args.users, seed=args.seed)
+    worker._fetch_user_info = _synthetic_user_info
+    # Stato in memoria del worker azzerato ad ogni run (la cache utenti resta attiva)
+    worker.user_info_cache = TTLCache(ttl_seconds=worker.USER_INFO_CACHE_TTL, max_size=2048)
+    worker.notification_deduplicator = SlidingWindowDeduplicator(window_seconds=worker.DEDUP_WINDOW_SEC)
+    worker.lifecycle_cards = LifecycleCardStore(persist=bool(args.database_url))
+    requests_before, rejected_before = server.requests, server.rejected
+    process_times: List[float] = []
+    dispatch_times: List[float] = []
+
+    if args.database_url:
+        queue = PostgresQueue()
+        await queue.seed(events)
+        set_notification_queue(PostgresNotificationQueue())
+    else:
+        queue = InMemoryNotificationQueue()
+        for event_type, telegram_id, correlation_id, payload in events:
+            await queue.enqueue(event_type, telegram_id, payload, correlation_id=correlation_id)
+        set_notification_queue(queue)
+
+    # Misura tempi reali di process_notification e inserimento -> invio
+    original_process = worker.process_notification
+    original_mark_sent = worker.mark_notification_sent
+    created_at = time.perf_counter()
+
+    async def timed_process(notification, rate_limiter):
+        start = time.perf_counter()
+        try:
+            return await original_process(notification, rate_limiter)
+        finally:
+            process_times.append(time.perf_counter() - start)
+
+    async def timed_mark_sent(notification_id):
+        await original_mark_sent(notification_id)
+        dispatch_times.append(time.perf_counter() - created_at)
+
+    worker.process_notification = timed_process
+    worker.mark_notification_sent = timed_mark_sent
+
+    rate_limiter = RateLimiter(
+        global_limit_per_min=args.rate_limit_per_min,
+        min_error_interval_sec=args.min_error_interval
+    )
+
+    if measure_memory:
+        tracemalloc.start()
+
+    start = time.perf_counter()
+    task = asyncio.create_task(worker.worker_loop(rate_limiter))
+    try:
+        while True:
+            await asyncio.sleep(0.05)
+            remaining = await queue.pending_count() if args.database_url else (await queue.stats())["pending"]
+            if remaining == 0:
+                break
+            if time.perf_counter() - start > args.timeout:
+                raise TimeoutError(f"Coda non svuotata in {args.timeout}s ({remaining} pending)")
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        elapsed = time.perf_counter() - start
+        worker.process_notification = original_process
+        worker.mark_notification_sent = original_mark_sent
+        if args.database_url:
+            await queue.cleanup()
+
+    peak_bytes = 0
+    if measure_memory:
+        _, peak_bytes = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return {
+        "elapsed_sec": elapsed,
+        "notifications_per_sec": args.notifications / elapsed,
+        "process_p50_ms": _percentile(process_times, 0.50) * 1000,
+        "process_p99_ms": _percentile(process_times, 0.99) * 1000,
+        "dispatch_p50_ms": _percentile(dispatch_times, 0.50) * 1000,
+        "dispatch_p99_ms": _percentile(dispatch_times, 0.99) * 1000,
+        "memory_per_10k_mb": peak_bytes / args.notifications * 10000 / (1024 * 1024),
+        "telegram_requests": server.requests - requests_before,
+        "telegram_429": server.rejected - rejected_before,
+    }
+
+
+def compare_with_baseline(results: Dict[str, Any], max_regression: float) -> bool:
+    """Stampa delta rispetto alla baseline; False se una metrica peggiora oltre max_regression"""
+    if not os.path.exists(BASELINE_PATH):
+        print("\nNessuna baseline: eseguire con --save-baseline per crearla")
+        return True
+
+    with open(BASELINE_PATH) as f:
+        baseline = json.load(f)
+
+    if baseline.get("config") != results["config"]:
+        print("\n⚠️  Configurazione diversa dalla baseline: confronto indicativo")
+
+    ok = True
+    print(f"\nConfronto con baseline ({baseline.get('created_at', 'N/A')}):")
+    for key, higher_is_better in COMPARED_METRICS:
+        old, new = baseline["results"].get(key), results["results"][key]
+        if not old:
+            continue
+        delta = (new - old) / old
+        worse = -delta if higher_is_better else delta
+        flag = "❌ REGRESSIONE" if worse > max_regression else "ok"
+        if worse > max_regression:
+            ok = False
+        print(f"  {key:<24} {old:10.2f} -> {new:10.2f} ({delta * 100:+.1f}%) {flag}")
+    return ok
+
+
+async def main_async(args) -> int:
+    server = FakeTelegramServer(
+        latency=args.latency,
+        jitter=args.jitter,
+        rate_429=args.rate_429,
+        retry_after=args.retry_after
+    )
+    await server.start()
+
+    # Configurazione letta all'import da notifier e worker
+    os.environ.update({
+        "TELEGRAM_API_BASE_URL": server.base_url,
+        "ADMIN_BOT_TOKEN": "bench-token",
+        "ADMIN_CHAT_ID": "-1000000000001",
+        "ADMIN_WORKER_BATCH_SIZE": str(args.batch_size),
+        "ADMIN_WORKER_BATCH_PAUSE_SEC": "0",
+    })
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+
+    try:
+        results = await run_pass(args, server, measure_memory=False)
+        if not args.skip_memory:
+            memory = await run_pass(args, server, measure_memory=True)
+            results["memory_per_10k_mb"] = memory["memory_per_10k_mb"]
+    finally:
+        await server.stop()
+        if args.database_url:
+            from db import close_db_pool
+            await close_db_pool()
+
+    report = {
+        "created_at": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "config": {
+            "notifications": args.notifications,
+            "backend": "postgres" if args.database_url else "memory",
+            "latency": args.latency,
+            "jitter": args.jitter,
+            "rate_429": args.rate_429,
+            "batch_size": args.batch_size,
+            "mix": args.mix,
+        },
+        "results": results,
+    }
+
+    print(f"Pipeline notifiche ({args.notifications} notifiche, backend {report['config']['backend']}):")
+    print(f"  throughput        {results['notifications_per_sec']:10.1f} notifiche/s ({results['elapsed_sec']:.1f}s)")
+    print(f"  process p50/p99   {results['process_p50_ms']:10.2f} / {results['process_p99_ms']:.2f} ms")
+    print(f"  dispatch p50/p99  {results['dispatch_p50_ms']:10.0f} / {results['dispatch_p99_ms']:.0f} ms")
+    print(f"  memoria per 10k   {results['memory_per_10k_mb']:10.2f} MB")
+    print(f"  Telegram          {results['telegram_requests']} richieste, {results['telegram_429']} risposte 429")
+
+    if args.save_baseline:
+        with open(BASELINE_PATH, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nBaseline salvata in {BASELINE_PATH}")
+        return 0
+
+    return 0 if compare_with_baseline(report, args.max_regression) else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pipeline notifiche admin")
+    parser.add_argument("--notifications", type=int, default=10000)
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX,
+                        help="es. onboarding_completed=1,inventory_uploaded=2,error=7")
+    parser.add_argument("--users", type=int, default=500, help="telegram_id distinti")
+    parser.add_argument("--latency", type=float, default=0.02, help="latenza Telegram finto (s)")
+    parser.add_argument("--jitter", type=float, default=0.005)
+    parser.add_argument("--rate-429", type=float, default=0.0, help="frazione risposte 429")
+    parser.add_argument("--retry-after", type=int, default=0, help="retry_after nelle risposte 429 (s)")
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--rate-limit-per-min", type=int, default=1_000_000,
+                        help="limite globale RateLimiter (default: di fatto disattivato)")
+    parser.add_argument("--min-error-interval", type=int, default=180)
+    parser.add_argument("--database-url", default=None, help="Postgres locale invece della coda in memoria")
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--skip-memory", action="store_true", help="salta il run con tracemalloc")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--max-regression", type=float, default=0.15,
+                        help="peggioramento massimo tollerato rispetto alla baseline (0.15 = 15%%)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    sys.exit(asyncio.run(main_async(args)))
+
+
+if __name__ == "__main__":
+    main()
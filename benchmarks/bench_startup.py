@@ -0,0 +1,107 @@
+"""
+Benchmark avvio: tempo da processo pronto a polling attivo
+
+Esegue lo stesso percorso di main.main() (validate_config -> startup parallelo
+-> telegram_app.start -> start_polling) contro un Telegram finto, e confronta
+il tempo a "pronto" con il budget (default 2s).
+
+Senza --database-url la fase database (pool + migrazioni) è simulata con una
+coda in memoria e un'attesa di --db-latency secondi.
+
+Uso:
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --conflict-sec 1 --webhook-set
+    python benchmarks/bench_startup.py --database-url postgresql://localhost/gioia_bench
+"""
+import os
+import sys
+import time
+import asyncio
+import logging
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_telegram import FakeTelegramServer  # noqa: E402
+
+
+async def main_async(args) -> int:
+    server = FakeTelegramServer(
+        latency=args.latency,
+        jitter=args.latency / 4,
+        conflict_sec=args.conflict_sec,
+        webhook_set=args.webhook_set
+    )
+    await server.start()
+    os.environ.update({
+        "TELEGRAM_API_BASE_URL": server.base_url,
+        "ADMIN_BOT_TOKEN": "123456:bench-token",
+        "ADMIN_CHAT_ID": "-1000000000001",
+        "USE_WEBHOOK": "false",
+    })
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+
+    import main as bot_main
+    from db import close_db_pool
+    from notification_queue import InMemoryNotificationQueue, set_notification_queue
+
+    if not args.database_url:
+        async def _simulated_database():
+            set_notification_queue(InMemoryNotificationQueue())
+            await asyncio.sleep(args.db_latency)
+
+        bot_main.init_database = _simulated_database
+
+    telegram_app = None
+    try:
+        started_at = time.perf_counter()
+        phases = {}
+        bot_main.validate_config()
+        telegram_app = bot_main.setup_telegram_app(os.environ["ADMIN_BOT_TOKEN"])
+        await bot_main.startup(telegram_app, phases)
+        await telegram_app.start()
+        await bot_main._timed(phases, "polling_start", bot_main.start_polling(telegram_app))
+        ready_sec = time.perf_counter() - started_at
+    finally:
+        if telegram_app is not None:
+            if telegram_app.updater and telegram_app.updater.running:
+                await telegram_app.updater.stop()
+            if telegram_app.running:
+                await telegram_app.stop()
+            await telegram_app.shutdown()
+        if args.database_url:
+            await close_db_pool()
+        await server.stop()
+
+    print(f"Avvio (latenza Telegram {args.latency * 1000:.0f} ms, conflitti {args.conflict_sec}s, "
+          f"webhook residuo {'sì' if args.webhook_set else 'no'}):")
+    for name, seconds in phases.items():
+        print(f"  {name:<22}{seconds:8.3f} s")
+    print(f"  {'somma fasi':<22}{sum(phases.values()):8.3f} s")
+    print(f"  {'pronto':<22}{ready_sec:8.3f} s  (budget {args.budget}s)")
+    print(f"  409 Conflict ricevuti {server.conflicts:8d}")
+
+    if ready_sec > args.budget:
+        print("❌ Avvio oltre il budget")
+        return 1
+    print("✅ Avvio entro il budget")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark tempo di avvio del bot admin")
+    parser.add_argument("--latency", type=float, default=0.05, help="latenza Telegram finto (s)")
+    parser.add_argument("--db-latency", type=float, default=0.3, help="durata fase database simulata (s)")
+    parser.add_argument("--database-url", default=None, help="Postgres reale invece della fase simulata")
+    parser.add_argument("--conflict-sec", type=float, default=0.0, help="getUpdates in conflitto per N secondi")
+    parser.add_argument("--webhook-set", action="store_true", help="webhook residuo da rimuovere")
+    parser.add_argument("--budget", type=float, default=2.0, help="tempo massimo a pronto (s)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    sys.exit(asyncio.run(main_async(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Server Telegram Bot API finto (aiohttp) con latenza configurabile e 429 iniettati
+"""
+import json
+import time
+import random
+import asyncio
+from typing import Optional
+from aiohttp import web
+
+
+class FakeTelegramServer:
+    """
+    Risponde a POST /bot<token>/sendMessage e /editMessageText come Telegram,
+    più i metodi usati all'avvio (getMe, getUpdates, deleteWebhook, setWebhook).
+
+    Args:
+        latency: latenza media per risposta (secondi)
+        jitter: variazione uniforme +/- sulla latenza (secondi)
+        rate_429: frazione di richieste rifiutate con 429 Too Many Requests
+        retry_after: valore parameters.retry_after nelle risposte 429 (secondi)
+        conflict_sec: getUpdates risponde 409 Conflict per questi secondi dall'avvio
+            (istanza precedente ancora in polling)
+        webhook_set: webhook residuo registrato (getUpdates 409 fino a deleteWebhook)
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.05,
+        jitter: float = 0.02,
+        rate_429: float = 0.0,
+        retry_after: int = 0,
+        seed: int = 42,
+        conflict_sec: float = 0.0,
+        webhook_set: bool = False
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.conflict_sec = conflict_sec
+        self.webhook_set = webhook_set
+        self.conflicts = 0
+        self._started_at = 0.0
+        self._rng = random.Random(seed)
+        self._runner: Optional[web.AppRunner] = None
+        self.port: Optional[int] = None
+        self.requests = 0
+        self.sent = 0
+        self.edited = 0
+        self.rejected = 0
+        self._message_id = 0
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    async def _delay(self):
+        delay = max(0.0, self.latency + self._rng.uniform(-self.jitter, self.jitter))
+        if delay:
+            await asyncio.sleep(delay)
+
+    async def _send_message(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        body = await request.json()
+
+        await self._delay()
+
+        if self.rate_429 and self._rng.random() < self.rate_429:
+            self.rejected += 1
+            return web.Response(
+                status=429,
+                content_type="application/json",
+                text=json.dumps({
+                    "ok": False,
+                    "error_code": 429,
+                    "description": f"Too Many Requests: retry after {self.retry_after}",
+                    "parameters": {"retry_after": self.retry_after},
+                })
+            )
+
+        if "message_id" in body:
+            # editMessageText: stesso message_id
+            self.edited += 1
+            message_id = int(body["message_id"])
+        else:
+            self.sent += 1
+            self._message_id += 1
+            message_id = self._message_id
+        return web.json_response({
+            "ok": True,
+            "result": {
+                "message_id": message_id,
+                "chat": {"id": int(body.get("chat_id", 0))},
+                "text": body.get("text", ""),
+            }
+        })
+
+    @staticmethod
+    def _conflict(description: str) -> web.Response:
+        return web.Response(
+            status=409,
+            content_type="application/json",
+            text=json.dumps({"ok": False, "error_code": 409, "description": description})
+        )
+
+    async def _get_me(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        await self._delay()
+        return web.json_response({
+            "ok": True,
+            "result": {"id": 1, "is_bot": True, "first_name": "Fake", "username": "fake_admin_bot"}
+        })
+
+    async def _get_updates(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        params = await request.post()
+        await self._delay()
+
+        if self.webhook_set:
+            self.conflicts += 1
+            return self._conflict(
+                "Conflict: can't use getUpdates method while webhook is active; "
+                "use deleteWebhook to delete the webhook first"
+            )
+        if time.monotonic() - self._started_at < self.conflict_sec:
+            self.conflicts += 1
+            return self._conflict(
+                "Conflict: terminated by other getUpdates request; "
+                "make sure that only one bot instance is running"
+            )
+
+        # Long polling senza update: attesa breve invece del timeout richiesto
+        timeout = float(params.get("timeout") or 0)
+        if timeout:
+            await asyncio.sleep(min(timeout, 0.5))
+        return web.json_response({"ok": True, "result": []})
+
+    async def _webhook(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        await self._delay()
+        self.webhook_set = request.match_info["method"] == "setWebhook"
+        return web.json_response({"ok": True, "result": True})
+
+    async def start(self):
+        """Avvia su una porta libera di 127.0.0.1"""
+        app = web.Application()
+        app.router.add_post("/bot{token}/sendMessage", self._send_message)
+        app.router.add_post("/bot{token}/editMessageText", self._send_message)
+        app.router.add_post("/bot{token}/getMe", self._get_me)
+        app.router.add_post("/bot{token}/getUpdates", self._get_updates)
+        app.router.add_post("/bot{token}/{method:(deleteWebhook|setWebhook)}", self._webhook)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host="127.0.0.1", port=0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        self._started_at = time.monotonic()
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
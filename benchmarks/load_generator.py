@@ -0,0 +1,155 @@
+"""
+Load generator: inserisce notifiche sintetiche in admin_notifications con COPY
+
+Riproduce un incidente in modo controllato: eventi onboarding_completed,
+inventory_uploaded ed error a un ritmo e mix configurabili, con telegram_id
+distribuiti secondo Zipf (pochi utenti rumorosi). Con --watch, finito
+l'inserimento, mostra lo svuotamento della coda fino a zero pending.
+
+Le righe hanno correlation_id "load-..." e vengono rimosse con --cleanup.
+Da usare su un database di sviluppo/staging, non in produzione.
+
+Uso:
+    python benchmarks/load_generator.py --total 20000 --rate 500 --watch
+    python benchmarks/load_generator.py --total 5000 --mix error=9,inventory_uploaded=1 --zipf-s 1.5
+    python benchmarks/load_generator.py --cleanup
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+from datetime import datetime
+
+import asyncpg
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import DEFAULT_MIX, ZipfUserSampler, choose_event_types, make_payload, parse_mix  # noqa: E402
+
+COLUMNS = ["event_type", "telegram_id", "correlation_id", "payload", "status", "next_attempt_at"]
+
+
+def _normalize_database_url(database_url: str) -> str:
+    """Stesse varianti di URL accettate da db.get_db_pool"""
+    if database_url.startswith("postgresql+asyncpg://"):
+        return database_url.replace("postgresql+asyncpg://", "postgresql://", 1)
+    if database_url.startswith("postgres://"):
+        return database_url.replace("postgres://", "postgresql://", 1)
+    return database_url
+
+
+def make_records(rng: random.Random, sampler: ZipfUserSampler, mix, count: int, offset: int):
+    """Record per copy_records_to_table (payload JSONB come testo)"""
+    now = datetime.utcnow()
+    event_types = choose_event_types(rng, mix, count)
+    telegram_ids = sampler.sample(rng, count)
+    return [
+        (
+            event_type,
+            telegram_id,
+            f"load-{uuid.UUID(int=rng.getrandbits(128))}",
+            json.dumps(make_payload(rng, event_type, offset + index)),
+            "pending",
+            now,
+        )
+        for index, (event_type, telegram_id) in enumerate(zip(event_types, telegram_ids))
+    ]
+
+
+async def pending_stats(conn: asyncpg.Connection):
+    """Pending del load generator e totali per stato"""
+    return await conn.fetchrow("""
+        SELECT
+            COUNT(*) FILTER (WHERE status = 'pending') AS pending,
+            COUNT(*) FILTER (WHERE status = 'sent') AS sent,
+            COUNT(*) FILTER (WHERE status = 'failed') AS failed
+        FROM admin_notifications
+        WHERE correlation_id LIKE 'load-%'
+    """)
+
+
+async def generate(args):
+    conn = await asyncpg.connect(_normalize_database_url(args.database_url))
+    try:
+        if args.cleanup:
+            result = await conn.execute("DELETE FROM admin_notifications WHERE correlation_id LIKE 'load-%'")
+            print(f"Rimosse {result.split()[-1]} righe del load generator")
+            return
+
+        rng = random.Random(args.seed)
+        sampler = ZipfUserSampler(args.users, s=args.zipf_s)
+        print(
+            f"Inserimento {args.total} notifiche a {args.rate}/s, mix "
+            + ", ".join(f"{event_type}={weight:.0%}" for event_type, weight in args.mix.items())
+            + f"; {args.users} utenti, top 1 {sampler.share_of_top(1):.0%}, top 10 {sampler.share_of_top(10):.0%}"
+        )
+
+        start = time.perf_counter()
+        inserted = 0
+        report_every = max(args.batch, args.total // 10)
+        next_report = report_every
+        while inserted < args.total:
+            count = min(args.batch, args.total - inserted)
+            records = make_records(rng, sampler, args.mix, count, inserted)
+            await conn.copy_records_to_table("admin_notifications", records=records, columns=COLUMNS)
+            inserted += count
+
+            # Ritmo costante: attende il momento in cui le righe inserite sono "dovute"
+            if args.rate > 0:
+                delay = inserted / args.rate - (time.perf_counter() - start)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+            if inserted >= next_report or inserted == args.total:
+                next_report += report_every
+                elapsed = time.perf_counter() - start
+                print(f"  {inserted}/{args.total} inserite in {elapsed:.1f}s ({inserted / elapsed:.0f}/s)")
+
+        if not args.watch:
+            return
+
+        print("Svuotamento coda (Ctrl+C per interrompere):")
+        drain_start = time.perf_counter()
+        while True:
+            stats = await pending_stats(conn)
+            elapsed = time.perf_counter() - drain_start
+            print(f"  +{elapsed:6.0f}s pending {stats['pending']}, sent {stats['sent']}, failed {stats['failed']}")
+            if stats["pending"] == 0:
+                print(f"Coda svuotata in {elapsed:.0f}s")
+                break
+            await asyncio.sleep(args.watch_interval)
+    finally:
+        await conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load generator admin_notifications (COPY)")
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--total", type=int, default=10000, help="notifiche da inserire")
+    parser.add_argument("--rate", type=float, default=0, help="notifiche/s (0 = più veloce possibile)")
+    parser.add_argument("--batch", type=int, default=500, help="righe per COPY")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX,
+                        help="es. onboarding_completed=1,inventory_uploaded=2,error=7")
+    parser.add_argument("--users", type=int, default=1000, help="telegram_id distinti")
+    parser.add_argument("--zipf-s", type=float, default=1.2, help="asimmetria Zipf (0 = uniforme)")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--watch", action="store_true", help="mostra lo svuotamento della coda")
+    parser.add_argument("--watch-interval", type=float, default=5)
+    parser.add_argument("--cleanup", action="store_true", help="rimuove le righe load-* e termina")
+    args = parser.parse_args()
+
+    if not args.database_url:
+        parser.error("DATABASE_URL non configurata (usa --database-url)")
+
+    try:
+        asyncio.run(generate(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Drill di graceful shutdown: SIGTERM durante un burst di notifiche
+
+Avvia worker_loop su InMemoryNotificationQueue e Telegram finto, riempie la
+coda con un burst, invia SIGTERM al processo a metà svuotamento e usa gli
+stessi signal handler e drain di main.py. Verifica che:
+
+- lo shutdown termini entro la deadline (ADMIN_SHUTDOWN_TIMEOUT_SEC / --deadline)
+- nessuna notifica resti bloccata sotto lease: quelle non inviate sono subito
+  disponibili per la prossima istanza
+- ogni messaggio arrivato a Telegram sia confermato (nessun invio senza ack)
+- al "riavvio" le restanti vengano inviate: totale invii = notifiche, senza doppi
+
+Con --latency maggiore di --deadline si esercita il percorso di cancellazione
+(notifica in corso restituita alla coda).
+
+Uso:
+    python benchmarks/shutdown_drill.py --notifications 2000 --latency 0.01
+    python benchmarks/shutdown_drill.py --notifications 200 --latency 2 --deadline 1
+"""
+import os
+import sys
+import time
+import signal
+import asyncio
+import logging
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_telegram import FakeTelegramServer  # noqa: E402
+from benchmarks.synthetic import DEFAULT_MIX, make_events, parse_mix  # noqa: E402
+
+
+async def _synthetic_user_info(telegram_id: int) -> dict:
+    return {"telegram_id": telegram_id, "username": None, "first_name": None,
+            "last_name": None, "business_name": None, "created_at": None}
+
+
+async def _available(queue, notifications: int) -> int:
+    """Notifiche pending subito prendibili (claim e release immediato)"""
+    claimed = await queue.claim(notifications)
+    for notification in claimed:
+        await queue.release(notification.id)
+    return len(claimed)
+
+
+async def main_async(args) -> int:
+    server = FakeTelegramServer(latency=args.latency, jitter=args.latency / 4)
+    await server.start()
+    os.environ.update({
+        "TELEGRAM_API_BASE_URL": server.base_url,
+        "ADMIN_BOT_TOKEN": "drill-token",
+        "ADMIN_CHAT_ID": "-1000000000001",
+        "ADMIN_WORKER_BATCH_PAUSE_SEC": "0",
+    })
+
+    import main as bot_main
+    import worker
+    from lifecycle_cards import LifecycleCardStore
+    from notification_queue import InMemoryNotificationQueue, set_notification_queue
+    from utils.rate_limiter import RateLimiter
+
+    worker._fetch_user_info = _synthetic_user_info
+    worker.lifecycle_cards = LifecycleCardStore(persist=False)
+    bot_main.SHUTDOWN_TIMEOUT_SEC = args.deadline
+
+    queue = InMemoryNotificationQueue()
+    set_notification_queue(queue)
+    for event_type, telegram_id, correlation_id, payload in make_events(args.notifications, mix=args.mix, seed=args.seed):
+        await queue.enqueue(event_type, telegram_id, payload, correlation_id=correlation_id)
+
+    # Nessun limite né anti-spam: ogni notifica produce esattamente una richiesta Telegram
+    rate_limiter = RateLimiter(global_limit_per_min=1_000_000, min_error_interval_sec=0)
+
+    ok = True
+    try:
+        # Fase 1: burst, SIGTERM a metà, drain come in main.main()
+        bot_main._shutdown_event = asyncio.Event()
+        bot_main.install_signal_handlers(asyncio.get_running_loop())
+        worker_task = asyncio.create_task(worker.worker_loop(rate_limiter, bot_main._shutdown_event))
+
+        while server.sent + server.edited < args.notifications * args.kill_at:
+            await asyncio.sleep(0.01)
+        os.kill(os.getpid(), signal.SIGTERM)
+        await bot_main._shutdown_event.wait()
+        shutdown_start = time.perf_counter()
+        await bot_main.drain_worker(worker_task)
+        shutdown_sec = time.perf_counter() - shutdown_start
+
+        pending = (await queue.stats())["pending"]
+        acked = args.notifications - pending
+        delivered = server.sent + server.edited
+        available = await _available(queue, args.notifications)
+
+        print(f"Shutdown dopo SIGTERM ({args.notifications} notifiche, deadline {args.deadline}s):")
+        print(f"  durata shutdown       {shutdown_sec:8.2f} s")
+        print(f"  confermate (ack)      {acked:8d}")
+        print(f"  richieste Telegram ok {delivered:8d}")
+        print(f"  pending disponibili   {available:8d} / {pending}")
+
+        if shutdown_sec > args.deadline + 1:
+            print("❌ Shutdown oltre la deadline")
+            ok = False
+        if available != pending:
+            print(f"❌ {pending - available} notifiche bloccate sotto lease")
+            ok = False
+        if delivered != acked:
+            print(f"⚠️  {delivered - acked} messaggi inviati senza ack (cancellati durante l'invio: verranno reinviati)")
+            ok = ok and args.latency > args.deadline
+
+        # Fase 2: "riavvio", svuotamento delle restanti
+        stop_event = asyncio.Event()
+        worker_task = asyncio.create_task(worker.worker_loop(rate_limiter, stop_event))
+        restart_start = time.perf_counter()
+        while (await queue.stats())["pending"]:
+            if time.perf_counter() - restart_start > args.timeout:
+                print("❌ Coda non svuotata dopo il riavvio")
+                ok = False
+                break
+            await asyncio.sleep(0.05)
+        stop_event.set()
+        await worker_task
+
+        delivered = server.sent + server.edited
+        print(f"  invii totali          {delivered:8d} / {args.notifications}")
+        if delivered < args.notifications:
+            print("❌ Notifiche perse")
+            ok = False
+        elif delivered > args.notifications and args.latency <= args.deadline:
+            print(f"❌ {delivered - args.notifications} invii doppi")
+            ok = False
+    finally:
+        await server.stop()
+
+    print("✅ Shutdown senza perdite né doppi invii" if ok else "❌ Drill fallito")
+    return 0 if ok else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drill graceful shutdown (SIGTERM durante un burst)")
+    parser.add_argument("--notifications", type=int, default=2000)
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX)
+    parser.add_argument("--latency", type=float, default=0.01, help="latenza Telegram finto (s)")
+    parser.add_argument("--deadline", type=float, default=5, help="deadline shutdown (s)")
+    parser.add_argument("--kill-at", type=float, default=0.5, help="frazione di invii dopo cui inviare SIGTERM")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    sys.exit(asyncio.run(main_async(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Eventi sintetici admin_notifications per benchmark e load generator
+"""
+import random
+import uuid
+from itertools import accumulate
+from typing import Any, Dict, List, Tuple
+
+# Mix di default: la maggior parte del traffico reale sono errori
+DEFAULT_MIX = {
+    "onboarding_completed": 0.15,
+    "inventory_uploaded": 0.35,
+    "error": 0.50,
+}
+
+_FILE_TYPES = ["csv", "xlsx", "photo"]
+_ERROR_SOURCES = ["telegram-ai-bot", "gioia-processor", "web-app"]
+_ERROR_CODES = ["PARSE_ERROR", "TIMEOUT", "DB_ERROR", "AI_ERROR", None]
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    """
+    Mix eventi da stringa "onboarding_completed=1,inventory_uploaded=2,error=7".
+    I pesi vengono normalizzati a somma 1.
+    """
+    mix = {}
+    for part in value.split(","):
+        event_type, _, weight = part.partition("=")
+        event_type = event_type.strip()
+        if event_type not in DEFAULT_MIX:
+            raise ValueError(f"Tipo evento sconosciuto: {event_type}")
+        mix[event_type] = float(weight)
+    total = sum(mix.values())
+    if total <= 0:
+        raise ValueError("Somma dei pesi del mix deve essere > 0")
+    return {event_type: weight / total for event_type, weight in mix.items()}
+
+
+def choose_event_types(rng: random.Random, mix: Dict[str, float], count: int) -> List[str]:
+    """Tipi evento estratti secondo il mix"""
+    event_types = list(mix)
+    weights = [mix[event_type] for event_type in event_types]
+    return rng.choices(event_types, weights=weights, k=count)
+
+
+def make_payload(rng: random.Random, event_type: str, index: int) -> Dict[str, Any]:
+    """Payload realistico per tipo evento (campi letti da worker.format_notification_message)"""
+    if event_type == "onboarding_completed":
+        return {
+            "business_name": f"Enoteca Bench {index}",
+            "duration_seconds": rng.randint(60, 1800),
+            "stage": "completed",
+            "inventory_pending": rng.random() < 0.3,
+        }
+    if event_type == "inventory_uploaded":
+        rows = rng.randint(10, 2000)
+        rejected = rng.randint(0, rows // 10)
+        return {
+            "file_type": rng.choice(_FILE_TYPES),
+            "rows_processed": rows,
+            "rows_rejected": rejected,
+            "wines_saved": rows - rejected,
+            "processing_time": round(rng.uniform(0.5, 45.0), 2),
+        }
+    return {
+        "last_user_message": f"messaggio utente {index}",
+        "user_visible_error": "Si è verificato un errore, riprova",
+        "error_message": f"Traceback simulato #{index}: ValueError('campo mancante')",
+        "error_code": rng.choice(_ERROR_CODES),
+        "source": rng.choice(_ERROR_SOURCES),
+    }
+
+
+class ZipfUserSampler:
+    """
+    telegram_id con distribuzione Zipf: pochi utenti "rumorosi" generano
+    gran parte degli eventi (con s=1.2 e 1000 utenti il primo ~23%, i primi 10 ~57%).
+    """
+
+    def __init__(self, users: int, s: float = 1.2, first_id: int = 100000000):
+        self.ids = [first_id + rank for rank in range(users)]
+        self._cum_weights = list(accumulate(1.0 / (rank ** s) for rank in range(1, users + 1)))
+
+    def sample(self, rng: random.Random, count: int) -> List[int]:
+        return rng.choices(self.ids, cum_weights=self._cum_weights, k=count)
+
+    def share_of_top(self, top: int) -> float:
+        """Frazione di eventi attesa per i primi `top` utenti"""
+        return self._cum_weights[min(top, len(self.ids)) - 1] / self._cum_weights[-1]
+
+
+def make_events(
+    count: int,
+    mix: Dict[str, float] = DEFAULT_MIX,
+    users: int = 500,
+    seed: int = 42
+) -> List[Tuple[str, int, str, Dict[str, Any]]]:
+    """
+    Eventi sintetici (event_type, telegram_id, correlation_id, payload).
+    telegram_id uniformi su `users` utenti.
+    """
+    rng = random.Random(seed)
+    event_types = choose_event_types(rng, mix, count)
+    return [
+        (
+            event_type,
+            100000000 + rng.randrange(users),
+            str(uuid.UUID(int=rng.getrandbits(128))),
+            make_payload(rng, event_type, index),
+        )
+        for index, event_type in enumerate(event_types)
+    ]
@@ -4,13 +4,25 @@ Gestione connessione database PostgreSQL async per gioia-admin-bot
 import os
 import asyncpg
 import logging
+from pathlib import Path
 from typing import Optional
+from utils.metrics import registry
 
 logger = logging.getLogger(__name__)
 
+# Directory migration SQL
+MIGRATIONS_DIR = Path(__file__).parent / "migrations"
+
 # Pool di connessioni
 _pool: Optional[asyncpg.Pool] = None
 
+# Metriche utilizzo pool (aggiornate ad ogni scrape)
+DB_POOL_CONNECTIONS = registry.gauge(
+    "admin_bot_db_pool_connections",
+    "Connessioni pool database per stato (size, idle, in_use, max)",
+    ["state"]
+)
+
 
 async def get_db_pool() -> asyncpg.Pool:
     """Ottieni pool connessioni database (singleton)"""
@@ -51,6 +63,18 @@ async def close_db_pool():
         logger.info("Pool database chiuso")
 
 
+async def collect_db_pool_metrics():
+    """Collector metriche: utilizzo pool database"""
+    if _pool is None:
+        return
+    size = _pool.get_size()
+    idle = _pool.get_idle_size()
+    DB_POOL_CONNECTIONS.set(size, state="size")
+    DB_POOL_CONNECTIONS.set(idle, state="idle")
+    DB_POOL_CONNECTIONS.set(size - idle, state="in_use")
+    DB_POOL_CONNECTIONS.set(_pool.get_max_size(), state="max")
+
+
 async def ensure_admin_notifications_table():
     """
     Crea tabella admin_notifications se non esiste (auto-migration all'avvio).
@@ -70,41 +94,61 @@ async def ensure_admin_notifications_table():
             
             if table_exists:
                 logger.info("Tabella admin_notifications già esistente")
-                return
-            
-            # Leggi migration SQL
-            from pathlib import Path
-            migration_file = Path(__file__).parent / "migrations" / "001_create_admin_notifications.sql"
-            
-            if not migration_file.exists():
-                logger.warning(f"File migration non trovato: {migration_file}")
-                # Fallback: crea tabella direttamente
-                await _create_table_directly(conn)
-                return
-            
-            sql_content = migration_file.read_text(encoding='utf-8')
-            
-            logger.info("Esecuzione migration admin_notifications...")
-            await conn.execute(sql_content)
-            
-            # Verifica creazione
-            table_exists_after = await conn.fetchval("""
-                SELECT EXISTS (
-                    SELECT FROM information_schema.tables 
-                    WHERE table_name = 'admin_notifications'
-                )
-            """)
-            
-            if table_exists_after:
-                logger.info("✅ Tabella admin_notifications creata con successo")
             else:
-                logger.error("❌ Tabella non creata dopo migration")
-                
+                await _run_initial_migration(conn)
+            
+            # Migration successive (idempotenti, rieseguite ad ogni avvio)
+            await _apply_additional_migrations(conn)
+    
     except Exception as e:
         logger.error(f"Errore durante creazione tabella admin_notifications: {e}", exc_info=True)
         raise
 
 
+async def _run_initial_migration(conn):
+    """Esegue migration 001 (creazione tabella admin_notifications)"""
+    migration_file = MIGRATIONS_DIR / "001_create_admin_notifications.sql"
+    
+    if not migration_file.exists():
+        logger.warning(f"File migration non trovato: {migration_file}")
+        # Fallback: crea tabella direttamente
+        await _create_table_directly(conn)
+        return
+    
+    sql_content = migration_file.read_text(encoding='utf-8')
+    
+    logger.info("Esecuzione migration admin_notifications...")
+    await conn.execute(sql_content)
+    
+    # Verifica creazione
+    table_exists_after = await conn.fetchval("""
+        SELECT EXISTS (
+            SELECT FROM information_schema.tables 
+            WHERE table_name = 'admin_notifications'
+        )
+    """)
+    
+    if table_exists_after:
+        logger.info("✅ Tabella admin_notifications creata con successo")
+    else:
+        logger.error("❌ Tabella non creata dopo migration")
+
+
+async def _apply_additional_migrations(conn):
+    """
+    Applica le migration successive alla 001 in ordine di nome file.
+    Ogni migration usa IF NOT EXISTS, quindi è sicuro rieseguirle ad ogni avvio.
+    """
+    if not MIGRATIONS_DIR.exists():
+        return
+    
+    for migration_file in sorted(MIGRATIONS_DIR.glob("*.sql")):
+        if migration_file.name.startswith("001_"):
+            continue
+        logger.info(f"Applicazione migration {migration_file.name}...")
+        await conn.execute(migration_file.read_text(encoding='utf-8'))
+
+
 async def _create_table_directly(conn):
     """Crea tabella direttamente se file migration non disponibile"""
     logger.info("Creazione tabella admin_notifications (fallback)...")
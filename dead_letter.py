@@ -0,0 +1,172 @@
+"""
+Dead-letter notifiche admin: consultazione e requeue delle notifiche failed
+"""
+import re
+import logging
+from datetime import datetime, date, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from db import get_db_pool
+from report_jobs import normalize_report_date
+
+logger = logging.getLogger(__name__)
+
+# Notifiche per pagina in /failed
+FAILED_PAGE_SIZE = 10
+
+# Finestra relativa: 30m, 24h, 7d
+_RELATIVE_WINDOW = re.compile(r"^(\d+)([mhd])$")
+_WINDOW_UNITS = {"m": "minutes", "h": "hours", "d": "days"}
+
+# I filtri NULL non restringono la selezione.
+# Le righe fallite prima della migration 003 non hanno failed_at: si usa created_at.
+_FILTER_SQL = """
+    status = 'failed'
+    AND ($1::text IS NULL OR event_type = $1)
+    AND ($2::timestamp IS NULL OR COALESCE(failed_at, created_at) >= $2)
+    AND ($3::timestamp IS NULL OR COALESCE(failed_at, created_at) < $3)
+"""
+
+
+def _parse_day(value: str) -> date:
+    """Data YYYY-MM-DD o DD/MM/YY"""
+    return date.fromisoformat(normalize_report_date(value.strip()))
+
+
+def parse_time_filter(value: str, now: Optional[datetime] = None) -> Tuple[datetime, Optional[datetime]]:
+    """
+    Converte il filtro temporale di /failed in (since, until) UTC.
+
+    Supporta:
+    - "24h", "30m", "7d" -> ultime N ore/minuti/giorni
+    - "2025-12-11" -> l'intera giornata
+    - "2025-12-01..2025-12-05" -> intervallo di giorni (estremi inclusi)
+
+    Raises:
+        ValueError: se il formato non è riconosciuto
+    """
+    now = now or datetime.utcnow()
+
+    match = _RELATIVE_WINDOW.match(value.lower())
+    if match:
+        amount, unit = int(match.group(1)), match.group(2)
+        return now - timedelta(**{_WINDOW_UNITS[unit]: amount}), None
+
+    try:
+        if ".." in value:
+            start_str, end_str = value.split("..", 1)
+            start, end = _parse_day(start_str), _parse_day(end_str)
+        else:
+            start = end = _parse_day(value)
+    except ValueError:
+        raise ValueError(f"Filtro temporale non valido: {value}")
+
+    if end < start:
+        raise ValueError(f"Intervallo non valido: {value} (fine prima dell'inizio)")
+
+    since = datetime.combine(start, datetime.min.time())
+    until = datetime.combine(end + timedelta(days=1), datetime.min.time())
+    return since, until
+
+
+async def list_failed_notifications(
+    page: int = 1,
+    page_size: int = FAILED_PAGE_SIZE,
+    event_type: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None
+) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Pagina di notifiche failed, dalla più recente.
+
+    Returns:
+        (righe della pagina, totale righe che soddisfano i filtri)
+    """
+    pool = await get_db_pool()
+    offset = (max(page, 1) - 1) * page_size
+
+    async with pool.acquire() as conn:
+        total = await conn.fetchval(
+            f"SELECT COUNT(*) FROM admin_notifications WHERE {_FILTER_SQL}",
+            event_type, since, until
+        )
+        rows = await conn.fetch(f"""
+            SELECT id, event_type, telegram_id, correlation_id, retry_count,
+                   last_error, created_at, COALESCE(failed_at, created_at) AS failed_at
+            FROM admin_notifications
+            WHERE {_FILTER_SQL}
+            ORDER BY failed_at DESC NULLS LAST, created_at DESC
+            LIMIT $4 OFFSET $5
+        """, event_type, since, until, page_size, offset)
+
+    return [dict(row) for row in rows], total
+
+
+async def requeue_failed_notifications(
+    event_type: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None
+) -> int:
+    """
+    Rimette in coda le notifiche failed con un unico UPDATE.
+
+    retry_count e next_attempt_at vengono azzerati: il worker le riprende
+    al prossimo ciclo. last_error resta come riferimento del fallimento precedente.
+
+    Returns:
+        Numero di notifiche rimesse in coda
+    """
+    pool = await get_db_pool()
+
+    async with pool.acquire() as conn:
+        result = await conn.execute(f"""
+            UPDATE admin_notifications
+            SET status = 'pending',
+                retry_count = 0,
+                next_attempt_at = now(),
+                failed_at = NULL
+            WHERE {_FILTER_SQL}
+        """, event_type, since, until)
+
+    # asyncpg restituisce il command tag, es. "UPDATE 42"
+    requeued = int(result.split()[-1])
+    logger.info(
+        f"[DEAD_LETTER] {requeued} notifiche failed rimesse in coda "
+        f"(event_type={event_type or 'tutti'}, da={since or '-'}, a={until or '-'})"
+    )
+    return requeued
+
+
+def _escape_code(value: Any) -> str:
+    """Testo sicuro dentro `code` Markdown (rimuove backtick e a capo)"""
+    return str(value).replace("`", "'").replace("\n", " ")
+
+
+def format_failed_page(
+    rows: List[Dict[str, Any]],
+    total: int,
+    page: int,
+    page_size: int = FAILED_PAGE_SIZE,
+    filter_args: str = ""
+) -> str:
+    """Formatta pagina /failed (filter_args: filtri da ripetere nel link alla pagina successiva)"""
+    if total == 0:
+        return "✅ Nessuna notifica fallita."
+
+    pages = (total + page_size - 1) // page_size
+    message = f"🪦 **Notifiche fallite** ({total} totali, pagina {page}/{pages})\n\n"
+
+    if not rows:
+        message += "Pagina vuota.\n"
+
+    for row in rows:
+        failed_at = row["failed_at"].strftime("%Y-%m-%d %H:%M") if row["failed_at"] else "N/A"
+        message += (
+            f"• `{str(row['id'])[:8]}` `{_escape_code(row['event_type'])}` "
+            f"utente {row['telegram_id'] or 'N/A'} - {failed_at}, {row['retry_count']} tentativi\n"
+        )
+        if row.get("last_error"):
+            message += f"  `{_escape_code(row['last_error'][:150])}`\n"
+
+    if page < pages:
+        message += f"\nPagina successiva: `/failed {page + 1}{' ' + filter_args if filter_args else ''}`"
+    return message
@@ -0,0 +1,270 @@
+"""
+Digest periodico attività (giornaliero o orario) calcolato da contatori incrementali
+"""
+import os
+import asyncio
+import logging
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Set, Tuple
+from zoneinfo import ZoneInfo
+from db import get_db_pool
+from notifier import send_notification_with_retry
+from routing import router
+from utils.loop_monitor import current_operation
+
+logger = logging.getLogger(__name__)
+
+# Periodo del digest: daily, hourly oppure off
+DIGEST_SCHEDULE = os.getenv("ADMIN_DIGEST_SCHEDULE", "daily").lower()
+
+# Fuso orario per i confini dei periodi (mezzanotte locale per il digest giornaliero)
+DIGEST_TZ = os.getenv("ADMIN_DIGEST_TZ", "Europe/Rome")
+
+# Attesa dopo la fine del periodo prima dell'invio (notifiche ancora in coda)
+DIGEST_DELAY_SEC = int(os.getenv("ADMIN_DIGEST_DELAY_SEC", 300))
+
+# Periodi conservati in memoria
+MAX_PERIODS = 48
+
+# Utenti mostrati nella classifica errori
+TOP_ERROR_USERS = 5
+
+
+def _to_number(value: Any) -> int:
+    """Valore numerico del payload (0 se assente o non numerico)"""
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return 0
+
+
+def period_bounds(moment: datetime, schedule: str = DIGEST_SCHEDULE, tz_name: str = DIGEST_TZ) -> Tuple[datetime, datetime]:
+    """
+    Periodo (inizio, fine) che contiene moment, come UTC naive (confronti con created_at).
+
+    Args:
+        moment: istante UTC naive
+        schedule: daily (mezzanotte locale) o hourly
+    """
+    tz = ZoneInfo(tz_name)
+    local = moment.replace(tzinfo=timezone.utc).astimezone(tz)
+    if schedule == "hourly":
+        local_start = local.replace(minute=0, second=0, microsecond=0)
+        local_end = local_start + timedelta(hours=1)
+    else:
+        local_start = datetime.combine(local.date(), datetime.min.time(), tzinfo=tz)
+        local_end = datetime.combine(local.date() + timedelta(days=1), datetime.min.time(), tzinfo=tz)
+    return (
+        local_start.astimezone(timezone.utc).replace(tzinfo=None),
+        local_end.astimezone(timezone.utc).replace(tzinfo=None)
+    )
+
+
+@dataclass
+class DigestBucket:
+    """Contatori di un periodo (eventi attribuiti per created_at)"""
+    start: datetime
+    end: datetime
+    onboarding_completed: int = 0
+    onboarding_tables_created: int = 0
+    inventories: int = 0
+    rows_processed: int = 0
+    wines_saved: int = 0
+    errors: int = 0
+    errors_by_source: Counter = field(default_factory=Counter)
+    error_users: Counter = field(default_factory=Counter)
+    other: Counter = field(default_factory=Counter)
+    counted_ids: Set[Any] = field(default_factory=set)
+
+    def by_event_type(self) -> Dict[str, int]:
+        """Eventi contati per event_type (per la riconciliazione con il database)"""
+        counts = {
+            "onboarding_completed": self.onboarding_completed + self.onboarding_tables_created,
+            "inventory_uploaded": self.inventories,
+            "error": self.errors,
+        }
+        counts.update(self.other)
+        return {event_type: count for event_type, count in counts.items() if count}
+
+
+class DigestCounters:
+    """
+    Contatori per periodo aggiornati dal worker ad ogni notifica processata.
+
+    Ogni notifica è contata una sola volta (per id), anche se passa più volte
+    dal worker per retry o rate limit; il periodo è quello del suo created_at.
+    """
+
+    def __init__(self, schedule: str = DIGEST_SCHEDULE, tz_name: str = DIGEST_TZ, max_periods: int = MAX_PERIODS):
+        self.schedule = schedule
+        self.tz_name = tz_name
+        self.max_periods = max_periods
+        self._buckets: Dict[datetime, DigestBucket] = {}
+
+    def bucket(self, moment: datetime) -> DigestBucket:
+        """Bucket del periodo che contiene moment (creato se assente)"""
+        start, end = period_bounds(moment, self.schedule, self.tz_name)
+        bucket = self._buckets.get(start)
+        if bucket is None:
+            bucket = self._buckets[start] = DigestBucket(start=start, end=end)
+            # Rimuovi i periodi più vecchi
+            for old_start in sorted(self._buckets)[:-self.max_periods]:
+                del self._buckets[old_start]
+        return bucket
+
+    def get(self, start: datetime) -> Optional[DigestBucket]:
+        return self._buckets.get(start)
+
+    def record(self, notification_id, event_type: str, telegram_id: int, payload: Dict[str, Any], created_at: Optional[datetime]):
+        """Aggiorna i contatori con una notifica (ignorata se già contata)"""
+        bucket = self.bucket(created_at or datetime.utcnow())
+        if notification_id in bucket.counted_ids:
+            return
+        bucket.counted_ids.add(notification_id)
+
+        if event_type == "onboarding_completed":
+            if payload.get("stage") == "tables_created":
+                bucket.onboarding_tables_created += 1
+            else:
+                bucket.onboarding_completed += 1
+        elif event_type == "inventory_uploaded":
+            bucket.inventories += 1
+            bucket.rows_processed += _to_number(payload.get("rows_processed"))
+            bucket.wines_saved += _to_number(payload.get("wines_saved", payload.get("saved_count")))
+        elif event_type == "error":
+            bucket.errors += 1
+            source = payload.get("source") or "unknown"
+            bucket.errors_by_source[(source, payload.get("error_code") or "-")] += 1
+            bucket.error_users[telegram_id] += 1
+        else:
+            bucket.other[event_type] += 1
+
+
+async def fetch_period_counts(start: datetime, end: datetime) -> Dict[str, int]:
+    """
+    Eventi del periodo per event_type: unica range query su created_at
+    (indice idx_admin_created), i duplicati dello stesso evento contano una volta.
+    """
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch("""
+            SELECT event_type,
+                   COUNT(DISTINCT (telegram_id, COALESCE(correlation_id, id::text))) AS events
+            FROM admin_notifications
+            WHERE created_at >= $1 AND created_at < $2
+            GROUP BY event_type
+        """, start, end)
+    return {row["event_type"]: row["events"] for row in rows}
+
+
+def format_digest(bucket: DigestBucket, db_counts: Optional[Dict[str, int]], schedule: str = DIGEST_SCHEDULE, tz_name: str = DIGEST_TZ) -> str:
+    """Formatta il digest di un periodo (db_counts None se la riconciliazione non è disponibile)"""
+    tz = ZoneInfo(tz_name)
+    local_start = bucket.start.replace(tzinfo=timezone.utc).astimezone(tz)
+    if schedule == "hourly":
+        title = "🕐 **DIGEST ORARIO**"
+        period = f"{local_start:%d/%m/%Y %H:00}-{(local_start + timedelta(hours=1)):%H:00}"
+    else:
+        title = "📆 **DIGEST GIORNALIERO**"
+        period = f"{local_start:%d/%m/%Y}"
+
+    message = f"""{title}
+📅 Periodo: {period} ({tz_name})
+
+🎉 Onboarding completati: {bucket.onboarding_completed}
+🎯 Onboarding con tabelle create: {bucket.onboarding_tables_created}
+📦 Inventari caricati: {bucket.inventories}
+   Righe processate: {bucket.rows_processed} | Vini salvati: {bucket.wines_saved}
+🚨 Errori: {bucket.errors}"""
+
+    for (source, error_code), count in bucket.errors_by_source.most_common(10):
+        message += f"\n   • `{source}` / `{error_code}`: {count}"
+    if len(bucket.errors_by_source) > 10:
+        message += f"\n   ... e altre {len(bucket.errors_by_source) - 10} combinazioni"
+
+    if bucket.error_users:
+        top_users = ", ".join(
+            f"{telegram_id} ({count})" for telegram_id, count in bucket.error_users.most_common(TOP_ERROR_USERS)
+        )
+        message += f"\n👤 Utenti con più errori: {top_users}"
+
+    for event_type, count in sorted(bucket.other.items()):
+        message += f"\n📢 `{event_type}`: {count}"
+
+    # Riconciliazione: eventi nel database non (ancora) contati, es. riavvio o coda
+    if db_counts is not None:
+        counted = bucket.by_event_type()
+        missing = {
+            event_type: db_count - counted.get(event_type, 0)
+            for event_type, db_count in db_counts.items()
+            if db_count > counted.get(event_type, 0)
+        }
+        if missing:
+            detail = ", ".join(f"`{event_type}` {count}" for event_type, count in sorted(missing.items()))
+            message += f"\n\n⚠️ Eventi nel database non inclusi (in coda o persi al riavvio): {detail}"
+    else:
+        message += "\n\n⚠️ Riconciliazione con il database non disponibile"
+
+    return message
+
+
+async def build_digest(moment: Optional[datetime] = None, counters: Optional["DigestCounters"] = None) -> str:
+    """Digest del periodo che contiene moment (default: periodo in corso)"""
+    counters = counters or digest_counters
+    bucket = counters.bucket(moment or datetime.utcnow())
+    try:
+        db_counts = await fetch_period_counts(bucket.start, bucket.end)
+    except Exception as e:
+        logger.warning(f"[DIGEST] Riconciliazione non riuscita: {e}")
+        db_counts = None
+    return format_digest(bucket, db_counts, counters.schedule, counters.tz_name)
+
+
+async def digest_loop(counters: Optional["DigestCounters"] = None):
+    """Invia il digest di ogni periodo concluso (DIGEST_DELAY_SEC dopo la fine)"""
+    counters = counters or digest_counters
+    current_operation.set("digest")
+    logger.info(
+        "[DIGEST] Digest %s attivo (%s, invio %ds dopo fine periodo)",
+        "orario" if counters.schedule == "hourly" else "giornaliero",
+        counters.tz_name,
+        DIGEST_DELAY_SEC
+    )
+
+    _, next_end = period_bounds(datetime.utcnow(), counters.schedule, counters.tz_name)
+    while True:
+        send_at = next_end + timedelta(seconds=DIGEST_DELAY_SEC)
+        await asyncio.sleep(max(0.0, (send_at - datetime.utcnow()).total_seconds()))
+
+        period_moment = next_end - timedelta(seconds=1)
+        try:
+            message = await build_digest(period_moment, counters)
+            # Instradabile con una regola event_type "digest"
+            destination = router.resolve("digest")
+            result = await send_notification_with_retry(
+                message=message,
+                notification_id=f"digest-{next_end:%Y%m%d%H}",
+                max_retries=3,
+                chat_id=destination.chat_id,
+                message_thread_id=destination.thread_id
+            )
+            if result["status"] != "sent":
+                logger.error(f"[DIGEST] Invio digest non riuscito: {result.get('error')}")
+        except Exception as e:
+            logger.error(f"[DIGEST] Errore generazione digest: {e}", exc_info=True)
+
+        _, next_end = period_bounds(next_end, counters.schedule, counters.tz_name)
+
+
+def start_digest_task() -> Optional[asyncio.Task]:
+    """Avvia il digest programmato (None se ADMIN_DIGEST_SCHEDULE=off)"""
+    if DIGEST_SCHEDULE not in ("daily", "hourly"):
+        logger.info("[DIGEST] Digest programmato disattivato")
+        return None
+    return asyncio.create_task(digest_loop())
+
+
+# Contatori del processo (aggiornati da worker.process_notification)
+digest_counters = DigestCounters()
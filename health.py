@@ -0,0 +1,256 @@
+"""
+Liveness/readiness del bot e watchdog della coda notifiche
+(heartbeat del worker, SLO di latenza, meta-alert all'admin)
+"""
+import os
+import time
+import asyncio
+import logging
+import httpx
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+from db import get_db_pool
+from notification_queue import get_notification_queue
+from notifier import send_notification_with_retry, TELEGRAM_API_BASE_URL
+from routing import router
+from utils.metrics import registry
+from utils.loop_monitor import current_operation
+
+logger = logging.getLogger(__name__)
+
+# Worker considerato bloccato se non registra un heartbeat da questo tempo (default: 120 secondi)
+WORKER_HEARTBEAT_TIMEOUT_SEC = float(os.getenv("ADMIN_WORKER_HEARTBEAT_TIMEOUT_SEC", 120))
+
+# SLO di latenza: età massima della notifica pending più vecchia (escluse quelle trattenute) (default: 300 secondi)
+QUEUE_LATENCY_SLO_SEC = float(os.getenv("ADMIN_QUEUE_LATENCY_SLO_SEC", 300))
+
+# Intervallo tra i controlli del watchdog (default: 30 secondi)
+WATCHDOG_INTERVAL_SEC = float(os.getenv("ADMIN_WATCHDOG_INTERVAL_SEC", 30))
+
+# Un allarme ancora attivo viene ripetuto dopo questo tempo (default: 30 minuti)
+WATCHDOG_REPEAT_SEC = float(os.getenv("ADMIN_WATCHDOG_REPEAT_SEC", 1800))
+
+# Timeout dei singoli controlli (query database, getMe, invio meta-alert)
+CHECK_TIMEOUT_SEC = 5.0
+
+# Esito getMe riusato per questo tempo: /readyz non genera una chiamata Telegram per ogni probe
+TELEGRAM_CHECK_CACHE_SEC = 15.0
+
+WATCHDOG_ALERT_ACTIVE = registry.gauge(
+    "admin_bot_watchdog_alert_active",
+    "Allarme watchdog attivo (1) per condizione",
+    ["condition"]
+)
+WATCHDOG_ALERTS_SENT = registry.counter(
+    "admin_bot_watchdog_alerts_total",
+    "Meta-alert inviati dal watchdog per condizione e stato (firing, resolved)",
+    ["condition", "state"]
+)
+
+
+class Heartbeat:
+    """Ultimo segnale di vita di un loop (monotonic), None se non avviato"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._last_beat: Optional[float] = None
+        self.running = False
+
+    def beat(self):
+        self._last_beat = time.monotonic()
+        self.running = True
+
+    def stop(self):
+        """Loop terminato volontariamente (shutdown): non è un blocco"""
+        self.running = False
+
+    def age(self) -> Optional[float]:
+        """Secondi dall'ultimo heartbeat (None se mai avviato)"""
+        if self._last_beat is None:
+            return None
+        return time.monotonic() - self._last_beat
+
+    def is_stalled(self, timeout: float = WORKER_HEARTBEAT_TIMEOUT_SEC) -> bool:
+        age = self.age()
+        return self.running and age is not None and age > timeout
+
+
+# Heartbeat del worker notifiche (aggiornato ad ogni ciclo e ad ogni notifica)
+worker_heartbeat = Heartbeat("worker")
+
+
+def liveness() -> Tuple[bool, Dict[str, Any]]:
+    """Liveness: il worker notifiche registra heartbeat recenti"""
+    age = worker_heartbeat.age()
+    alive = not worker_heartbeat.is_stalled()
+    return alive, {
+        "status": "ok" if alive else "stalled",
+        "worker_running": worker_heartbeat.running,
+        "worker_heartbeat_age_sec": round(age, 1) if age is not None else None,
+        "heartbeat_timeout_sec": WORKER_HEARTBEAT_TIMEOUT_SEC,
+    }
+
+
+async def _check_database() -> Optional[str]:
+    """None se il pool risponde, altrimenti il motivo"""
+    try:
+        pool = await asyncio.wait_for(get_db_pool(), CHECK_TIMEOUT_SEC)
+        async with pool.acquire(timeout=CHECK_TIMEOUT_SEC) as conn:
+            await conn.fetchval("SELECT 1", timeout=CHECK_TIMEOUT_SEC)
+        return None
+    except Exception as e:
+        return f"{type(e).__name__}: {e}"
+
+
+_telegram_check: Tuple[float, Optional[str]] = (0.0, "non verificato")
+
+
+async def _check_telegram() -> Optional[str]:
+    """None se getMe risponde (esito in cache per TELEGRAM_CHECK_CACHE_SEC)"""
+    global _telegram_check
+    checked_at, error = _telegram_check
+    if checked_at and time.monotonic() - checked_at < TELEGRAM_CHECK_CACHE_SEC:
+        return error
+
+    token = os.getenv("ADMIN_BOT_TOKEN")
+    try:
+        async with httpx.AsyncClient(timeout=CHECK_TIMEOUT_SEC) as client:
+            response = await client.get(f"{TELEGRAM_API_BASE_URL}/bot{token}/getMe")
+        error = None if response.status_code == 200 else f"HTTP {response.status_code}"
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    _telegram_check = (time.monotonic(), error)
+    return error
+
+
+async def readiness() -> Tuple[bool, Dict[str, Any]]:
+    """Readiness: pool database e Telegram raggiungibili (controlli in parallelo)"""
+    database_error, telegram_error = await asyncio.gather(_check_database(), _check_telegram())
+    ready = database_error is None and telegram_error is None
+    return ready, {
+        "status": "ok" if ready else "unavailable",
+        "database": database_error or "ok",
+        "telegram": telegram_error or "ok",
+    }
+
+
+@dataclass
+class _AlertState:
+    since: float
+    last_sent: float = 0.0
+
+
+class Watchdog:
+    """
+    Controlla periodicamente heartbeat del worker e latenza della coda,
+    fuori dal percorso del worker: i meta-alert partono direttamente via
+    notifier (niente coda né rate limiter), quindi arrivano anche se il
+    worker è bloccato o la coda non viene svuotata.
+    """
+
+    def __init__(
+        self,
+        heartbeat: Heartbeat = worker_heartbeat,
+        slo_seconds: float = QUEUE_LATENCY_SLO_SEC,
+        repeat_seconds: float = WATCHDOG_REPEAT_SEC
+    ):
+        self.heartbeat = heartbeat
+        self.slo_seconds = slo_seconds
+        self.repeat_seconds = repeat_seconds
+        self._active: Dict[str, _AlertState] = {}
+
+    async def evaluate(self) -> Dict[str, str]:
+        """Condizioni attive ora: {condizione: descrizione}"""
+        problems: Dict[str, str] = {}
+
+        if self.heartbeat.is_stalled():
+            problems["worker_stalled"] = (
+                f"Nessun heartbeat dal worker da {self.heartbeat.age():.0f}s "
+                f"(soglia {WORKER_HEARTBEAT_TIMEOUT_SEC:.0f}s)"
+            )
+
+        try:
+            stats = await asyncio.wait_for(get_notification_queue().stats(), CHECK_TIMEOUT_SEC)
+        except Exception as e:
+            problems["queue_unreachable"] = f"Coda notifiche non leggibile: {type(e).__name__}: {e}"
+        else:
+            oldest = stats.get("oldest_ready_at")
+            oldest_age = (datetime.utcnow() - oldest).total_seconds() if oldest else 0
+            if oldest_age > self.slo_seconds:
+                problems["queue_latency"] = (
+                    f"Notifica pending più vecchia in attesa da {oldest_age / 60:.1f} min "
+                    f"(SLO {self.slo_seconds / 60:.0f} min, {stats['pending']} pending)"
+                )
+
+        return problems
+
+    async def check(self):
+        """Un controllo: invia meta-alert per condizioni nuove/ripetute e per quelle risolte"""
+        problems = await self.evaluate()
+        now = time.monotonic()
+
+        for condition, description in problems.items():
+            state = self._active.setdefault(condition, _AlertState(since=now))
+            WATCHDOG_ALERT_ACTIVE.set(1, condition=condition)
+            if not state.last_sent or now - state.last_sent >= self.repeat_seconds:
+                logger.error(f"[WATCHDOG] {condition}: {description}")
+                if await self._send(condition, "firing", f"🚨 **Watchdog admin bot**\n\n{description}"):
+                    state.last_sent = now
+
+        for condition in [c for c in self._active if c not in problems]:
+            state = self._active.pop(condition)
+            WATCHDOG_ALERT_ACTIVE.set(0, condition=condition)
+            logger.info(f"[WATCHDOG] {condition} risolto")
+            if state.last_sent:
+                await self._send(
+                    condition, "resolved",
+                    f"✅ **Watchdog admin bot**\n\n`{condition}` risolto dopo {(now - state.since) / 60:.1f} min"
+                )
+
+    async def _send(self, condition: str, state: str, message: str) -> bool:
+        # Instradabile con una regola event_type "watchdog"
+        destination = router.resolve("watchdog", {"severity": "critical" if state == "firing" else "info"})
+        try:
+            result = await asyncio.wait_for(
+                send_notification_with_retry(
+                    message=message,
+                    notification_id=f"watchdog-{condition}",
+                    max_retries=1,
+                    chat_id=destination.chat_id,
+                    message_thread_id=destination.thread_id
+                ),
+                CHECK_TIMEOUT_SEC * 2
+            )
+        except Exception as e:
+            logger.error(f"[WATCHDOG] Meta-alert {condition} non inviato: {e}")
+            return False
+        if result["status"] != "sent":
+            logger.error(f"[WATCHDOG] Meta-alert {condition} non inviato: {result.get('error')}")
+            return False
+        WATCHDOG_ALERTS_SENT.inc(condition=condition, state=state)
+        return True
+
+
+async def watchdog_loop(watchdog: Optional[Watchdog] = None, interval: float = WATCHDOG_INTERVAL_SEC):
+    """Task indipendente dal worker: controlla ogni interval secondi"""
+    watchdog = watchdog or Watchdog()
+    current_operation.set("watchdog")
+    logger.info(
+        f"[WATCHDOG] Attivo: heartbeat worker {WORKER_HEARTBEAT_TIMEOUT_SEC:.0f}s, "
+        f"SLO coda {watchdog.slo_seconds:.0f}s, controllo ogni {interval:.0f}s"
+    )
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await watchdog.check()
+        except Exception as e:
+            logger.error(f"[WATCHDOG] Errore controllo: {e}", exc_info=True)
+
+
+def start_watchdog_task() -> Optional[asyncio.Task]:
+    """Avvia il watchdog (None se ADMIN_WATCHDOG_INTERVAL_SEC <= 0)"""
+    if WATCHDOG_INTERVAL_SEC <= 0:
+        logger.info("[WATCHDOG] Watchdog disattivato")
+        return None
+    return asyncio.create_task(watchdog_loop())
@@ -0,0 +1,167 @@
+"""
+Server HTTP integrato (aiohttp) per webhook Telegram, health check e probe liveness/readiness
+"""
+import os
+import hmac
+import hashlib
+import logging
+from typing import Optional
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application
+from health import liveness, readiness
+from utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Path su cui Telegram invia gli update in modalità webhook
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram/webhook")
+
+# Header con cui Telegram invia il secret_token configurato in setWebhook
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+# Chiavi app aiohttp
+TELEGRAM_APP_KEY = web.AppKey("telegram_app", Application)
+WEBHOOK_SECRET_KEY = web.AppKey("webhook_secret", str)
+
+
+def is_webhook_mode() -> bool:
+    """True se il bot deve ricevere update via webhook invece che via polling"""
+    return os.getenv("USE_WEBHOOK", "false").lower() == "true"
+
+
+def get_http_port() -> int:
+    """Porta del server HTTP (Railway setta PORT)"""
+    return int(os.getenv("PORT", 8080))
+
+
+def get_webhook_url() -> Optional[str]:
+    """
+    URL pubblico del webhook.
+    Usa WEBHOOK_URL se configurato, altrimenti il dominio pubblico Railway.
+    """
+    webhook_url = os.getenv("WEBHOOK_URL")
+    if webhook_url:
+        webhook_url = webhook_url.rstrip("/")
+        if not webhook_url.startswith(("http://", "https://")):
+            webhook_url = f"https://{webhook_url}"
+        # Permetti sia URL base sia URL completo
+        if not webhook_url.endswith(WEBHOOK_PATH):
+            webhook_url = f"{webhook_url}{WEBHOOK_PATH}"
+        return webhook_url
+
+    railway_domain = os.getenv("RAILWAY_PUBLIC_DOMAIN")
+    if railway_domain:
+        return f"https://{railway_domain}{WEBHOOK_PATH}"
+
+    return None
+
+
+def get_webhook_secret(bot_token: str) -> str:
+    """
+    Secret token per validare le chiamate webhook.
+    Usa WEBHOOK_SECRET se configurato, altrimenti lo deriva dal token del bot:
+    deve essere identico su tutte le istanze, così durante un deploy vecchia e
+    nuova istanza accettano entrambe gli update.
+    """
+    secret = os.getenv("WEBHOOK_SECRET")
+    if secret:
+        return secret
+    # Telegram accetta solo A-Z, a-z, 0-9, _ e - (max 256 caratteri)
+    return hashlib.sha256(f"webhook:{bot_token}".encode("utf-8")).hexdigest()
+
+
+async def _handle_webhook(request: web.Request) -> web.Response:
+    """Riceve un update da Telegram e lo accoda all'Application"""
+    expected_secret = request.app[WEBHOOK_SECRET_KEY]
+    received_secret = request.headers.get(SECRET_TOKEN_HEADER, "")
+    if not hmac.compare_digest(received_secret, expected_secret):
+        logger.warning(f"[WEBHOOK] Richiesta con secret non valido da {request.remote}")
+        return web.Response(status=403)
+
+    try:
+        data = await request.json()
+    except Exception:
+        return web.Response(status=400)
+
+    telegram_app = request.app[TELEGRAM_APP_KEY]
+    update = Update.de_json(data, telegram_app.bot)
+    if update is None:
+        return web.Response(status=400)
+
+    # Risposta immediata: l'elaborazione avviene nell'Application, non nella richiesta HTTP
+    await telegram_app.update_queue.put(update)
+    return web.Response(status=200)
+
+
+async def _handle_health(request: web.Request) -> web.Response:
+    """Health check base: il processo è attivo e il server risponde"""
+    return web.json_response({
+        "status": "ok",
+        "mode": "webhook" if WEBHOOK_SECRET_KEY in request.app else "polling",
+    })
+
+
+async def _handle_livez(request: web.Request) -> web.Response:
+    """Liveness: 503 se il worker notifiche non registra heartbeat (processo da riavviare)"""
+    alive, body = liveness()
+    return web.json_response(body, status=200 if alive else 503)
+
+
+async def _handle_readyz(request: web.Request) -> web.Response:
+    """Readiness: 503 se database o Telegram non sono raggiungibili"""
+    ready, body = await readiness()
+    return web.json_response(body, status=200 if ready else 503)
+
+
+async def _handle_metrics(request: web.Request) -> web.Response:
+    """Metriche in formato Prometheus (text exposition)"""
+    body = await registry.render()
+    return web.Response(text=body, content_type="text/plain", charset="utf-8")
+
+
+def create_http_app(
+    telegram_app: Optional[Application] = None,
+    webhook_secret: Optional[str] = None
+) -> web.Application:
+    """
+    Crea app aiohttp.
+
+    Args:
+        telegram_app: Application Telegram (richiesta per il webhook)
+        webhook_secret: Secret token webhook; se None la route webhook non viene registrata
+
+    Returns:
+        App aiohttp con /health, /livez, /readyz, /metrics ed eventualmente la route webhook
+    """
+    app = web.Application()
+    app.router.add_get("/health", _handle_health)
+    app.router.add_get("/livez", _handle_livez)
+    app.router.add_get("/readyz", _handle_readyz)
+    app.router.add_get("/metrics", _handle_metrics)
+
+    if webhook_secret:
+        if telegram_app is None:
+            raise ValueError("telegram_app richiesta per la modalità webhook")
+        app[TELEGRAM_APP_KEY] = telegram_app
+        app[WEBHOOK_SECRET_KEY] = webhook_secret
+        app.router.add_post(WEBHOOK_PATH, _handle_webhook)
+
+    return app
+
+
+async def start_http_server(app: web.Application, port: int) -> web.AppRunner:
+    """Avvia server HTTP su 0.0.0.0:port"""
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host="0.0.0.0", port=port)
+    await site.start()
+    logger.info(f"✅ Server HTTP in ascolto sulla porta {port}")
+    return runner
+
+
+async def stop_http_server(runner: Optional[web.AppRunner]):
+    """Ferma server HTTP"""
+    if runner:
+        await runner.cleanup()
+        logger.info("Server HTTP fermato")
@@ -0,0 +1,161 @@
+"""
+Card di ciclo di vita: un messaggio admin per utente aggiornato con editMessageText
+(onboarding tabelle create -> completato -> inventario caricato)
+"""
+import os
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Set
+from db import get_db_pool
+from routing import Destination
+
+logger = logging.getLogger(__name__)
+
+# Eventi che aggiornano la card dell'utente invece di inviare un nuovo messaggio
+LIFECYCLE_EVENTS = {"onboarding_completed", "inventory_uploaded"}
+
+# Dopo questo tempo dall'ultimo aggiornamento un nuovo evento apre una nuova card (default: 24 ore)
+LIFECYCLE_CARD_TTL_SEC = int(os.getenv("ADMIN_LIFECYCLE_CARD_TTL_SEC", 86400))
+
+# Card mantenute in memoria (le meno recenti vengono scartate)
+MAX_CARDS = 5000
+
+# Separatore tra le sezioni di una card
+SECTION_SEPARATOR = "\n\n➖➖➖➖➖\n\n"
+
+# Limite Telegram 4096 caratteri: oltre, la card non viene più estesa
+MAX_CARD_LENGTH = 4000
+
+
+@dataclass
+class LifecycleCard:
+    """Messaggio admin di un utente e testo attuale"""
+    telegram_id: int
+    chat_id: str
+    thread_id: Optional[int]
+    message_id: int
+    text: str
+    correlation_id: Optional[str] = None
+    updated_at: datetime = field(default_factory=datetime.utcnow)
+    # correlation_id di tutti gli eventi confluiti nella card (solo in memoria)
+    correlation_ids: Set[str] = field(default_factory=set)
+
+    def extended(self, section: str) -> Optional[str]:
+        """Testo della card con una nuova sezione (None se supera il limite Telegram)"""
+        text = self.text + SECTION_SEPARATOR + section
+        return text if len(text) <= MAX_CARD_LENGTH else None
+
+
+class LifecycleCardStore:
+    """
+    Mappa in memoria telegram_id/correlation_id -> card (lookup O(1)),
+    persistita su admin_lifecycle_messages e ricaricata all'avvio
+    (persist=False: solo memoria, per benchmark).
+    """
+
+    def __init__(self, ttl_seconds: int = LIFECYCLE_CARD_TTL_SEC, max_size: int = MAX_CARDS, persist: bool = True):
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self.persist = persist
+        self._by_user: "OrderedDict[int, LifecycleCard]" = OrderedDict()
+        self._by_correlation: Dict[str, LifecycleCard] = {}
+
+    def lookup(self, correlation_id: Optional[str], telegram_id: int, destination: Destination) -> Optional[LifecycleCard]:
+        """
+        Card da aggiornare per un evento: stessa correlation_id o stesso utente,
+        ancora valida (TTL) e nella stessa chat/topic di destinazione.
+        """
+        card = self._by_correlation.get(correlation_id) if correlation_id else None
+        if card is None:
+            card = self._by_user.get(telegram_id)
+        if card is None:
+            return None
+        if (datetime.utcnow() - card.updated_at).total_seconds() > self.ttl_seconds:
+            self._remove(card)
+            return None
+        if card.chat_id != destination.chat_id or card.thread_id != destination.thread_id:
+            return None
+        return card
+
+    def _index(self, card: LifecycleCard):
+        previous = self._by_user.pop(card.telegram_id, None)
+        if previous is not None and previous is not card:
+            self._unindex_correlations(previous)
+        self._by_user[card.telegram_id] = card
+        if card.correlation_id:
+            card.correlation_ids.add(card.correlation_id)
+        for correlation_id in card.correlation_ids:
+            self._by_correlation[correlation_id] = card
+
+        while len(self._by_user) > self.max_size:
+            _, oldest = self._by_user.popitem(last=False)
+            self._unindex_correlations(oldest)
+
+    def _unindex_correlations(self, card: LifecycleCard):
+        for correlation_id in card.correlation_ids:
+            if self._by_correlation.get(correlation_id) is card:
+                del self._by_correlation[correlation_id]
+
+    def _remove(self, card: LifecycleCard):
+        if self._by_user.get(card.telegram_id) is card:
+            del self._by_user[card.telegram_id]
+        self._unindex_correlations(card)
+
+    async def save(self, card: LifecycleCard, correlation_id: Optional[str] = None):
+        """Registra una card nuova o aggiornata (memoria subito, poi database)"""
+        card.updated_at = datetime.utcnow()
+        if correlation_id:
+            # Anche le correlation_id degli eventi successivi puntano alla stessa card
+            card.correlation_id = correlation_id
+        self._index(card)
+        if not self.persist:
+            return
+
+        try:
+            pool = await get_db_pool()
+            async with pool.acquire() as conn:
+                await conn.execute("""
+                    INSERT INTO admin_lifecycle_messages
+                        (telegram_id, correlation_id, chat_id, thread_id, message_id, text, updated_at)
+                    VALUES ($1, $2, $3, $4, $5, $6, $7)
+                    ON CONFLICT (telegram_id) DO UPDATE SET
+                        correlation_id = EXCLUDED.correlation_id,
+                        chat_id = EXCLUDED.chat_id,
+                        thread_id = EXCLUDED.thread_id,
+                        message_id = EXCLUDED.message_id,
+                        text = EXCLUDED.text,
+                        updated_at = EXCLUDED.updated_at
+                """, card.telegram_id, card.correlation_id, card.chat_id, card.thread_id,
+                    card.message_id, card.text, card.updated_at)
+        except Exception as e:
+            logger.warning(f"[LIFECYCLE] Card utente {card.telegram_id} non salvata su database: {e}")
+
+    def forget(self, card: LifecycleCard):
+        """Scarta una card non più modificabile (il prossimo evento ne apre una nuova)"""
+        self._remove(card)
+
+    async def load(self) -> int:
+        """Ricarica dal database le card ancora valide (all'avvio)"""
+        pool = await get_db_pool()
+        async with pool.acquire() as conn:
+            rows = await conn.fetch("""
+                SELECT telegram_id, correlation_id, chat_id, thread_id, message_id, text, updated_at
+                FROM admin_lifecycle_messages
+                WHERE updated_at >= $1
+                ORDER BY updated_at DESC
+                LIMIT $2
+            """, datetime.utcnow() - timedelta(seconds=self.ttl_seconds), self.max_size)
+
+        # Dalla meno recente, così l'ordine LRU in memoria è quello degli aggiornamenti
+        for row in reversed(rows):
+            self._index(LifecycleCard(**dict(row)))
+        return len(rows)
+
+    def __len__(self) -> int:
+        return len(self._by_user)
+
+
+# Card del processo
+lifecycle_cards = LifecycleCardStore()
@@ -1,8 +1,14 @@
 """
 Configurazione logging colorato per Gioia Admin Bot
 """
-import logging
+import os
 import sys
+import queue
+import atexit
+import logging
+import logging.handlers
+from typing import Optional
+from utils.logging import StructuredMessage
 
 try:
     import colorlog
@@ -10,6 +16,23 @@ try:
 except ImportError:
     COLORLOG_AVAILABLE = False
 
+# Listener che scrive i log su stdout da un thread dedicato
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class _LoopFriendlyQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler che non serializza i messaggi strutturati nel thread chiamante.
+    
+    Il payload di StructuredMessage è creato per il singolo record e non viene
+    più modificato: può essere serializzato in sicurezza dal thread del listener.
+    """
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if isinstance(record.msg, StructuredMessage) and not record.exc_info and not record.stack_info:
+            return record
+        return super().prepare(record)
+
 
 def setup_colored_logging(service_name: str = "admin-bot"):
     """
@@ -52,10 +75,21 @@ def setup_colored_logging(service_name: str = "admin-bot"):
     root_logger.setLevel(logging.INFO)
     
     # Rimuovi handler esistenti
+    stop_logging()
     root_logger.handlers = []
     
-    # Aggiungi handler colorato
-    root_logger.addHandler(handler)
+    if os.getenv("ADMIN_LOG_ASYNC", "true").lower() == "true":
+        # Event loop -> coda in memoria -> thread listener -> stdout:
+        # formattazione e scrittura non bloccano più gli handler async
+        global _listener
+        log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+        root_logger.addHandler(_LoopFriendlyQueueHandler(log_queue))
+        _listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(stop_logging)
+    else:
+        # Aggiungi handler colorato
+        root_logger.addHandler(handler)
     
     # Configura logger specifici per ridurre verbosità
     logging.getLogger('httpx').setLevel(logging.WARNING)
@@ -64,3 +98,18 @@ def setup_colored_logging(service_name: str = "admin-bot"):
     logging.getLogger('telegram').setLevel(logging.WARNING)
     
     return root_logger
+
+
+def flush_logging():
+    """Scrive i log accodati e riavvia il listener (es. allo shutdown, prima di un possibile SIGKILL)"""
+    if _listener is not None:
+        _listener.stop()
+        _listener.start()
+
+
+def stop_logging():
+    """Ferma il listener svuotando la coda (i log già accodati vengono scritti)"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -2,15 +2,38 @@
 Gioia Admin Bot - Bot Telegram privato per notifiche admin
 """
 import os
+import time
 import asyncio
 import logging
 import signal
+from typing import Dict, Optional
 from dotenv import load_dotenv
-from db import get_db_pool, close_db_pool, ensure_admin_notifications_table
-from worker import start_worker
+from telegram.error import Conflict
+from db import get_db_pool, close_db_pool, ensure_admin_notifications_table, collect_db_pool_metrics
+from worker import start_worker, collect_queue_metrics
+from notification_queue import get_notification_queue
 from telegram_handler import setup_telegram_app
+from processor_client import get_processor_client, close_processor_client
+from upload_queue import start_upload_workers
+from user_outbox import start_user_outbox_worker
+from http_server import (
+    is_webhook_mode,
+    get_webhook_url,
+    get_webhook_secret,
+    get_http_port,
+    create_http_app,
+    start_http_server,
+    stop_http_server
+)
+from report_jobs import cancel_report_jobs
+from digest import start_digest_task
+from health import start_watchdog_task
+from lifecycle_cards import lifecycle_cards
 from utils.logging import log_with_context
-from logging_config import setup_colored_logging
+from utils.metrics import registry
+from utils.loop_monitor import loop_monitor, LOOP_MONITOR_ENABLED
+from utils import event_loop
+from logging_config import setup_colored_logging, flush_logging
 
 # Carica variabili d'ambiente da .env (se presente)
 load_dotenv()
@@ -19,22 +42,64 @@ load_dotenv()
 setup_colored_logging("admin-bot")
 logger = logging.getLogger(__name__)
 
-# Flag per graceful shutdown
-_shutdown = False
+# Tempo massimo per terminare le notifiche in corso allo shutdown (Railway invia
+# SIGKILL qualche secondo dopo SIGTERM): oltre, vengono restituite alla coda
+SHUTDOWN_TIMEOUT_SEC = float(os.getenv("ADMIN_SHUTDOWN_TIMEOUT_SEC", 20))
 
+# Avvio polling: attesa massima che l'istanza precedente rilasci getUpdates
+# (deploy con overlap), con backoff breve invece di attese fisse
+POLLING_READY_TIMEOUT_SEC = float(os.getenv("ADMIN_POLLING_READY_TIMEOUT_SEC", 30))
+POLLING_RETRY_INITIAL_SEC = 0.25
+POLLING_RETRY_MAX_SEC = 3.0
 
-def signal_handler(signum, frame):
+# Evento di graceful shutdown (impostato da SIGTERM/SIGINT)
+_shutdown_event: Optional[asyncio.Event] = None
+
+
+def signal_handler(signum):
     """Gestione segnali per shutdown graceful"""
-    global _shutdown
     logger.info(f"Ricevuto segnale {signum}, shutdown graceful...")
-    _shutdown = True
+    if _shutdown_event is not None:
+        _shutdown_event.set()
+
+
+def install_signal_handlers(loop: asyncio.AbstractEventLoop):
+    """Segnali gestiti nell'event loop (fallback signal.signal dove non supportato)"""
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, signal_handler, sig)
+        except NotImplementedError:
+            signal.signal(sig, lambda signum, frame: loop.call_soon_threadsafe(signal_handler, signum))
 
 
-async def startup():
-    """Inizializzazione all'avvio"""
+async def drain_worker(worker_task: asyncio.Task):
+    """
+    Attende la fine del worker dopo la richiesta di stop: la notifica in corso
+    viene completata entro SHUTDOWN_TIMEOUT_SEC, altrimenti il worker viene
+    cancellato e restituisce alla coda quelle prese e non confermate.
+    """
+    try:
+        await asyncio.wait_for(asyncio.shield(worker_task), SHUTDOWN_TIMEOUT_SEC)
+        logger.info("✅ Worker notifiche terminato")
+    except asyncio.TimeoutError:
+        logger.warning(f"⚠️ Worker non terminato entro {SHUTDOWN_TIMEOUT_SEC}s, notifiche in corso restituite alla coda")
+        worker_task.cancel()
+        await asyncio.gather(worker_task, return_exceptions=True)
+
+
+async def _timed(phases: Dict[str, float], name: str, coro):
+    """Esegue una fase di startup registrandone la durata in phases"""
+    start = time.perf_counter()
+    try:
+        return await coro
+    finally:
+        phases[name] = round(time.perf_counter() - start, 3)
+
+
+def validate_config() -> bool:
+    """Verifica variabili ambiente (False se il bot è disabilitato)"""
     logger.info("🚀 Gioia Admin Bot - Avvio...")
     
-    # Verifica variabili ambiente
     admin_bot_token = os.getenv("ADMIN_BOT_TOKEN")
     admin_chat_id = os.getenv("ADMIN_CHAT_ID")
     admin_notify_enabled = os.getenv("ADMIN_NOTIFY_ENABLED", "true").lower() == "true"
@@ -55,8 +120,11 @@ async def startup():
     logger.info(f"   ADMIN_BOT_TOKEN: {'*' * 20}...{admin_bot_token[-4:]}")
     logger.info(f"   ADMIN_CHAT_ID: {admin_chat_id}")
     logger.info(f"   ADMIN_NOTIFY_ENABLED: {admin_notify_enabled}")
-    
-    # Inizializza database
+    return True
+
+
+async def init_database():
+    """Pool database, migrazioni, backend coda e card di ciclo di vita"""
     try:
         await get_db_pool()
         logger.info("✅ Pool database inizializzato")
@@ -72,14 +140,55 @@ async def startup():
         logger.error(f"❌ Errore creazione tabella: {e}")
         raise
     
+    # Backend coda notifiche (ValueError se ADMIN_QUEUE_BACKEND non è valido)
+    queue = get_notification_queue()
+    if queue.name == "memory":
+        logger.warning("⚠️ Coda notifiche in memoria: le notifiche non sopravvivono al riavvio")
+    
+    # Card di ciclo di vita ancora modificabili (lookup in memoria)
+    try:
+        loaded = await lifecycle_cards.load()
+        logger.info(f"✅ Card ciclo di vita caricate: {loaded}")
+    except Exception as e:
+        logger.warning(f"⚠️ Card ciclo di vita non caricate (i prossimi eventi apriranno nuove card): {e}")
+    
+    # Metriche calcolate ad ogni scrape di /metrics
+    registry.add_collector(collect_queue_metrics)
+    registry.add_collector(collect_db_pool_metrics)
+
+
+async def init_telegram(telegram_app, phases: Dict[str, float]):
+    """initialize() del bot (getMe) e, in polling, verifica che getUpdates sia utilizzabile"""
+    await _timed(phases, "telegram_initialize", telegram_app.initialize())
+    if not is_webhook_mode():
+        await _timed(phases, "polling_ready", wait_polling_ready(telegram_app.bot))
+
+
+async def startup(telegram_app, phases: Dict[str, float]):
+    """
+    Inizializzazione all'avvio.
+    
+    Database (pool, migrazioni, card) e Telegram (getMe, verifica polling) sono
+    indipendenti e procedono in parallelo: il tempo di avvio è quello della
+    fase più lenta, non la somma. Le durate finiscono in phases.
+    """
+    await asyncio.gather(
+        _timed(phases, "database", init_database()),
+        init_telegram(telegram_app, phases)
+    )
+    
     logger.info("✅ Startup completato")
-    return True
 
 
 async def shutdown():
     """Cleanup allo shutdown"""
     logger.info("🛑 Shutdown graceful...")
     
+    try:
+        await close_processor_client()
+    except Exception as e:
+        logger.error(f"Errore chiusura client processor: {e}")
+    
     try:
         await close_db_pool()
         logger.info("✅ Database chiuso")
@@ -87,100 +196,206 @@ async def shutdown():
         logger.error(f"Errore chiusura database: {e}")
     
     logger.info("✅ Shutdown completato")
+    
+    # Scrive i log ancora in coda prima dell'uscita
+    flush_logging()
+
+
+async def wait_polling_ready(bot):
+    """
+    Attende che getUpdates sia utilizzabile (readiness check al posto di attese fisse).
+    
+    Una getUpdates con timeout=0 risponde subito: se un webhook è ancora
+    registrato viene rimosso e si riprova; se un'altra istanza sta ancora
+    facendo polling (deploy in corso) si riprova con backoff breve fino a
+    ADMIN_POLLING_READY_TIMEOUT_SEC, poi si avvia comunque il polling
+    (l'updater continua a riprovare da solo).
+    """
+    deadline = time.monotonic() + POLLING_READY_TIMEOUT_SEC
+    delay = POLLING_RETRY_INITIAL_SEC
+    attempt = 0
+    webhook_deleted = False
+    while True:
+        attempt += 1
+        try:
+            # offset=-1: nessun update confermato oltre all'ultimo (scartati comunque da drop_pending_updates)
+            await bot.get_updates(offset=-1, limit=1, timeout=0)
+            if attempt > 1:
+                logger.info(f"✅ getUpdates disponibile dopo {attempt} tentativi")
+            return
+        except Conflict as e:
+            if "webhook" in str(e).lower() and not webhook_deleted:
+                await bot.delete_webhook(drop_pending_updates=True)
+                webhook_deleted = True
+                logger.info("✅ Webhook residuo rimosso")
+                continue
+            if time.monotonic() + delay > deadline:
+                logger.warning(f"⚠️ Conflitto polling ancora presente dopo {POLLING_READY_TIMEOUT_SEC}s, avvio comunque: {e}")
+                return
+            logger.info(f"⏳ [POLLING] Altra istanza in polling, nuovo tentativo tra {delay:.1f}s")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, POLLING_RETRY_MAX_SEC)
+
+
+async def start_polling(telegram_app):
+    """
+    Avvia ricezione update via long polling.
+    
+    La readiness di getUpdates è già verificata in startup (wait_polling_ready):
+    un Conflict qui è una corsa con l'istanza precedente e viene riprovato con
+    backoff breve fino alla deadline.
+    """
+    deadline = time.monotonic() + POLLING_READY_TIMEOUT_SEC
+    delay = POLLING_RETRY_INITIAL_SEC
+    while True:
+        try:
+            # Usa allowed_updates per limitare solo ai messaggi (non callback_query per ora)
+            await telegram_app.updater.start_polling(
+                drop_pending_updates=True,
+                allowed_updates=["message"]  # Solo messaggi, inclusi documenti
+            )
+            logger.info("✅ Telegram bot polling avviato")
+            return
+        except Conflict as polling_error:
+            if time.monotonic() + delay > deadline:
+                logger.error(f"❌ Errore avvio polling: {polling_error}")
+                raise
+            logger.warning(f"⚠️ Conflitto avvio polling, nuovo tentativo tra {delay:.1f}s")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, POLLING_RETRY_MAX_SEC)
+
+
+async def start_webhook(telegram_app, bot_token: str):
+    """
+    Avvia ricezione update via webhook sul server HTTP integrato.
+    
+    Nessuna attesa anti-conflitto: setWebhook è idempotente, durante un deploy
+    la nuova istanza registra lo stesso URL e le due istanze possono convivere.
+    """
+    webhook_url = get_webhook_url()
+    if not webhook_url:
+        raise ValueError("USE_WEBHOOK=true richiede WEBHOOK_URL (o RAILWAY_PUBLIC_DOMAIN)")
+    
+    webhook_secret = get_webhook_secret(bot_token)
+    
+    # Server prima del setWebhook: il primo update deve trovare la route pronta
+    http_runner = await start_http_server(
+        create_http_app(telegram_app, webhook_secret),
+        get_http_port()
+    )
+    
+    await telegram_app.bot.set_webhook(
+        url=webhook_url,
+        secret_token=webhook_secret,
+        allowed_updates=["message"],  # Solo messaggi, inclusi documenti
+        drop_pending_updates=False
+    )
+    logger.info(f"✅ Telegram bot webhook attivo: {webhook_url}")
+    return http_runner
 
 
 async def main():
     """Entrypoint principale"""
-    global _shutdown
+    global _shutdown_event
     
     # Registra signal handlers
-    signal.signal(signal.SIGINT, signal_handler)
-    signal.signal(signal.SIGTERM, signal_handler)
+    _shutdown_event = asyncio.Event()
+    install_signal_handlers(asyncio.get_running_loop())
     
     try:
-        # Startup
-        if not await startup():
+        started_at = time.perf_counter()
+        phases: Dict[str, float] = {}
+        
+        # Lag event loop e callback lente fin dall'avvio
+        if LOOP_MONITOR_ENABLED:
+            loop_monitor.start()
+        
+        if not validate_config():
             logger.info("Bot disabilitato (ADMIN_NOTIFY_ENABLED=false)")
             return
         
-        log_with_context("info", "Bot admin avviato e pronto")
-        
         # Recupera token per Telegram bot
         admin_bot_token = os.getenv("ADMIN_BOT_TOKEN")
         
         # Setup Telegram bot per comandi
         telegram_app = setup_telegram_app(admin_bot_token)
         
-        # Inizializza bot
-        await telegram_app.initialize()
+        # Database e bot inizializzati in parallelo
+        await startup(telegram_app, phases)
         await telegram_app.start()
         
-        # Verifica se siamo su Railway (usa webhook) o locale (usa polling)
-        # Railway setta sempre PORT e RAILWAY_ENVIRONMENT
-        is_railway = os.getenv("RAILWAY_ENVIRONMENT") is not None or os.getenv("PORT") is not None
-        use_webhook = os.getenv("USE_WEBHOOK", "false").lower() == "true"
+        # Ricezione update: webhook (server HTTP integrato) o polling
+        http_runner = None
+        if is_webhook_mode():
+            http_runner = await _timed(phases, "webhook", start_webhook(telegram_app, admin_bot_token))
+        else:
+            await _timed(phases, "polling_start", start_polling(telegram_app))
+            # Su Railway (PORT settato) espone comunque /health
+            if os.getenv("PORT"):
+                http_runner = await start_http_server(create_http_app(), get_http_port())
         
-        if is_railway and not use_webhook:
-            # Su Railway, prova prima a rimuovere eventuali webhook esistenti
-            # Poi usa polling con gestione conflitti migliorata
-            max_webhook_retries = 3
-            for attempt in range(max_webhook_retries):
-                try:
-                    webhook_info = await telegram_app.bot.get_webhook_info()
-                    logger.info(f"[WEBHOOK_CHECK] Tentativo {attempt + 1}: webhook_url={webhook_info.url}, pending_updates={webhook_info.pending_update_count}")
-                    
-                    if webhook_info.url:
-                        await telegram_app.bot.delete_webhook(drop_pending_updates=True)
-                        logger.info(f"✅ Webhook rimosso: {webhook_info.url}")
-                        await asyncio.sleep(3)  # Aspetta di più per assicurarsi che la rimozione sia completata
-                    else:
-                        logger.info("✅ Nessun webhook configurato")
-                        break
-                except Exception as webhook_error:
-                    logger.warning(f"⚠️ Errore rimozione webhook (tentativo {attempt + 1}): {webhook_error}")
-                    if attempt < max_webhook_retries - 1:
-                        await asyncio.sleep(3)
-            
-            # Aspetta un po' prima di avviare polling per evitare conflitti con altre istanze
-            await asyncio.sleep(5)
-            logger.info("⏳ Attesa 5 secondi prima di avviare polling per evitare conflitti...")
+        # Health probe processor (richiude il circuito quando il processor torna su)
+        get_processor_client().start_health_probe()
         
-        # Avvia polling Telegram in background
-        # Usa allowed_updates per limitare solo ai messaggi (non callback_query per ora)
-        try:
-            await telegram_app.updater.start_polling(
-                drop_pending_updates=True,
-                allowed_updates=["message"]  # Solo messaggi, inclusi documenti
-            )
-            logger.info("✅ Telegram bot polling avviato")
-        except Exception as polling_error:
-            logger.error(f"❌ Errore avvio polling: {polling_error}")
-            # Se c'è un conflitto, aspetta e riprova
-            if "Conflict" in str(polling_error):
-                logger.warning("⚠️ Conflitto rilevato, attendo 10 secondi e riprovo...")
-                await asyncio.sleep(10)
-                await telegram_app.updater.start_polling(
-                    drop_pending_updates=True,
-                    allowed_updates=["message"]
-                )
-                logger.info("✅ Telegram bot polling avviato dopo retry")
-            else:
-                raise
+        # Avvia worker upload CSV in background
+        upload_tasks = await start_upload_workers(telegram_app.bot)
+        
+        # Outbox messaggi agli utenti (/<telegram_id>, /all)
+        user_outbox_task = await start_user_outbox_worker(telegram_app.bot)
+        
+        # Digest periodico (giornaliero/orario) all'admin
+        digest_task = start_digest_task()
         
         # Avvia worker in background
-        worker_task = asyncio.create_task(start_worker())
+        worker_task = asyncio.create_task(start_worker(_shutdown_event))
+        
+        # Watchdog fuori dal worker: heartbeat e SLO di latenza coda
+        watchdog_task = start_watchdog_task()
+        shutdown_wait = asyncio.create_task(_shutdown_event.wait())
+        
+        # Un solo record strutturato con le durate delle fasi di avvio
+        log_with_context(
+            "info", "Bot admin avviato e pronto in %.2fs", time.perf_counter() - started_at,
+            startup_seconds=round(time.perf_counter() - started_at, 3),
+            startup_phases=phases
+        )
         
         # Attendi shutdown o errore
         try:
-            await worker_task
+            done, _ = await asyncio.wait({worker_task, shutdown_wait}, return_when=asyncio.FIRST_COMPLETED)
+            if worker_task in done:
+                worker_task.result()
+            else:
+                # Stop cooperativo: nessun nuovo claim, notifiche in corso completate o restituite
+                await drain_worker(worker_task)
         except asyncio.CancelledError:
             logger.info("Worker cancellato")
         except Exception as e:
             logger.error(f"Errore nel worker: {e}")
             raise
         finally:
-            # Stop Telegram bot
-            await telegram_app.updater.stop()
+            shutdown_wait.cancel()
+            if not worker_task.done():
+                worker_task.cancel()
+                await asyncio.gather(worker_task, return_exceptions=True)
+            
+            # Stop worker upload
+            for task in upload_tasks:
+                task.cancel()
+            await asyncio.gather(*upload_tasks, return_exceptions=True)
+            
+            for task in (user_outbox_task, digest_task, watchdog_task):
+                if task:
+                    task.cancel()
+                    await asyncio.gather(task, return_exceptions=True)
+            
+            # Annulla job report ancora in corso
+            await cancel_report_jobs()
+            
+            # Stop ricezione update (il webhook resta registrato per la prossima istanza)
+            await stop_http_server(http_runner)
+            if telegram_app.updater and telegram_app.updater.running:
+                await telegram_app.updater.stop()
             await telegram_app.stop()
             await telegram_app.shutdown()
             logger.info("✅ Telegram bot fermato")
@@ -191,12 +406,14 @@ async def main():
         logger.error(f"Errore critico: {e}")
         raise
     finally:
+        await loop_monitor.stop()
         await shutdown()
 
 
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        # Loop asyncio standard o uvloop (ADMIN_EVENT_LOOP)
+        event_loop.run(main())
     except KeyboardInterrupt:
         logger.info("Bot interrotto")
     except Exception as e:
@@ -0,0 +1,36 @@
+-- Migration: Crea tabella admin_upload_jobs per coda upload CSV
+-- Applicata automaticamente all'avvio (idempotente)
+
+CREATE TABLE IF NOT EXISTS admin_upload_jobs (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    created_at TIMESTAMP DEFAULT now(),
+    updated_at TIMESTAMP DEFAULT now(),
+    status TEXT DEFAULT 'queued',
+    stage TEXT,
+    file_id TEXT NOT NULL,
+    file_unique_id TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    telegram_id BIGINT,
+    business_name TEXT NOT NULL,
+    chat_id BIGINT NOT NULL,
+    status_message_id BIGINT,
+    result JSONB,
+    error TEXT
+);
+
+-- Deduplica: uno stesso file (file_unique_id) non può essere in coda/in elaborazione due volte
+-- (doppio invio accidentale). Job completati o falliti sono esclusi: il file può essere ricaricato.
+-- Sostituisce idx_upload_jobs_file_unique, che bloccava per sempre un file già elaborato.
+DROP INDEX IF EXISTS idx_upload_jobs_file_unique;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_upload_jobs_file_active
+    ON admin_upload_jobs (file_unique_id)
+    WHERE status IN ('queued', 'processing');
+
+-- Indice per claim dei job in coda (worker upload legge da qui)
+CREATE INDEX IF NOT EXISTS idx_upload_jobs_queued
+    ON admin_upload_jobs (created_at)
+    WHERE status = 'queued';
+
+COMMENT ON TABLE admin_upload_jobs IS 'Coda job upload CSV inventario - elaborati in background da gioia-admin-bot';
+COMMENT ON COLUMN admin_upload_jobs.status IS 'queued, processing, done, failed';
+COMMENT ON COLUMN admin_upload_jobs.stage IS 'downloaded, validated, submitted, processed';
@@ -0,0 +1,14 @@
+-- Migration: dead-letter per admin_notifications
+-- Applicata automaticamente all'avvio (idempotente)
+
+-- Ultimo errore di invio e momento del passaggio a 'failed'
+ALTER TABLE admin_notifications ADD COLUMN IF NOT EXISTS last_error TEXT;
+ALTER TABLE admin_notifications ADD COLUMN IF NOT EXISTS failed_at TIMESTAMP;
+
+-- Indice per listing e requeue delle notifiche fallite (/failed)
+CREATE INDEX IF NOT EXISTS idx_admin_failed
+    ON admin_notifications (failed_at DESC)
+    WHERE status = 'failed';
+
+COMMENT ON COLUMN admin_notifications.last_error IS 'Ultimo errore di invio (aggiornato ad ogni retry)';
+COMMENT ON COLUMN admin_notifications.failed_at IS 'Momento del passaggio a failed (dopo ADMIN_MAX_RETRY)';
@@ -0,0 +1,13 @@
+-- Migration: chiave di idempotenza per admin_notifications
+-- Applicata automaticamente all'avvio (idempotente)
+
+-- Chiave opzionale fornita dal producer (es. "onboarding:<telegram_id>:<correlation_id>")
+ALTER TABLE admin_notifications ADD COLUMN IF NOT EXISTS idempotency_key TEXT;
+
+-- Un solo evento per chiave: i producer inseriscono con
+--   INSERT ... ON CONFLICT (idempotency_key) WHERE idempotency_key IS NOT NULL DO NOTHING
+CREATE UNIQUE INDEX IF NOT EXISTS idx_admin_idempotency
+    ON admin_notifications (idempotency_key)
+    WHERE idempotency_key IS NOT NULL;
+
+COMMENT ON COLUMN admin_notifications.idempotency_key IS 'Chiave di idempotenza opzionale del producer (univoca se presente)';
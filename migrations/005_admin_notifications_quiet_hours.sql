@@ -0,0 +1,9 @@
+-- Migration: ore di silenzio per admin_notifications
+-- Applicata automaticamente all'avvio (idempotente)
+
+-- Fine della finestra di silenzio per cui la notifica è stata trattenuta.
+-- La riga resta pending con next_attempt_at = held_until: l'attesa passa
+-- dall'indice idx_admin_pending e non costa nulla finché la finestra non finisce.
+ALTER TABLE admin_notifications ADD COLUMN IF NOT EXISTS held_until TIMESTAMP;
+
+COMMENT ON COLUMN admin_notifications.held_until IS 'Trattenuta per ore di silenzio fino a (rilasciata in un digest)';
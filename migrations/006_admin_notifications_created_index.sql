@@ -0,0 +1,7 @@
+-- Migration: indice su created_at per il digest periodico
+-- Applicata automaticamente all'avvio (idempotente)
+
+-- Riconciliazione del digest: range query su un giorno/ora di created_at
+-- senza scansione dell'intera tabella (idx_admin_user_created parte da telegram_id)
+CREATE INDEX IF NOT EXISTS idx_admin_created
+    ON admin_notifications (created_at);
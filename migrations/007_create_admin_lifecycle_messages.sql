@@ -0,0 +1,19 @@
+-- Migration: Crea tabella admin_lifecycle_messages per le card di ciclo di vita
+-- Applicata automaticamente all'avvio (idempotente)
+
+-- Una card per utente: il messaggio admin che viene modificato (editMessageText)
+-- ad ogni evento successivo di onboarding/inventario invece di inviarne uno nuovo.
+-- È il backing della mappa in memoria, ricaricata all'avvio.
+CREATE TABLE IF NOT EXISTS admin_lifecycle_messages (
+    telegram_id BIGINT PRIMARY KEY,
+    correlation_id TEXT,
+    chat_id TEXT NOT NULL,
+    thread_id BIGINT,
+    message_id BIGINT NOT NULL,
+    text TEXT NOT NULL,
+    updated_at TIMESTAMP DEFAULT now()
+);
+
+-- Indice per il caricamento delle card recenti all'avvio
+CREATE INDEX IF NOT EXISTS idx_lifecycle_updated
+    ON admin_lifecycle_messages (updated_at DESC);
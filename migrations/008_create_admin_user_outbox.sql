@@ -0,0 +1,42 @@
+-- Migration: Crea tabella admin_user_outbox per i messaggi admin -> utenti (/<telegram_id>, /all)
+-- Applicata automaticamente all'avvio (idempotente)
+
+-- I messaggi non partono più dall'handler: vengono scritti qui e inviati dal
+-- worker outbox con pacing per chat, retry (next_attempt_at) ed esito
+-- riportato all'admin modificando il messaggio di conferma.
+CREATE TABLE IF NOT EXISTS admin_user_outbox (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    created_at TIMESTAMP DEFAULT now(),
+    updated_at TIMESTAMP DEFAULT now(),
+    status TEXT DEFAULT 'pending',
+    telegram_id BIGINT NOT NULL,
+    text TEXT NOT NULL,
+    batch_id UUID,
+    admin_chat_id BIGINT NOT NULL,
+    status_message_id BIGINT,
+    retry_count INTEGER DEFAULT 0,
+    next_attempt_at TIMESTAMP DEFAULT now(),
+    locked_until TIMESTAMP,
+    sent_at TIMESTAMP,
+    last_error TEXT
+);
+
+-- Indice per claim dei messaggi da inviare (worker outbox legge da qui)
+CREATE INDEX IF NOT EXISTS idx_user_outbox_pending
+    ON admin_user_outbox (next_attempt_at)
+    WHERE status = 'pending';
+
+-- Indice per ripresa dei messaggi 'sending' con lease scaduto (istanza terminata durante l'invio)
+CREATE INDEX IF NOT EXISTS idx_user_outbox_sending
+    ON admin_user_outbox (locked_until)
+    WHERE status = 'sending';
+
+-- Indice per l'avanzamento di un invio /all
+CREATE INDEX IF NOT EXISTS idx_user_outbox_batch
+    ON admin_user_outbox (batch_id)
+    WHERE batch_id IS NOT NULL;
+
+COMMENT ON TABLE admin_user_outbox IS 'Outbox messaggi admin verso utenti - inviati in background da gioia-admin-bot';
+COMMENT ON COLUMN admin_user_outbox.status IS 'pending, sending, sent, failed';
+COMMENT ON COLUMN admin_user_outbox.locked_until IS 'Lease del worker che sta inviando il messaggio (NULL se non in invio)';
+COMMENT ON COLUMN admin_user_outbox.batch_id IS 'Messaggi dello stesso /all (NULL per /<telegram_id>)';
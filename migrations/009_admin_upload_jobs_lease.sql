@@ -0,0 +1,14 @@
+-- Migration: lease sui job upload in elaborazione
+-- Applicata automaticamente all'avvio (idempotente)
+
+-- Scadenza della presa in carico, rinnovata dal worker mentre elabora il job.
+-- Un job 'processing' torna disponibile solo a lease scaduto (istanza terminata):
+-- durante un deploy sovrapposto la nuova istanza non rielabora i job della vecchia.
+ALTER TABLE admin_upload_jobs ADD COLUMN IF NOT EXISTS locked_until TIMESTAMP;
+
+-- Indice per ripresa dei job con lease scaduto
+CREATE INDEX IF NOT EXISTS idx_upload_jobs_processing
+    ON admin_upload_jobs (locked_until)
+    WHERE status = 'processing';
+
+COMMENT ON COLUMN admin_upload_jobs.locked_until IS 'Lease del worker che elabora il job (NULL se non in elaborazione)';
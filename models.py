@@ -20,6 +20,9 @@ class AdminNotification:
     payload: Dict[str, Any]
     retry_count: int
     next_attempt_at: datetime
+    last_error: Optional[str] = None
+    idempotency_key: Optional[str] = None
+    held_until: Optional[datetime] = None
     
     @classmethod
     def from_row(cls, row) -> 'AdminNotification':
@@ -44,6 +47,9 @@ class AdminNotification:
             correlation_id=row.get('correlation_id'),
             payload=payload,
             retry_count=row.get('retry_count', 0),
-            next_attempt_at=row['next_attempt_at']
+            next_attempt_at=row['next_attempt_at'],
+            last_error=row.get('last_error'),
+            idempotency_key=row.get('idempotency_key'),
+            held_until=row.get('held_until')
         )
 
@@ -0,0 +1,401 @@
+"""
+Backend coda notifiche admin: interfaccia comune, implementazione Postgres e in memoria
+"""
+import os
+import json
+import heapq
+import itertools
+import logging
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from db import get_db_pool
+from models import AdminNotification
+from utils.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Backend coda: postgres (default) o memory (singolo processo, perso al riavvio)
+QUEUE_BACKEND = os.getenv("ADMIN_QUEUE_BACKEND", "postgres").lower()
+
+# Durata del claim: una notifica presa da un worker torna disponibile
+# dopo questo tempo se non viene confermata (ack/nack), es. crash durante l'invio
+CLAIM_LEASE_SEC = float(os.getenv("ADMIN_QUEUE_CLAIM_LEASE_SEC", 60))
+
+# Coda in memoria: chiavi di idempotenza delle notifiche concluse ricordate
+# per questo tempo (le notifiche concluse non restano in memoria)
+MEMORY_IDEMPOTENCY_TTL_SEC = 24 * 3600
+MEMORY_IDEMPOTENCY_MAX_KEYS = 100_000
+
+
+class NotificationQueue(ABC):
+    """
+    Coda notifiche admin.
+
+    Ciclo di vita: enqueue -> claim -> ack (inviata) oppure nack (nuovo
+    tentativo dopo un ritardo, o dead-letter se delay è None).
+    release rende subito di nuovo disponibile una notifica presa ma non
+    processata (es. rate limit), senza contare un tentativo.
+    renew prolunga il lease delle notifiche prese e ancora in elaborazione
+    (invio con retry interni più lunghi del lease).
+    hold la trattiene fino alla fine delle ore di silenzio: le notifiche
+    trattenute si prendono con claim(held=True) e vanno inviate come digest.
+    """
+
+    name = "base"
+    lease_seconds = CLAIM_LEASE_SEC
+
+    @abstractmethod
+    async def enqueue(
+        self,
+        event_type: str,
+        telegram_id: int,
+        payload: Dict[str, Any],
+        correlation_id: Optional[str] = None,
+        idempotency_key: Optional[str] = None
+    ) -> Optional[uuid.UUID]:
+        """Inserisce una notifica pending (None se idempotency_key già presente)"""
+
+    @abstractmethod
+    async def claim(self, limit: int, held: bool = False) -> List[AdminNotification]:
+        """Prende fino a limit notifiche pronte, in ordine di inserimento (solo trattenute se held)"""
+
+    @abstractmethod
+    async def ack(self, notification_id) -> None:
+        """Conferma invio (status sent)"""
+
+    @abstractmethod
+    async def nack(
+        self,
+        notification_id,
+        retry_count: int,
+        delay_seconds: Optional[float],
+        error: Optional[str] = None
+    ) -> None:
+        """Invio fallito: nuovo tentativo tra delay_seconds, o status failed se delay_seconds è None"""
+
+    @abstractmethod
+    async def release(self, notification_id) -> None:
+        """Rilascia un claim senza contare un tentativo"""
+
+    @abstractmethod
+    async def renew(self, notification_ids: List) -> None:
+        """Prolunga il lease di notifiche prese e ancora pending (mai lo accorcia)"""
+
+    @abstractmethod
+    async def hold(self, notification_id, until: datetime) -> None:
+        """Trattiene una notifica fino a until (fine ore di silenzio)"""
+
+    @abstractmethod
+    async def stats(self) -> Dict[str, Any]:
+        """
+        Stato coda: {"pending": int, "oldest_pending_at": datetime | None,
+        "oldest_ready_at": datetime | None (escluse le trattenute per ore di silenzio),
+        "by_event_type": {event_type: {"pending": int, "oldest_pending_at": datetime | None,
+        "oldest_ready_at": datetime | None}}}
+        """
+
+    async def close(self) -> None:
+        """Rilascia eventuali risorse"""
+
+
+class PostgresNotificationQueue(NotificationQueue):
+    """Coda su tabella admin_notifications (condivisa con i producer)"""
+
+    name = "postgres"
+
+    def __init__(self, lease_seconds: float = CLAIM_LEASE_SEC):
+        self.lease_seconds = lease_seconds
+
+    async def enqueue(self, event_type, telegram_id, payload, correlation_id=None, idempotency_key=None):
+        pool = await get_db_pool()
+        async with pool.acquire() as conn:
+            return await conn.fetchval("""
+                INSERT INTO admin_notifications (event_type, telegram_id, payload, correlation_id, idempotency_key)
+                VALUES ($1, $2, $3::jsonb, $4, $5)
+                ON CONFLICT (idempotency_key) WHERE idempotency_key IS NOT NULL DO NOTHING
+                RETURNING id
+            """, event_type, telegram_id, json.dumps(payload), correlation_id, idempotency_key)
+
+    async def claim(self, limit: int, held: bool = False) -> List[AdminNotification]:
+        """
+        Claim con SKIP LOCKED: più istanze (es. durante un deploy) non
+        prendono le stesse righe; next_attempt_at viene spostato alla scadenza del lease.
+        """
+        pool = await get_db_pool()
+        now = datetime.utcnow()
+
+        async with pool.acquire() as conn:
+            rows = await conn.fetch("""
+                UPDATE admin_notifications AS n
+                SET next_attempt_at = $3
+                FROM (
+                    SELECT id
+                    FROM admin_notifications
+                    WHERE status = 'pending'
+                    AND next_attempt_at <= $2
+                    AND (held_until IS NOT NULL) = $4
+                    ORDER BY created_at ASC
+                    LIMIT $1
+                    FOR UPDATE SKIP LOCKED
+                ) AS claimed
+                WHERE n.id = claimed.id
+                RETURNING n.*
+            """, limit, now, now + timedelta(seconds=self.lease_seconds), held)
+
+        notifications = [AdminNotification.from_row(row) for row in rows]
+        notifications.sort(key=lambda notification: notification.created_at)
+        return notifications
+
+    async def ack(self, notification_id) -> None:
+        pool = await get_db_pool()
+        async with pool.acquire() as conn:
+            await conn.execute("""
+                UPDATE admin_notifications
+                SET status = 'sent'
+                WHERE id = $1
+            """, notification_id)
+
+    async def nack(self, notification_id, retry_count, delay_seconds, error=None) -> None:
+        now = datetime.utcnow()
+        if delay_seconds is None:
+            status, next_attempt, failed_at = "failed", None, now
+        else:
+            status, next_attempt, failed_at = "pending", now + timedelta(seconds=delay_seconds), None
+
+        pool = await get_db_pool()
+        async with pool.acquire() as conn:
+            await conn.execute("""
+                UPDATE admin_notifications
+                SET retry_count = $1,
+                    next_attempt_at = $2,
+                    status = $3,
+                    last_error = $5,
+                    failed_at = $6
+                WHERE id = $4
+            """, retry_count, next_attempt, status, notification_id, error, failed_at)
+
+    async def release(self, notification_id) -> None:
+        pool = await get_db_pool()
+        async with pool.acquire() as conn:
+            await conn.execute("""
+                UPDATE admin_notifications
+                SET next_attempt_at = $2
+                WHERE id = $1 AND status = 'pending'
+            """, notification_id, datetime.utcnow())
+
+    async def renew(self, notification_ids) -> None:
+        pool = await get_db_pool()
+        async with pool.acquire() as conn:
+            await conn.execute("""
+                UPDATE admin_notifications
+                SET next_attempt_at = GREATEST(next_attempt_at, $2)
+                WHERE id = ANY($1::uuid[]) AND status = 'pending'
+            """, list(notification_ids), datetime.utcnow() + timedelta(seconds=self.lease_seconds))
+
+    async def hold(self, notification_id, until: datetime) -> None:
+        pool = await get_db_pool()
+        async with pool.acquire() as conn:
+            await conn.execute("""
+                UPDATE admin_notifications
+                SET next_attempt_at = $2,
+                    held_until = $2
+                WHERE id = $1 AND status = 'pending'
+            """, notification_id, until)
+
+    async def stats(self) -> Dict[str, Any]:
+        """Unica query sulle righe pending (indice parziale idx_admin_pending)"""
+        pool = await get_db_pool()
+        async with pool.acquire() as conn:
+            rows = await conn.fetch("""
+                SELECT event_type, COUNT(*) AS pending, MIN(created_at) AS oldest,
+                       MIN(created_at) FILTER (WHERE held_until IS NULL) AS oldest_ready
+                FROM admin_notifications
+                WHERE status = 'pending'
+                GROUP BY event_type
+            """)
+
+        by_event_type = {
+            row["event_type"]: {
+                "pending": row["pending"],
+                "oldest_pending_at": row["oldest"],
+                "oldest_ready_at": row["oldest_ready"],
+            }
+            for row in rows
+        }
+        return _summarize(by_event_type)
+
+
+class InMemoryNotificationQueue(NotificationQueue):
+    """
+    Coda in memoria con heap ordinati per (prossimo tentativo, ordine di inserimento):
+    uno per le notifiche normali e uno per quelle trattenute (ore di silenzio).
+
+    Per benchmark, test e modalità a nodo singolo senza tabella condivisa:
+    le notifiche non sopravvivono al riavvio del processo. Tiene solo le
+    notifiche pending: inviate e fallite escono dalla coda (la dead-letter
+    /failed richiede il backend postgres).
+    """
+
+    name = "memory"
+
+    def __init__(self, lease_seconds: float = CLAIM_LEASE_SEC):
+        self.lease_seconds = lease_seconds
+        self._rows: Dict[uuid.UUID, AdminNotification] = {}
+        # Voci (due_at, seq, id, version): le voci con version superata vengono scartate
+        self._heap: List[Tuple[datetime, int, uuid.UUID, int]] = []
+        self._held_heap: List[Tuple[datetime, int, uuid.UUID, int]] = []
+        self._versions: Dict[uuid.UUID, int] = {}
+        # Chiavi delle notifiche pending, più quelle delle concluse per MEMORY_IDEMPOTENCY_TTL_SEC
+        self._idempotency_keys: Dict[str, uuid.UUID] = {}
+        self._finished_keys = TTLCache(ttl_seconds=MEMORY_IDEMPOTENCY_TTL_SEC, max_size=MEMORY_IDEMPOTENCY_MAX_KEYS)
+        self._seq = itertools.count()
+
+    def _schedule(self, notification: AdminNotification, due_at: datetime):
+        """(Ri)programma una notifica pending invalidando le voci precedenti"""
+        version = self._versions.get(notification.id, 0) + 1
+        self._versions[notification.id] = version
+        notification.next_attempt_at = due_at
+        heap = self._held_heap if notification.held_until is not None else self._heap
+        heapq.heappush(heap, (due_at, next(self._seq), notification.id, version))
+
+    def _finish(self, notification: AdminNotification, status: str):
+        """Stato finale: la notifica esce dalla coda (le sue voci nell'heap diventano obsolete)"""
+        notification.status = status
+        self._versions.pop(notification.id, None)
+        self._rows.pop(notification.id, None)
+        if notification.idempotency_key:
+            self._idempotency_keys.pop(notification.idempotency_key, None)
+            self._finished_keys.set(notification.idempotency_key, notification.id)
+
+    async def enqueue(self, event_type, telegram_id, payload, correlation_id=None, idempotency_key=None):
+        if idempotency_key and (
+            idempotency_key in self._idempotency_keys or self._finished_keys.get(idempotency_key) is not None
+        ):
+            return None
+
+        now = datetime.utcnow()
+        notification = AdminNotification(
+            id=uuid.uuid4(),
+            created_at=now,
+            status="pending",
+            event_type=event_type,
+            telegram_id=telegram_id,
+            correlation_id=correlation_id,
+            payload=payload,
+            retry_count=0,
+            next_attempt_at=now,
+            idempotency_key=idempotency_key,
+        )
+        self._rows[notification.id] = notification
+        if idempotency_key:
+            self._idempotency_keys[idempotency_key] = notification.id
+        self._schedule(notification, now)
+        return notification.id
+
+    async def claim(self, limit: int, held: bool = False) -> List[AdminNotification]:
+        now = datetime.utcnow()
+        lease_until = now + timedelta(seconds=self.lease_seconds)
+        heap = self._held_heap if held else self._heap
+        claimed = []
+
+        while heap and len(claimed) < limit and heap[0][0] <= now:
+            _, _, notification_id, version = heapq.heappop(heap)
+            if self._versions.get(notification_id) != version:
+                continue  # voce obsoleta (riprogrammata o completata)
+            notification = self._rows[notification_id]
+            self._schedule(notification, lease_until)
+            claimed.append(notification)
+
+        return claimed
+
+    async def ack(self, notification_id) -> None:
+        notification = self._rows.get(notification_id)
+        if notification is not None:
+            self._finish(notification, "sent")
+
+    async def nack(self, notification_id, retry_count, delay_seconds, error=None) -> None:
+        notification = self._rows.get(notification_id)
+        if notification is None:
+            return
+        notification.retry_count = retry_count
+        notification.last_error = error
+        if delay_seconds is None:
+            self._finish(notification, "failed")
+        else:
+            self._schedule(notification, datetime.utcnow() + timedelta(seconds=delay_seconds))
+
+    async def release(self, notification_id) -> None:
+        notification = self._rows.get(notification_id)
+        if notification is not None and notification.status == "pending":
+            self._schedule(notification, datetime.utcnow())
+
+    async def renew(self, notification_ids) -> None:
+        lease_until = datetime.utcnow() + timedelta(seconds=self.lease_seconds)
+        for notification_id in notification_ids:
+            notification = self._rows.get(notification_id)
+            if notification is not None and notification.status == "pending":
+                self._schedule(notification, max(notification.next_attempt_at, lease_until))
+
+    async def hold(self, notification_id, until: datetime) -> None:
+        notification = self._rows.get(notification_id)
+        if notification is not None and notification.status == "pending":
+            notification.held_until = until
+            self._schedule(notification, until)
+
+    async def stats(self) -> Dict[str, Any]:
+        by_event_type: Dict[str, Dict[str, Any]] = {}
+        for notification_id in self._versions:
+            notification = self._rows[notification_id]
+            info = by_event_type.setdefault(
+                notification.event_type, {"pending": 0, "oldest_pending_at": None, "oldest_ready_at": None}
+            )
+            info["pending"] += 1
+            if info["oldest_pending_at"] is None or notification.created_at < info["oldest_pending_at"]:
+                info["oldest_pending_at"] = notification.created_at
+            if notification.held_until is None and (
+                info["oldest_ready_at"] is None or notification.created_at < info["oldest_ready_at"]
+            ):
+                info["oldest_ready_at"] = notification.created_at
+        return _summarize(by_event_type)
+
+
+def _summarize(by_event_type: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Totali a partire dal dettaglio per event_type"""
+    oldest = [info["oldest_pending_at"] for info in by_event_type.values() if info["oldest_pending_at"]]
+    oldest_ready = [info["oldest_ready_at"] for info in by_event_type.values() if info["oldest_ready_at"]]
+    return {
+        "pending": sum(info["pending"] for info in by_event_type.values()),
+        "oldest_pending_at": min(oldest) if oldest else None,
+        "oldest_ready_at": min(oldest_ready) if oldest_ready else None,
+        "by_event_type": by_event_type,
+    }
+
+
+_BACKENDS = {
+    PostgresNotificationQueue.name: PostgresNotificationQueue,
+    InMemoryNotificationQueue.name: InMemoryNotificationQueue,
+}
+
+_queue: Optional[NotificationQueue] = None
+
+
+def get_notification_queue() -> NotificationQueue:
+    """Coda del processo (backend da ADMIN_QUEUE_BACKEND)"""
+    global _queue
+    if _queue is None:
+        backend = _BACKENDS.get(QUEUE_BACKEND)
+        if backend is None:
+            raise ValueError(
+                f"ADMIN_QUEUE_BACKEND non valido: {QUEUE_BACKEND} (valori: {', '.join(_BACKENDS)})"
+            )
+        _queue = backend()
+        logger.info(f"Coda notifiche: backend {_queue.name}")
+    return _queue
+
+
+def set_notification_queue(queue: Optional[NotificationQueue]):
+    """Imposta la coda del processo (benchmark, test); None = torna al backend configurato"""
+    global _queue
+    _queue = queue
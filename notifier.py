@@ -2,21 +2,55 @@
 Notificatore Telegram per admin bot con retry automatico
 """
 import os
+import time
 import logging
 import httpx
 from typing import Optional, Dict, Any
 from utils.logging import log_with_context
 from utils.backoff import calculate_backoff
+from utils.metrics import registry
 import asyncio
 
 logger = logging.getLogger(__name__)
 
+# Base URL Bot API (sovrascrivibile per Bot API server locale o benchmark)
+TELEGRAM_API_BASE_URL = os.getenv("TELEGRAM_API_BASE_URL", "https://api.telegram.org").rstrip("/")
+
+# Metriche chiamate Telegram API
+TELEGRAM_API_LATENCY = registry.histogram(
+    "admin_bot_telegram_api_duration_seconds",
+    "Latenza chiamate Telegram Bot API",
+    ["method"]
+)
+TELEGRAM_API_RESPONSES = registry.counter(
+    "admin_bot_telegram_api_responses_total",
+    "Risposte Telegram Bot API per status code (timeout/error = nessuna risposta)",
+    ["method", "status"]
+)
+
+
+def _retry_after(response: httpx.Response, attempt: int) -> float:
+    """
+    Attesa prima del retry dopo un 429: usa parameters.retry_after indicato
+    da Telegram se presente, altrimenti backoff esponenziale.
+    """
+    try:
+        retry_after = response.json().get("parameters", {}).get("retry_after")
+        if retry_after is not None:
+            return float(retry_after)
+    except Exception:
+        pass
+    return calculate_backoff(attempt, base_seconds=10)
+
 
 async def send_notification_with_retry(
     message: str,
     notification_id: str,
     correlation_id: Optional[str] = None,
-    max_retries: int = 10
+    max_retries: int = 10,
+    chat_id: Optional[str] = None,
+    message_thread_id: Optional[int] = None,
+    edit_message_id: Optional[int] = None
 ) -> Dict[str, Any]:
     """
     Invia messaggio Telegram all'admin con retry automatico.
@@ -26,14 +60,18 @@ async def send_notification_with_retry(
         notification_id: ID notifica per logging
         correlation_id: ID correlazione per tracciamento
         max_retries: Numero massimo tentativi
+        chat_id: Chat di destinazione (default: ADMIN_CHAT_ID)
+        message_thread_id: Topic forum della chat (opzionale)
+        edit_message_id: Se presente modifica questo messaggio (editMessageText) invece di inviarne uno nuovo
     
     Returns:
         Dict con:
             - status: "sent" o "error"
+            - message_id: ID del messaggio inviato o modificato (se status="sent")
             - error: Messaggio errore (se status="error")
     """
     admin_bot_token = os.getenv("ADMIN_BOT_TOKEN")
-    admin_chat_id = os.getenv("ADMIN_CHAT_ID")
+    admin_chat_id = chat_id or os.getenv("ADMIN_CHAT_ID")
     
     if not admin_bot_token:
         error_msg = "ADMIN_BOT_TOKEN non configurato"
@@ -45,39 +83,62 @@ async def send_notification_with_retry(
         logger.error(error_msg)
         return {"status": "error", "error": error_msg}
     
-    url = f"https://api.telegram.org/bot{admin_bot_token}/sendMessage"
+    method = "editMessageText" if edit_message_id is not None else "sendMessage"
+    url = f"{TELEGRAM_API_BASE_URL}/bot{admin_bot_token}/{method}"
     
     payload = {
         "chat_id": admin_chat_id,
         "text": message,
         "parse_mode": "Markdown"
     }
+    if edit_message_id is not None:
+        payload["message_id"] = edit_message_id
+    elif message_thread_id is not None:
+        payload["message_thread_id"] = message_thread_id
     
     # Retry loop
     for attempt in range(max_retries + 1):
         try:
             async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.post(url, json=payload)
+                request_start = time.perf_counter()
+                try:
+                    response = await client.post(url, json=payload)
+                except httpx.TimeoutException:
+                    TELEGRAM_API_RESPONSES.inc(method=method, status="timeout")
+                    raise
+                except Exception:
+                    TELEGRAM_API_RESPONSES.inc(method=method, status="error")
+                    raise
+                finally:
+                    TELEGRAM_API_LATENCY.observe(time.perf_counter() - request_start, method=method)
+                TELEGRAM_API_RESPONSES.inc(method=method, status=str(response.status_code))
+                
+                # Modifica con lo stesso testo: il messaggio è già aggiornato
+                if edit_message_id is not None and "message is not modified" in response.text:
+                    return {"status": "sent", "message_id": edit_message_id}
                 
                 if response.status_code == 200:
                     result = response.json()
                     if result.get("ok"):
                         log_with_context(
                             "info",
-                            f"Notifica {notification_id} inviata con successo",
+                            "Notifica %s inviata con successo",
+                            notification_id,
                             correlation_id=correlation_id,
                             notification_id=notification_id,
                             attempt=attempt + 1
                         )
-                        return {"status": "sent"}
+                        sent = result.get("result")
+                        message_id = sent.get("message_id") if isinstance(sent, dict) else edit_message_id
+                        return {"status": "sent", "message_id": message_id}
                     else:
                         error_desc = result.get("description", "Unknown error")
                         
                         # Gestione errori specifici Telegram
                         if "429" in error_desc or response.status_code == 429:
-                            # Rate limit - retry con backoff
+                            # Rate limit - retry dopo retry_after (o backoff)
                             if attempt < max_retries:
-                                backoff_seconds = calculate_backoff(attempt, base_seconds=10)
+                                backoff_seconds = _retry_after(response, attempt)
                                 logger.warning(
                                     f"Rate limit Telegram per notifica {notification_id}, "
                                     f"retry dopo {backoff_seconds}s (tentativo {attempt + 1}/{max_retries})"
@@ -89,8 +150,8 @@ async def send_notification_with_retry(
                             # Bad request - non retry
                             error_msg = f"Bad request Telegram: {error_desc}"
                             logger.error(
-                                f"Errore Telegram per notifica {notification_id}: {error_msg}",
-                                correlation_id=correlation_id
+                                f"Errore Telegram per notifica {notification_id}: {error_msg} "
+                                f"(correlation_id: {correlation_id})"
                             )
                             return {"status": "error", "error": error_msg}
                         
@@ -98,8 +159,8 @@ async def send_notification_with_retry(
                             # Unauthorized - errore critico
                             error_msg = f"Token Telegram invalido: {error_desc}"
                             logger.critical(
-                                f"Errore critico Telegram per notifica {notification_id}: {error_msg}",
-                                correlation_id=correlation_id
+                                f"Errore critico Telegram per notifica {notification_id}: {error_msg} "
+                                f"(correlation_id: {correlation_id})"
                             )
                             return {"status": "error", "error": error_msg}
                         
@@ -118,9 +179,9 @@ async def send_notification_with_retry(
                                 return {"status": "error", "error": error_msg}
                 
                 elif response.status_code == 429:
-                    # Rate limit HTTP
+                    # Rate limit HTTP: Telegram indica quanto attendere in retry_after
                     if attempt < max_retries:
-                        backoff_seconds = calculate_backoff(attempt, base=10)
+                        backoff_seconds = _retry_after(response, attempt)
                         logger.warning(
                             f"Rate limit HTTP per notifica {notification_id}, "
                             f"retry dopo {backoff_seconds}s (tentativo {attempt + 1}/{max_retries})"
@@ -131,10 +192,16 @@ async def send_notification_with_retry(
                         error_msg = "Rate limit Telegram raggiunto dopo max retry"
                         return {"status": "error", "error": error_msg}
                 
+                elif response.status_code == 400 and edit_message_id is not None:
+                    # Messaggio da modificare non più disponibile (cancellato, troppo vecchio): non retry
+                    error_msg = f"Modifica messaggio {edit_message_id} non riuscita: {response.text[:200]}"
+                    logger.warning(f"{error_msg} (notifica {notification_id})")
+                    return {"status": "error", "error": error_msg}
+                
                 else:
                     # Altri errori HTTP
                     if attempt < max_retries:
-                        backoff_seconds = calculate_backoff(attempt, base=10)
+                        backoff_seconds = calculate_backoff(attempt, base_seconds=10)
                         logger.warning(
                             f"Errore HTTP {response.status_code} per notifica {notification_id}, "
                             f"retry dopo {backoff_seconds}s (tentativo {attempt + 1}/{max_retries})"
@@ -147,7 +214,7 @@ async def send_notification_with_retry(
         
         except httpx.TimeoutException:
             if attempt < max_retries:
-                backoff_seconds = calculate_backoff(attempt, base=10)
+                backoff_seconds = calculate_backoff(attempt, base_seconds=10)
                 logger.warning(
                     f"Timeout invio notifica {notification_id}, "
                     f"retry dopo {backoff_seconds}s (tentativo {attempt + 1}/{max_retries})"
@@ -160,7 +227,7 @@ async def send_notification_with_retry(
         
         except Exception as e:
             if attempt < max_retries:
-                backoff_seconds = calculate_backoff(attempt, base=10)
+                backoff_seconds = calculate_backoff(attempt, base_seconds=10)
                 logger.warning(
                     f"Errore generico invio notifica {notification_id}: {e}, "
                     f"retry dopo {backoff_seconds}s (tentativo {attempt + 1}/{max_retries})",
@@ -171,8 +238,8 @@ async def send_notification_with_retry(
             else:
                 error_msg = f"Errore generico: {str(e)}"
                 logger.error(
-                    f"Errore definitivo invio notifica {notification_id}: {error_msg}",
-                    correlation_id=correlation_id,
+                    f"Errore definitivo invio notifica {notification_id}: {error_msg} "
+                    f"(correlation_id: {correlation_id})",
                     exc_info=True
                 )
                 return {"status": "error", "error": error_msg}
@@ -180,7 +247,7 @@ async def send_notification_with_retry(
     # Se arriviamo qui, abbiamo esaurito i tentativi
     error_msg = f"Max retry ({max_retries}) raggiunto per notifica {notification_id}"
     logger.error(
-        f"Impossibile inviare notifica {notification_id} dopo {max_retries} tentativi",
-        correlation_id=correlation_id
+        f"Impossibile inviare notifica {notification_id} dopo {max_retries} tentativi "
+        f"(correlation_id: {correlation_id})"
     )
     return {"status": "error", "error": error_msg}
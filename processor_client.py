@@ -0,0 +1,230 @@
+"""
+Client HTTP verso gioia-processor con circuit breaker e health probe
+"""
+import os
+import time
+import asyncio
+import logging
+import httpx
+from typing import Optional, Dict, Any
+from utils.circuit_breaker import CircuitBreaker, CircuitOpenError, CLOSED, OPEN
+from utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+
+# URL del processor per chiamate API (usa PROCESSOR_URL se disponibile, altrimenti default)
+def _normalize_processor_url(url: str) -> str:
+    """Normalizza URL aggiungendo https:// se manca il protocollo"""
+    if not url:
+        return "https://gioia-processor-production.up.railway.app"
+    url = url.strip()
+    if not url.startswith(("http://", "https://")):
+        url = f"https://{url}"
+    return url
+
+_processor_url_raw = os.getenv("PROCESSOR_URL") or os.getenv("PROCESSOR_API_URL", "https://gioia-processor-production.up.railway.app")
+PROCESSOR_API_URL = _normalize_processor_url(_processor_url_raw)
+
+# Errori consecutivi prima di aprire il circuito
+PROCESSOR_FAILURE_THRESHOLD = int(os.getenv("PROCESSOR_FAILURE_THRESHOLD", 3))
+
+# Secondi di circuito aperto prima di una chiamata di prova
+PROCESSOR_RESET_TIMEOUT = float(os.getenv("PROCESSOR_RESET_TIMEOUT_SEC", 30))
+
+# Endpoint e intervallo health probe (usato solo a circuito aperto)
+PROCESSOR_HEALTH_PATH = os.getenv("PROCESSOR_HEALTH_PATH", "/health")
+PROCESSOR_HEALTH_INTERVAL = float(os.getenv("PROCESSOR_HEALTH_INTERVAL_SEC", 10))
+
+# Timeout di connessione: un processor irraggiungibile deve fallire in fretta
+PROCESSOR_CONNECT_TIMEOUT = 5.0
+DEFAULT_TIMEOUT = 30.0
+HEALTH_TIMEOUT = 3.0
+
+
+# Metriche chiamate processor
+PROCESSOR_LATENCY = registry.histogram(
+    "admin_bot_processor_request_duration_seconds",
+    "Latenza chiamate al processor per endpoint",
+    ["endpoint"]
+)
+PROCESSOR_REJECTED = registry.counter(
+    "admin_bot_processor_circuit_rejections_total",
+    "Chiamate al processor rifiutate a circuito aperto",
+    ["endpoint"]
+)
+
+
+class ProcessorUnavailableError(CircuitOpenError):
+    """Processor non disponibile (circuito aperto)"""
+
+
+class ProcessorClient:
+    """Client processor condiviso: una connessione HTTP riusata, circuito e latenze per endpoint (PROCESSOR_LATENCY)"""
+
+    def __init__(
+        self,
+        base_url: str,
+        failure_threshold: int = PROCESSOR_FAILURE_THRESHOLD,
+        reset_timeout: float = PROCESSOR_RESET_TIMEOUT,
+        health_path: str = PROCESSOR_HEALTH_PATH
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.health_path = health_path
+        self.breaker = CircuitBreaker(failure_threshold=failure_threshold, reset_timeout=reset_timeout)
+
+        self._client: Optional[httpx.AsyncClient] = None
+        self._probe_task: Optional[asyncio.Task] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """Client httpx condiviso (creato alla prima chiamata)"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(DEFAULT_TIMEOUT, connect=PROCESSOR_CONNECT_TIMEOUT)
+            )
+        return self._client
+
+    def url(self, path: str) -> str:
+        """URL completo di un endpoint (per messaggi e log)"""
+        return f"{self.base_url}{path}"
+
+    def is_available(self) -> bool:
+        """False se il circuito è aperto (le chiamate fallirebbero subito)"""
+        return self.breaker.state != OPEN
+
+    def _observe(self, path: str, elapsed: float):
+        """Registra latenza per endpoint"""
+        PROCESSOR_LATENCY.observe(elapsed, endpoint=path)
+
+    async def _send(self, method: str, path: str, timeout: Optional[float], **kwargs) -> httpx.Response:
+        """Singola richiesta HTTP (senza circuito)"""
+        request_timeout = httpx.Timeout(timeout or DEFAULT_TIMEOUT, connect=PROCESSOR_CONNECT_TIMEOUT)
+        return await self._get_client().request(method, path, timeout=request_timeout, **kwargs)
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        timeout: Optional[float] = None,
+        **kwargs
+    ) -> httpx.Response:
+        """
+        Esegue una richiesta verso il processor.
+
+        Args:
+            method: Metodo HTTP
+            path: Path endpoint (es. "/admin/trigger-daily-report")
+            timeout: Timeout lettura (secondi)
+            **kwargs: Parametri httpx (json, params, ...)
+
+        Raises:
+            ProcessorUnavailableError: circuito aperto, nessuna chiamata effettuata
+            httpx.HTTPError: errori di trasporto (timeout, connessione)
+        """
+        if not self.breaker.allow_request():
+            PROCESSOR_REJECTED.inc(endpoint=path)
+            raise ProcessorUnavailableError(
+                f"Processor non disponibile (nuovo tentativo tra {self.breaker.seconds_until_retry():.0f}s)"
+            )
+
+        start = time.perf_counter()
+        recorded = False
+        try:
+            response = await self._send(method, path, timeout, **kwargs)
+
+            # 5xx = processor in difficoltà; 4xx = processor attivo (errore della richiesta)
+            if response.status_code >= 500:
+                self.breaker.record_failure(f"HTTP {response.status_code}")
+            else:
+                self.breaker.record_success()
+            recorded = True
+            return response
+
+        except httpx.TransportError as e:
+            self.breaker.record_failure(f"{type(e).__name__}: {e}")
+            recorded = True
+            if self.breaker.state == OPEN:
+                logger.warning(f"[PROCESSOR] Circuito aperto dopo errore {method} {path}: {e}")
+            raise
+
+        finally:
+            if not recorded:
+                # Richiesta annullata o errore inatteso: libera l'eventuale slot di prova
+                self.breaker.release_trial()
+            self._observe(path, time.perf_counter() - start)
+
+    async def post(self, path: str, **kwargs) -> httpx.Response:
+        """POST verso il processor"""
+        return await self.request("POST", path, **kwargs)
+
+    async def get(self, path: str, **kwargs) -> httpx.Response:
+        """GET verso il processor"""
+        return await self.request("GET", path, **kwargs)
+
+    async def check_health(self) -> bool:
+        """Health probe diretto (ignora il circuito); se ok richiude il circuito"""
+        start = time.perf_counter()
+        try:
+            response = await self._send("GET", self.health_path, HEALTH_TIMEOUT)
+            healthy = response.status_code < 500
+        except httpx.HTTPError as e:
+            logger.debug(f"[PROCESSOR] Health probe fallito: {e}")
+            healthy = False
+        finally:
+            self._observe(self.health_path, time.perf_counter() - start)
+
+        if healthy and self.breaker.state != CLOSED:
+            logger.info("[PROCESSOR] ✅ Processor di nuovo raggiungibile, circuito chiuso")
+            self.breaker.record_success()
+        return healthy
+
+    async def _health_probe_loop(self):
+        """Loop health probe: sonda il processor solo quando il circuito non è chiuso"""
+        while True:
+            await asyncio.sleep(PROCESSOR_HEALTH_INTERVAL)
+            if self.breaker.state == CLOSED:
+                continue
+            try:
+                await self.check_health()
+            except Exception as e:
+                logger.warning(f"[PROCESSOR] Errore health probe: {e}")
+
+    def start_health_probe(self):
+        """Avvia health probe in background"""
+        if self._probe_task is None or self._probe_task.done():
+            self._probe_task = asyncio.create_task(self._health_probe_loop(), name="processor-health-probe")
+
+    def latency_snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Riepilogo latenze per endpoint"""
+        return {labels[0]: histogram.snapshot() for labels, histogram in PROCESSOR_LATENCY.items()}
+
+    async def close(self):
+        """Ferma health probe e chiude connessioni"""
+        if self._probe_task:
+            self._probe_task.cancel()
+            await asyncio.gather(self._probe_task, return_exceptions=True)
+            self._probe_task = None
+        if self._client:
+            await self._client.aclose()
+            self._client = None
+
+
+# Client condiviso (singleton)
+_processor_client: Optional[ProcessorClient] = None
+
+
+def get_processor_client() -> ProcessorClient:
+    """Ottieni client processor (singleton)"""
+    global _processor_client
+    if _processor_client is None:
+        _processor_client = ProcessorClient(PROCESSOR_API_URL)
+    return _processor_client
+
+
+async def close_processor_client():
+    """Chiudi client processor"""
+    global _processor_client
+    if _processor_client:
+        await _processor_client.close()
+        _processor_client = None
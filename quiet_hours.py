@@ -0,0 +1,114 @@
+"""
+Ore di silenzio per tipo evento: notifiche trattenute e rilasciate come digest
+"""
+import os
+import logging
+from datetime import datetime, time, timedelta, timezone
+from typing import Dict, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+logger = logging.getLogger(__name__)
+
+# Finestre per tipo evento, orari locali (es. "inventory_uploaded=23:00-07:00,onboarding_completed=00:00-07:30")
+QUIET_HOURS = os.getenv("ADMIN_QUIET_HOURS", "")
+
+# Fuso orario delle finestre
+QUIET_HOURS_TZ = os.getenv("ADMIN_QUIET_HOURS_TZ", "Europe/Rome")
+
+# Notifiche trattenute incluse al massimo in un singolo digest
+QUIET_DIGEST_MAX = int(os.getenv("ADMIN_QUIET_DIGEST_MAX", 200))
+
+
+def _parse_time(value: str) -> time:
+    hours, _, minutes = value.strip().partition(":")
+    return time(int(hours), int(minutes or 0))
+
+
+def parse_quiet_hours(value: str) -> Dict[str, Tuple[time, time]]:
+    """
+    Finestre per tipo evento da "event_type=HH:MM-HH:MM,...".
+    Una finestra con inizio > fine attraversa la mezzanotte (23:00-07:00).
+
+    Raises:
+        ValueError: se una finestra non è valida
+    """
+    windows = {}
+    for part in value.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        event_type, _, window = part.partition("=")
+        start, _, end = window.partition("-")
+        try:
+            start_time, end_time = _parse_time(start), _parse_time(end)
+        except ValueError:
+            raise ValueError(f"Finestra ore di silenzio non valida: {part}")
+        if start_time == end_time:
+            raise ValueError(f"Finestra ore di silenzio vuota: {part}")
+        windows[event_type.strip()] = (start_time, end_time)
+    return windows
+
+
+class QuietHours:
+    """Finestre di silenzio per tipo evento in un fuso orario"""
+
+    def __init__(self, windows: Dict[str, Tuple[time, time]], tz_name: str = QUIET_HOURS_TZ):
+        self.windows = windows
+        self.tz = ZoneInfo(tz_name)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.windows)
+
+    def window_end(self, event_type: str, now: Optional[datetime] = None) -> Optional[datetime]:
+        """
+        Fine della finestra di silenzio in corso per event_type (UTC naive,
+        come next_attempt_at), None se l'evento può essere inviato subito.
+
+        Args:
+            now: istante UTC naive (default: adesso)
+        """
+        window = self.windows.get(event_type)
+        if window is None:
+            return None
+
+        now = now or datetime.utcnow()
+        local_now = now.replace(tzinfo=timezone.utc).astimezone(self.tz)
+        start, end = window
+        current = local_now.time()
+
+        if start < end:
+            if not (start <= current < end):
+                return None
+            end_date = local_now.date()
+        else:
+            # Finestra a cavallo della mezzanotte
+            if current >= start:
+                end_date = local_now.date() + timedelta(days=1)
+            elif current < end:
+                end_date = local_now.date()
+            else:
+                return None
+
+        local_end = datetime.combine(end_date, end, tzinfo=self.tz)
+        return local_end.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _load_quiet_hours() -> QuietHours:
+    """Configurazione da env (finestre non valide: ore di silenzio disattivate)"""
+    try:
+        windows = parse_quiet_hours(QUIET_HOURS)
+    except ValueError as e:
+        logger.error(f"[QUIET_HOURS] {e} - ore di silenzio disattivate")
+        windows = {}
+    if windows:
+        logger.info(
+            "[QUIET_HOURS] Attive (%s): %s",
+            QUIET_HOURS_TZ,
+            ", ".join(f"{event_type} {start:%H:%M}-{end:%H:%M}" for event_type, (start, end) in windows.items())
+        )
+    return QuietHours(windows)
+
+
+# Configurazione del processo
+quiet_hours = _load_quiet_hours()
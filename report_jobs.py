@@ -0,0 +1,326 @@
+"""
+Job report giornaliero in background (trigger processor + avanzamento su messaggio Telegram)
+"""
+import os
+import time
+import uuid
+import asyncio
+import logging
+import httpx
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Optional, Dict, Any, List
+from processor_client import get_processor_client, ProcessorClient, ProcessorUnavailableError
+
+logger = logging.getLogger(__name__)
+
+# Numero massimo di date elaborate in parallelo per un backfill
+REPORT_PARALLELISM = int(os.getenv("ADMIN_REPORT_PARALLELISM", 3))
+
+# Ampiezza massima di un intervallo date (/report all 2025-12-01..2025-12-31)
+REPORT_MAX_RANGE_DAYS = int(os.getenv("ADMIN_REPORT_MAX_RANGE_DAYS", 62))
+
+# Timeout singola chiamata processor (secondi)
+REPORT_REQUEST_TIMEOUT = 300.0
+
+# Intervallo minimo tra due modifiche del messaggio di avanzamento (secondi)
+PROGRESS_EDIT_INTERVAL = 3.0
+
+# Job conclusi mantenuti in memoria per /report status
+MAX_FINISHED_JOBS = 20
+
+
+@dataclass
+class ReportJob:
+    """Job report tracciato in memoria"""
+    id: str
+    telegram_id: Optional[int]
+    dates: List[Optional[str]]
+    chat_id: int
+    status_message_id: int
+    created_at: datetime = field(default_factory=datetime.utcnow)
+    status: str = "running"  # 'running', 'done', 'failed'
+    completed_dates: int = 0
+    sent_count: int = 0
+    skipped_count: int = 0
+    error_count: int = 0
+    errors: List[str] = field(default_factory=list)
+    report_date: Optional[str] = None  # Data restituita dal processor (job a data singola)
+    task: Optional[asyncio.Task] = None
+    _last_edit: float = 0.0
+
+
+# Registry job (per id)
+_jobs: Dict[str, ReportJob] = {}
+
+
+def normalize_report_date(report_date: str) -> str:
+    """Normalizza formato data DD/MM/YY o DD/MM/YYYY a YYYY-MM-DD (altri formati invariati)"""
+    try:
+        if "/" in report_date:
+            parts = report_date.split("/")
+            if len(parts) == 3:
+                day, month, year = parts
+                # Se anno è 2 cifre, assume 20XX
+                if len(year) == 2:
+                    year = f"20{year}"
+                report_date = f"{year}-{month.zfill(2)}-{day.zfill(2)}"
+    except Exception as date_error:
+        logger.warning(f"[ADMIN_REPORT] Errore parsing data {report_date}: {date_error}")
+        # Continua con formato originale, il server lo gestirà
+    return report_date
+
+
+def parse_report_dates(report_date: Optional[str]) -> List[Optional[str]]:
+    """
+    Espande l'argomento data di /report in una lista di date.
+
+    Supporta:
+    - None -> [None] (oggi, default del processor)
+    - "2025-12-11" o "11/12/25" -> ["2025-12-11"]
+    - "2025-12-01..2025-12-31" -> tutte le date dell'intervallo (estremi inclusi)
+
+    Raises:
+        ValueError: se l'intervallo non è valido o supera REPORT_MAX_RANGE_DAYS
+    """
+    if not report_date:
+        return [None]
+
+    if ".." not in report_date:
+        return [normalize_report_date(report_date)]
+
+    start_str, end_str = report_date.split("..", 1)
+    try:
+        start = date.fromisoformat(normalize_report_date(start_str.strip()))
+        end = date.fromisoformat(normalize_report_date(end_str.strip()))
+    except ValueError:
+        raise ValueError(f"Intervallo date non valido: {report_date}")
+
+    if end < start:
+        raise ValueError(f"Intervallo date invertito: {report_date}")
+
+    days = (end - start).days + 1
+    if days > REPORT_MAX_RANGE_DAYS:
+        raise ValueError(f"Intervallo troppo ampio: {days} giorni (max {REPORT_MAX_RANGE_DAYS})")
+
+    return [(start + timedelta(days=i)).isoformat() for i in range(days)]
+
+
+def get_report_job(job_id: str) -> Optional[ReportJob]:
+    """Recupera job per id (anche prefisso)"""
+    if job_id in _jobs:
+        return _jobs[job_id]
+    for existing_id, job in _jobs.items():
+        if existing_id.startswith(job_id):
+            return job
+    return None
+
+
+def list_report_jobs() -> List[ReportJob]:
+    """Job in memoria, dal più recente"""
+    return sorted(_jobs.values(), key=lambda job: job.created_at, reverse=True)
+
+
+def _prune_finished_jobs():
+    """Mantiene solo gli ultimi MAX_FINISHED_JOBS job conclusi"""
+    finished = [job for job in list_report_jobs() if job.status != "running"]
+    for job in finished[MAX_FINISHED_JOBS:]:
+        _jobs.pop(job.id, None)
+
+
+def format_report_job(job: ReportJob) -> str:
+    """Formatta messaggio di stato/risultato del job"""
+    total_dates = len(job.dates)
+
+    if job.status == "running":
+        title = "⏳ **Invio report in corso...**"
+    elif job.status == "done":
+        title = "✅ **Report Inviato**"
+    else:
+        title = "❌ **Report fallito**"
+
+    if total_dates == 1:
+        date_display = job.report_date or job.dates[0] or "Oggi (default)"
+    else:
+        date_display = f"{job.dates[0]} → {job.dates[-1]} ({total_dates} giorni)"
+
+    text = (
+        f"{title}\n\n"
+        f"📅 **Data:** {date_display}\n"
+        f"👤 **Utente:** {job.telegram_id or 'Tutti'}\n"
+    )
+
+    if total_dates > 1:
+        text += f"📈 **Avanzamento:** {job.completed_dates}/{total_dates} date\n"
+
+    text += (
+        f"\n📊 **Statistiche:**\n"
+        f"• ✅ Inviati: {job.sent_count}\n"
+        f"• ⏭️ Saltati: {job.skipped_count}\n"
+        f"• ❌ Errori: {job.error_count}\n"
+    )
+
+    if job.errors:
+        text += "\n**Errori:**\n"
+        for error in job.errors[:5]:  # Max 5 errori
+            text += f"• {error[:100]}\n"
+        if len(job.errors) > 5:
+            text += f"\n... e altri {len(job.errors) - 5} errori"
+
+    text += f"\n🆔 Job: `{job.id[:8]}`"
+    return text
+
+
+async def _edit_status(bot, job: ReportJob, force: bool = False) -> None:
+    """Aggiorna il messaggio di stato (limitato a una modifica ogni PROGRESS_EDIT_INTERVAL)"""
+    now = time.monotonic()
+    if not force and now - job._last_edit < PROGRESS_EDIT_INTERVAL:
+        return
+    job._last_edit = now
+
+    text = format_report_job(job)
+    try:
+        await bot.edit_message_text(
+            chat_id=job.chat_id,
+            message_id=job.status_message_id,
+            text=text,
+            parse_mode='Markdown'
+        )
+    except Exception as e:
+        if "not modified" in str(e).lower():
+            return
+        # Errori nel testo possono rompere il Markdown: riprova senza formattazione
+        try:
+            await bot.edit_message_text(
+                chat_id=job.chat_id,
+                message_id=job.status_message_id,
+                text=text
+            )
+        except Exception as plain_error:
+            logger.warning(f"[ADMIN_REPORT] Impossibile aggiornare messaggio job {job.id}: {plain_error}")
+
+
+async def _trigger_report(
+    processor: ProcessorClient,
+    telegram_id: Optional[int],
+    report_date: Optional[str]
+) -> Dict[str, Any]:
+    """Chiama /admin/trigger-daily-report per una singola data"""
+    url = processor.url("/admin/trigger-daily-report")
+    payload = {}
+
+    if telegram_id:
+        payload["telegram_id"] = telegram_id
+    if report_date:
+        payload["report_date"] = report_date
+
+    logger.info(f"[ADMIN_REPORT] Chiamata endpoint: {url}, payload: {payload}")
+
+    response = await processor.post(
+        "/admin/trigger-daily-report",
+        json=payload,
+        timeout=REPORT_REQUEST_TIMEOUT
+    )
+    logger.info(f"[ADMIN_REPORT] Response status: {response.status_code} (data: {report_date or 'oggi'})")
+    response.raise_for_status()
+    return response.json()
+
+
+def _describe_error(error: Exception, processor: ProcessorClient) -> str:
+    """Descrizione breve di un errore chiamata processor"""
+    if isinstance(error, ProcessorUnavailableError):
+        return str(error)
+    if isinstance(error, httpx.HTTPStatusError):
+        if error.response.status_code == 404:
+            return (
+                f"Endpoint non trovato (404): {processor.url('/admin/trigger-daily-report')} "
+                f"- verifica deploy processor e PROCESSOR_URL"
+            )
+        error_text = error.response.text[:200] if error.response.text else "Nessun dettaglio disponibile"
+        return f"HTTP {error.response.status_code}: {error_text}"
+    if isinstance(error, httpx.TimeoutException):
+        return "Timeout: il processor non ha risposto in tempo"
+    return f"Errore: {str(error)[:200]}"
+
+
+async def _run_report_job(bot, job: ReportJob) -> None:
+    """Esegue le chiamate processor del job (in parallelo fino a REPORT_PARALLELISM)"""
+    processor = get_processor_client()
+    semaphore = asyncio.Semaphore(max(1, REPORT_PARALLELISM))
+    failed_dates = 0
+
+    async def run_single_date(report_date: Optional[str]):
+        nonlocal failed_dates
+        async with semaphore:
+            try:
+                result = await _trigger_report(processor, job.telegram_id, report_date)
+                job.sent_count += result.get('sent_count', 0)
+                job.skipped_count += result.get('skipped_count', 0)
+                job.error_count += result.get('error_count', 0)
+                job.errors.extend(result.get('errors', []))
+                if len(job.dates) == 1:
+                    job.report_date = result.get('report_date')
+            except Exception as e:
+                failed_dates += 1
+                error_desc = _describe_error(e, processor)
+                logger.error(f"[ADMIN_REPORT] Job {job.id} errore data {report_date or 'oggi'}: {error_desc}")
+                job.errors.append(f"{report_date or 'oggi'}: {error_desc}" if len(job.dates) > 1 else error_desc)
+            finally:
+                job.completed_dates += 1
+
+        await _edit_status(bot, job)
+
+    try:
+        await asyncio.gather(*(run_single_date(d) for d in job.dates))
+
+        job.status = "failed" if failed_dates == len(job.dates) else "done"
+    except asyncio.CancelledError:
+        job.status = "failed"
+        job.errors.append("Job annullato (shutdown)")
+        raise
+    except Exception as e:
+        logger.error(f"[ADMIN_REPORT] Errore job {job.id}: {e}", exc_info=True)
+        job.status = "failed"
+        job.errors.append(f"Errore: {str(e)[:200]}")
+    finally:
+        await _edit_status(bot, job, force=True)
+        logger.info(
+            f"[ADMIN_REPORT] Job {job.id} concluso ({job.status}): "
+            f"sent={job.sent_count}, skipped={job.skipped_count}, errors={job.error_count}"
+        )
+        _prune_finished_jobs()
+
+
+def start_report_job(
+    bot,
+    chat_id: int,
+    status_message_id: int,
+    telegram_id: Optional[int],
+    dates: List[Optional[str]]
+) -> ReportJob:
+    """
+    Avvia un job report in un task separato e ritorna subito.
+    Il messaggio status_message_id viene aggiornato con avanzamento ed esito.
+    """
+    job = ReportJob(
+        id=str(uuid.uuid4()),
+        telegram_id=telegram_id,
+        dates=dates,
+        chat_id=chat_id,
+        status_message_id=status_message_id
+    )
+    _jobs[job.id] = job
+    job.task = asyncio.create_task(
+        _run_report_job(bot, job),
+        name=f"report-job-{job.id[:8]}"
+    )
+    logger.info(f"[ADMIN_REPORT] Job {job.id} avviato: {len(dates)} date, telegram_id={telegram_id or 'tutti'}")
+    return job
+
+
+async def cancel_report_jobs() -> None:
+    """Annulla i job ancora in esecuzione (shutdown)"""
+    tasks = [job.task for job in _jobs.values() if job.task and not job.task.done()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
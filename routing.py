@@ -0,0 +1,134 @@
+"""
+Routing notifiche verso più chat admin e topic forum (per event_type, severity, source)
+"""
+import os
+import json
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Regole di routing (JSON), valutate in ordine, vince la prima che corrisponde, es.
+# [{"event_type": "error", "source": ["processor", "ai"], "chat_id": "-1001234567890", "thread_id": 12},
+#  {"event_type": "onboarding_completed", "chat_id": "-1001234567890", "thread_id": 7}]
+ADMIN_ROUTES = os.getenv("ADMIN_ROUTES", "")
+
+# Campi su cui una regola può filtrare
+MATCH_FIELDS = ("event_type", "severity", "source")
+
+
+@dataclass(frozen=True)
+class Destination:
+    """Chat di destinazione con topic forum opzionale"""
+    chat_id: str
+    thread_id: Optional[int] = None
+
+    @property
+    def bucket(self) -> str:
+        """
+        Bucket rate limit: il limite Telegram dei gruppi è per chat,
+        i topic della stessa chat lo condividono.
+        """
+        return self.chat_id
+
+    def __str__(self) -> str:
+        return f"{self.chat_id}/{self.thread_id}" if self.thread_id is not None else self.chat_id
+
+
+def event_severity(event_type: str, payload: Dict[str, Any]) -> str:
+    """Severity dell'evento: campo severity del payload, altrimenti error per gli errori e info per il resto"""
+    return payload.get("severity") or ("error" if event_type == "error" else "info")
+
+
+def parse_routes(value: str) -> List[Dict[str, Any]]:
+    """
+    Regole da JSON (lista di oggetti con chat_id e filtri opzionali).
+
+    Raises:
+        ValueError: se il JSON o una regola non sono validi
+    """
+    if not value.strip():
+        return []
+    try:
+        rules = json.loads(value)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"ADMIN_ROUTES non è JSON valido: {e}")
+    if not isinstance(rules, list):
+        raise ValueError("ADMIN_ROUTES deve essere una lista di regole")
+
+    routes = []
+    for rule in rules:
+        if not isinstance(rule, dict) or not rule.get("chat_id"):
+            raise ValueError(f"Regola di routing senza chat_id: {rule}")
+        match = {}
+        for name in MATCH_FIELDS:
+            expected = rule.get(name)
+            if expected is not None:
+                match[name] = {expected} if isinstance(expected, str) else set(expected)
+        thread_id = rule.get("thread_id")
+        routes.append({
+            "match": match,
+            "destination": Destination(str(rule["chat_id"]), int(thread_id) if thread_id is not None else None)
+        })
+    return routes
+
+
+class Router:
+    """Risolve la destinazione di un evento (fallback: chat di default)"""
+
+    def __init__(self, routes: List[Dict[str, Any]], default: Optional[Destination] = None):
+        self.routes = routes
+        self._default = default
+
+    @property
+    def default(self) -> Destination:
+        # ADMIN_CHAT_ID letto al primo uso (configurato dopo l'import in alcuni avvii)
+        return self._default or Destination(os.getenv("ADMIN_CHAT_ID", ""))
+
+    def resolve(self, event_type: str, payload: Optional[Dict[str, Any]] = None) -> Destination:
+        """Destinazione della prima regola che corrisponde all'evento"""
+        if not self.routes:
+            return self.default
+
+        payload = payload or {}
+        fields = {
+            "event_type": event_type,
+            "severity": event_severity(event_type, payload),
+            "source": payload.get("source"),
+        }
+        for route in self.routes:
+            if all(fields[name] in expected for name, expected in route["match"].items()):
+                return route["destination"]
+        return self.default
+
+    def destinations(self) -> List[Destination]:
+        """Destinazioni configurate (default inclusa)"""
+        destinations = [self.default]
+        for route in self.routes:
+            if route["destination"] not in destinations:
+                destinations.append(route["destination"])
+        return destinations
+
+
+def _load_router() -> Router:
+    """Configurazione da env (regole non valide: tutto sulla chat di default)"""
+    try:
+        routes = parse_routes(ADMIN_ROUTES)
+    except ValueError as e:
+        logger.error(f"[ROUTING] {e} - notifiche tutte su ADMIN_CHAT_ID")
+        routes = []
+    if routes:
+        logger.info(
+            "[ROUTING] %d regole: %s",
+            len(routes),
+            "; ".join(
+                f"{', '.join(f'{name}={sorted(values)}' for name, values in route['match'].items()) or '*'} -> {route['destination']}"
+                for route in routes
+            )
+        )
+    return Router(routes)
+
+
+# Router del processo
+router = _load_router()
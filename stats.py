@@ -0,0 +1,136 @@
+"""
+Statistiche live pipeline notifiche per il comando /stats
+"""
+import logging
+from datetime import datetime
+from typing import Dict, Any, Optional
+from notification_queue import get_notification_queue
+from processor_client import get_processor_client
+from routing import router
+from worker import (
+    NOTIFICATIONS_PROCESSED,
+    DISPATCH_LATENCY,
+    RECENT_SENDS,
+    user_info_cache,
+    get_rate_limiter
+)
+
+logger = logging.getLogger(__name__)
+
+
+async def fetch_pending_by_event_type() -> Dict[str, Dict[str, Any]]:
+    """
+    Pending per event_type con età della più vecchia.
+    Con backend Postgres è un'unica query sulle righe pending (indice parziale idx_admin_pending).
+    """
+    stats = await get_notification_queue().stats()
+
+    now = datetime.utcnow()
+    return {
+        event_type: {
+            "pending": info["pending"],
+            "oldest_age": (
+                max(0.0, (now - info["oldest_pending_at"]).total_seconds())
+                if info["oldest_pending_at"] else None
+            ),
+        }
+        for event_type, info in stats["by_event_type"].items()
+    }
+
+
+async def collect_stats() -> Dict[str, Any]:
+    """Aggrega contatori in memoria e la query pending"""
+    pending = await fetch_pending_by_event_type()
+
+    # Esiti dall'avvio (contatori incrementali del worker)
+    by_event: Dict[str, Dict[str, float]] = {}
+    for (event_type, outcome), value in NOTIFICATIONS_PROCESSED.items():
+        by_event.setdefault(event_type, {})[outcome] = value
+
+    for event_type, info in pending.items():
+        by_event.setdefault(event_type, {})["pending"] = info["pending"]
+
+    oldest_ages = [info["oldest_age"] for info in pending.values() if info["oldest_age"] is not None]
+
+    rate_limiter = get_rate_limiter()
+    latency = DISPATCH_LATENCY.merged()
+    processor = get_processor_client()
+
+    return {
+        "by_event": by_event,
+        "oldest_pending_age": max(oldest_ages) if oldest_ages else None,
+        "sent_last_minute": RECENT_SENDS.count(60),
+        "sent_last_hour": RECENT_SENDS.count(3600),
+        "rate_limit": rate_limiter.global_limit_per_min if rate_limiter else None,
+        "rate_headroom": (
+            {str(destination): rate_limiter.headroom(destination.bucket) for destination in router.destinations()}
+            if rate_limiter else None
+        ),
+        "user_cache_hit_rate": user_info_cache.hit_rate,
+        "user_cache_size": len(user_info_cache),
+        "dispatch_p50": latency.percentile(0.50),
+        "dispatch_p95": latency.percentile(0.95),
+        "processor_circuit": processor.breaker.state,
+    }
+
+
+def _format_seconds(seconds: Optional[float]) -> str:
+    """Durata leggibile (N/A se None)"""
+    if seconds is None:
+        return "N/A"
+    if seconds < 60:
+        return f"{seconds:.1f}s"
+    if seconds < 3600:
+        return f"{int(seconds // 60)}m {int(seconds % 60)}s"
+    return f"{int(seconds // 3600)}h {int((seconds % 3600) // 60)}m"
+
+
+def format_stats(stats: Dict[str, Any]) -> str:
+    """Formatta dashboard /stats"""
+    message = "📊 **Stato Sistema**\n\n"
+
+    message += "📬 **Notifiche per tipo** (pending / inviate / fallite):\n"
+    if stats["by_event"]:
+        for event_type, counts in sorted(stats["by_event"].items()):
+            message += (
+                f"• `{event_type}`: {int(counts.get('pending', 0))} / "
+                f"{int(counts.get('sent', 0))} / {int(counts.get('failed', 0))}"
+            )
+            if counts.get("suppressed"):
+                message += f" (+{int(counts['suppressed'])} anti-spam)"
+            if counts.get("duplicate"):
+                message += f" (+{int(counts['duplicate'])} duplicati)"
+            message += "\n"
+    else:
+        message += "• Nessuna notifica\n"
+
+    message += f"\n⏳ Pending più vecchia: {_format_seconds(stats['oldest_pending_age'])}\n"
+    message += (
+        f"🚀 Invii: {stats['sent_last_minute']} ultimo minuto, "
+        f"{stats['sent_last_hour']} ultima ora\n"
+    )
+
+    if stats["rate_limit"] is not None:
+        headroom = stats["rate_headroom"]
+        if len(headroom) == 1:
+            message += f"🚦 Rate limit: {next(iter(headroom.values()))}/{stats['rate_limit']} disponibili al minuto\n"
+        else:
+            message += f"🚦 Rate limit ({stats['rate_limit']}/min per chat):\n"
+            for destination, available in headroom.items():
+                message += f"• `{destination}`: {available} disponibili\n"
+    else:
+        message += "🚦 Rate limit: worker non attivo\n"
+
+    hit_rate = stats["user_cache_hit_rate"]
+    message += (
+        f"🗂️ Cache utenti: {f'{hit_rate * 100:.0f}%' if hit_rate is not None else 'N/A'} hit "
+        f"({stats['user_cache_size']} voci)\n"
+    )
+    message += (
+        f"⏱️ Latenza invio: p50 {_format_seconds(stats['dispatch_p50'])}, "
+        f"p95 {_format_seconds(stats['dispatch_p95'])}\n"
+    )
+    message += f"🔌 Processor: circuito `{stats['processor_circuit']}`\n"
+
+    message += "\n_Inviate/fallite: contatori dall'avvio del bot_"
+    return message
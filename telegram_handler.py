@@ -2,32 +2,75 @@
 Handler Telegram per admin bot
 """
 import os
+import time
 import logging
-import httpx
-import base64
+import functools
 import re
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
 from telegram import Update
 from db import get_db_pool
+from upload_queue import enqueue_upload_job, get_upload_job_by_file
+from user_outbox import enqueue_user_messages
+from processor_client import get_processor_client
+from update_processor import ChatOrderedUpdateProcessor, MAX_CONCURRENT_UPDATES
+from report_jobs import (
+    start_report_job,
+    parse_report_dates,
+    get_report_job,
+    list_report_jobs,
+    format_report_job
+)
+from stats import collect_stats, format_stats
+from update_tracer import update_tracer, format_trace
+from digest import build_digest
+from notifier import TELEGRAM_API_BASE_URL
+from dead_letter import (
+    FAILED_PAGE_SIZE,
+    parse_time_filter,
+    list_failed_notifications,
+    requeue_failed_notifications,
+    format_failed_page
+)
+from utils.metrics import registry
+from utils.loop_monitor import current_operation, loop_monitor, format_lag
 from typing import List, Dict, Any, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
-# Token del telegram-ai-bot per inviare messaggi agli utenti
-TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+# Durata handler per comando
+COMMAND_DURATION = registry.histogram(
+    "admin_bot_command_duration_seconds",
+    "Durata esecuzione handler comandi admin",
+    ["command"]
+)
+COMMAND_ERRORS = registry.counter(
+    "admin_bot_command_errors_total",
+    "Eccezioni non gestite negli handler comandi admin",
+    ["command"]
+)
 
-# URL del processor per chiamate API (usa PROCESSOR_URL se disponibile, altrimenti default)
-def _normalize_processor_url(url: str) -> str:
-    """Normalizza URL aggiungendo https:// se manca il protocollo"""
-    if not url:
-        return "https://gioia-processor-production.up.railway.app"
-    url = url.strip()
-    if not url.startswith(("http://", "https://")):
-        url = f"https://{url}"
-    return url
 
-_processor_url_raw = os.getenv("PROCESSOR_URL") or os.getenv("PROCESSOR_API_URL", "https://gioia-processor-production.up.railway.app")
-PROCESSOR_API_URL = _normalize_processor_url(_processor_url_raw)
+def instrumented(command: str):
+    """Decoratore: misura durata ed errori dell'handler per il comando indicato"""
+    def decorator(callback):
+        @functools.wraps(callback)
+        async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+            start = time.perf_counter()
+            # Callback lente del loop attribuite al comando
+            operation_token = current_operation.set(f"/{command}")
+            try:
+                return await callback(update, context)
+            except Exception:
+                COMMAND_ERRORS.inc(command=command)
+                raise
+            finally:
+                COMMAND_DURATION.observe(time.perf_counter() - start, command=command)
+                current_operation.reset(operation_token)
+        return wrapper
+    return decorator
+
+# URL del processor (normalizzato in processor_client)
+PROCESSOR_API_URL = get_processor_client().base_url
 
 
 async def get_all_users() -> List[Dict[str, Any]]:
@@ -79,46 +122,6 @@ async def get_user_by_telegram_id(telegram_id: int) -> Dict[str, Any]:
     return None
 
 
-async def send_message_to_user(telegram_id: int, message: str) -> Dict[str, Any]:
-    """
-    Invia un messaggio a un utente tramite telegram-ai-bot.
-    
-    Args:
-        telegram_id: ID Telegram dell'utente destinatario
-        message: Messaggio da inviare
-    
-    Returns:
-        Dict con status e eventuale errore
-    """
-    if not TELEGRAM_BOT_TOKEN:
-        return {"status": "error", "error": "TELEGRAM_BOT_TOKEN non configurato"}
-    
-    url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
-    
-    try:
-        payload = {
-            "chat_id": telegram_id,
-            "text": message,
-            "parse_mode": "Markdown"
-        }
-        
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.post(url, json=payload)
-            response.raise_for_status()
-            
-            return {"status": "sent", "telegram_id": telegram_id}
-    
-    except httpx.HTTPStatusError as e:
-        error_msg = f"HTTP {e.response.status_code}: {e.response.text}"
-        logger.error(f"Errore invio messaggio a {telegram_id}: {error_msg}")
-        return {"status": "error", "error": error_msg, "telegram_id": telegram_id}
-    
-    except Exception as e:
-        error_msg = f"Errore generico: {str(e)}"
-        logger.error(f"Errore invio messaggio a {telegram_id}: {error_msg}", exc_info=True)
-        return {"status": "error", "error": error_msg, "telegram_id": telegram_id}
-
-
 def is_authorized(update: Update) -> bool:
     """
     Verifica se l'utente/canale è autorizzato a usare i comandi admin.
@@ -177,13 +180,6 @@ async def all_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❌ Messaggio vuoto. Usa: `/all <messaggio>`", parse_mode='Markdown')
         return
     
-    # Conferma invio
-    await update.message.reply_text(
-        f"⏳ **Invio in corso...**\n\n"
-        f"Messaggio: {message_text[:100]}{'...' if len(message_text) > 100 else ''}\n\n"
-        f"Recupero lista utenti..."
-    )
-    
     try:
         # Recupera tutti gli utenti
         users = await get_all_users()
@@ -192,40 +188,19 @@ async def all_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("❌ Nessun utente trovato nel database.")
             return
         
-        # Invia messaggio a tutti gli utenti
-        sent_count = 0
-        failed_count = 0
-        failed_users = []
-        
-        for user in users:
-            result = await send_message_to_user(user["telegram_id"], message_text)
-            
-            if result["status"] == "sent":
-                sent_count += 1
-            else:
-                failed_count += 1
-                failed_users.append({
-                    "telegram_id": user["telegram_id"],
-                    "business_name": user.get("business_name", "N/A"),
-                    "error": result.get("error", "Errore sconosciuto")
-                })
-        
-        # Report finale
-        report = (
-            f"✅ **Invio Completato**\n\n"
-            f"📊 **Statistiche:**\n"
-            f"• ✅ Inviati: {sent_count}/{len(users)}\n"
-            f"• ❌ Falliti: {failed_count}/{len(users)}\n\n"
+        # Conferma: il worker outbox la aggiorna con avanzamento e report finale
+        status_message = await update.message.reply_text(
+            f"⏳ **Invio in coda...**\n\n"
+            f"Messaggio: {message_text[:100]}{'...' if len(message_text) > 100 else ''}\n\n"
+            f"Destinatari: {len(users)} utenti"
         )
         
-        if failed_users:
-            report += f"**Errori:**\n"
-            for failed in failed_users[:5]:  # Max 5 errori
-                report += f"• ID {failed['telegram_id']} ({failed['business_name']}): {failed['error'][:50]}\n"
-            if len(failed_users) > 5:
-                report += f"\n... e altri {len(failed_users) - 5} errori"
-        
-        await update.message.reply_text(report, parse_mode='Markdown')
+        await enqueue_user_messages(
+            [user["telegram_id"] for user in users],
+            message_text,
+            admin_chat_id=update.effective_chat.id,
+            status_message_id=status_message.message_id
+        )
     
     except Exception as e:
         logger.error(f"Errore comando /all: {e}", exc_info=True)
@@ -296,30 +271,19 @@ async def user_id_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if user.get("username"):
             user_info += f"\nUsername: @{user['username']}"
         
-        await update.message.reply_text(
-            f"⏳ **Invio messaggio...**\n\n"
+        # Conferma: il worker outbox la aggiorna con l'esito dell'invio
+        status_message = await update.message.reply_text(
+            f"⏳ **Messaggio in coda...**\n\n"
             f"👤 **Utente:**\n{user_info}\n\n"
             f"📝 **Messaggio:**\n{message_text[:200]}{'...' if len(message_text) > 200 else ''}"
         )
         
-        # Invia messaggio
-        result = await send_message_to_user(telegram_id, message_text)
-        
-        if result["status"] == "sent":
-            await update.message.reply_text(
-                f"✅ **Messaggio inviato con successo**\n\n"
-                f"👤 Utente: `{telegram_id}`\n"
-                f"📝 Messaggio: {message_text[:100]}{'...' if len(message_text) > 100 else ''}",
-                parse_mode='Markdown'
-            )
-        else:
-            error_msg = result.get("error", "Errore sconosciuto")
-            await update.message.reply_text(
-                f"❌ **Errore durante l'invio**\n\n"
-                f"👤 Utente: `{telegram_id}`\n"
-                f"❌ Errore: {error_msg[:200]}",
-                parse_mode='Markdown'
-            )
+        await enqueue_user_messages(
+            [telegram_id],
+            message_text,
+            admin_chat_id=update.effective_chat.id,
+            status_message_id=status_message.message_id
+        )
     
     except Exception as e:
         logger.error(f"Errore comando /{telegram_id}: {e}", exc_info=True)
@@ -330,7 +294,12 @@ async def user_id_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 async def report_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Comando /report - invia report giornaliero manualmente"""
+    """
+    Comando /report - invia report giornaliero manualmente.
+    
+    La chiamata al processor gira in un job in background: il comando risponde subito
+    e il messaggio di stato viene aggiornato con avanzamento e statistiche finali.
+    """
     # Verifica autorizzazione (supporta utente privato e canale/gruppo)
     if not is_authorized(update):
         await update.message.reply_text("❌ Solo l'amministratore può usare questo comando.")
@@ -345,20 +314,41 @@ async def report_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if len(args) > 0:
         first_arg = args[0].lower()  # Normalizza a lowercase per confronto
         
-        if first_arg == "all":
-            # /report all [data] - invia a tutti gli utenti
+        if first_arg == "status":
+            # /report status [job_id] - stato job report
+            await _report_status(update, args[1] if len(args) > 1 else None)
+            return
+        elif first_arg == "all":
+            # /report all [data|intervallo] - invia a tutti gli utenti
             telegram_id = None
             if len(args) > 1:
                 report_date = args[1]  # Secondo argomento: data
         elif first_arg.isdigit():
-            # /report <telegram_id> [data] - invia a utente specifico
+            # /report <telegram_id> [data|intervallo] - invia a utente specifico
             telegram_id = int(first_arg)
             if len(args) > 1:
                 report_date = args[1]  # Secondo argomento: data
         else:
-            # /report <data> - invia a tutti con data specifica
+            # /report <data|intervallo> - invia a tutti con data specifica
             report_date = args[0]
     
+    # Espandi data o intervallo (es. 2025-12-01..2025-12-31)
+    try:
+        dates = parse_report_dates(report_date)
+    except ValueError as e:
+        await update.message.reply_text(
+            f"❌ **Data non valida**\n\n"
+            f"{e}\n\n"
+            f"Formati: `YYYY-MM-DD`, `DD/MM/YY`, `YYYY-MM-DD..YYYY-MM-DD`",
+            parse_mode='Markdown'
+        )
+        return
+    
+    if len(dates) > 1:
+        date_display = f"{dates[0]} → {dates[-1]} ({len(dates)} giorni)"
+    else:
+        date_display = dates[0] or 'Oggi (default)'
+    
     # Mostra info prima di inviare
     if telegram_id:
         user = await get_user_by_telegram_id(telegram_id)
@@ -373,111 +363,71 @@ async def report_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if user.get("business_name"):
             user_info += f"\nBusiness: {user['business_name']}"
         
-        await update.message.reply_text(
+        status_msg = await update.message.reply_text(
             f"⏳ **Invio report in corso...**\n\n"
             f"👤 **Utente:**\n{user_info}\n"
-            f"📅 **Data:** {report_date or 'Oggi (default)'}\n\n"
+            f"📅 **Data:** {date_display}\n\n"
             f"Attendere..."
         )
     else:
-        await update.message.reply_text(
+        status_msg = await update.message.reply_text(
             f"⏳ **Invio report a tutti gli utenti...**\n\n"
-            f"📅 **Data:** {report_date or 'Oggi (default)'}\n\n"
+            f"📅 **Data:** {date_display}\n\n"
             f"Attendere..."
         )
     
+    # Processor giù (circuito aperto): risposta immediata invece di attendere il timeout
+    processor = get_processor_client()
+    if not processor.is_available():
+        await status_msg.edit_text(
+            f"⚠️ **Processor non disponibile**\n\n"
+            f"Il processor non risponde (ultimo errore: {processor.breaker.last_error or 'N/A'}).\n"
+            f"Nuovo tentativo automatico tra {processor.breaker.seconds_until_retry():.0f}s, riprova più tardi."
+        )
+        return
+    
     try:
-        # Normalizza formato data se fornita (supporta DD/MM/YY o YYYY-MM-DD)
-        if report_date:
-            # Prova a convertire formato DD/MM/YY a YYYY-MM-DD
-            try:
-                if "/" in report_date:
-                    parts = report_date.split("/")
-                    if len(parts) == 3:
-                        day, month, year = parts
-                        # Se anno è 2 cifre, assume 20XX
-                        if len(year) == 2:
-                            year = f"20{year}"
-                        report_date = f"{year}-{month.zfill(2)}-{day.zfill(2)}"
-            except Exception as date_error:
-                logger.warning(f"[ADMIN_REPORT] Errore parsing data {report_date}: {date_error}")
-                # Continua con formato originale, il server lo gestirà
-        
-        # Chiama endpoint processor
-        url = f"{PROCESSOR_API_URL}/admin/trigger-daily-report"
-        payload = {}
-        
-        if telegram_id:
-            payload["telegram_id"] = telegram_id
-        if report_date:
-            payload["report_date"] = report_date
-        
-        logger.info(f"[ADMIN_REPORT] Chiamata endpoint: {url}")
-        logger.info(f"[ADMIN_REPORT] Payload: {payload}")
-        logger.info(f"[ADMIN_REPORT] PROCESSOR_API_URL configurato: {PROCESSOR_API_URL}")
-        
-        async with httpx.AsyncClient(timeout=300.0) as client:  # Timeout 5 minuti
-            response = await client.post(url, json=payload)
-            logger.info(f"[ADMIN_REPORT] Response status: {response.status_code}")
-            logger.info(f"[ADMIN_REPORT] Response text: {response.text[:500]}")
-            response.raise_for_status()
-            result = response.json()
-        
-        # Report risultato
-        report_text = (
-            f"✅ **Report Inviato**\n\n"
-            f"📅 **Data:** {result.get('report_date', 'N/A')}\n"
-            f"👤 **Utente:** {result.get('telegram_id', 'Tutti')}\n\n"
-            f"📊 **Statistiche:**\n"
-            f"• ✅ Inviati: {result.get('sent_count', 0)}\n"
-            f"• ⏭️ Saltati: {result.get('skipped_count', 0)}\n"
-            f"• ❌ Errori: {result.get('error_count', 0)}\n"
+        start_report_job(
+            bot=context.bot,
+            chat_id=status_msg.chat_id,
+            status_message_id=status_msg.message_id,
+            telegram_id=telegram_id,
+            dates=dates
         )
-        
-        errors = result.get('errors', [])
-        if errors:
-            report_text += f"\n**Errori:**\n"
-            for error in errors[:5]:  # Max 5 errori
-                report_text += f"• {error[:100]}\n"
-            if len(errors) > 5:
-                report_text += f"\n... e altri {len(errors) - 5} errori"
-        
-        await update.message.reply_text(report_text, parse_mode='Markdown')
-    
-    except httpx.HTTPStatusError as e:
-        error_text = e.response.text[:500] if e.response.text else "Nessun dettaglio disponibile"
-        error_msg = f"HTTP {e.response.status_code}: {error_text}"
-        logger.error(f"[ADMIN_REPORT] Errore HTTP comando /report: {error_msg}")
-        logger.error(f"[ADMIN_REPORT] URL chiamato: {url}")
-        logger.error(f"[ADMIN_REPORT] PROCESSOR_API_URL: {PROCESSOR_API_URL}")
-        
-        # Messaggio più dettagliato per 404 (senza Markdown complesso per evitare errori parsing)
-        if e.response.status_code == 404:
-            detail_msg = (
-                "❌ Endpoint non trovato (404)\n\n"
-                "L'endpoint /admin/trigger-daily-report non è stato trovato.\n\n"
-                "Possibili cause:\n"
-                "• Il deploy del processor non è ancora completato\n"
-                "• L'URL del processor non è corretto\n"
-                "• L'endpoint non è stato deployato\n\n"
-                f"URL chiamato: {url}\n\n"
-                "Verifica:\n"
-                "• Che il processor sia deployato su Railway\n"
-                "• Che la variabile PROCESSOR_URL sia corretta\n"
-                "• Che l'endpoint esista nel codice del processor"
-            )
-        else:
-            detail_msg = f"❌ Errore durante l'invio\n\nErrore: {error_msg}"
-        
-        await update.message.reply_text(detail_msg)
     except Exception as e:
         logger.error(f"Errore comando /report: {e}", exc_info=True)
-        await update.message.reply_text(
+        await status_msg.edit_text(
             f"❌ **Errore durante l'invio**\n\n"
             f"Errore: {str(e)[:200]}"
         )
 
 
+async def _report_status(update: Update, job_id: Optional[str]):
+    """Mostra stato di un job report (o degli ultimi job)"""
+    if job_id:
+        job = get_report_job(job_id)
+        if not job:
+            await update.message.reply_text(f"❌ Job `{job_id}` non trovato.", parse_mode='Markdown')
+            return
+        await update.message.reply_text(format_report_job(job), parse_mode='Markdown')
+        return
+    
+    jobs = list_report_jobs()
+    if not jobs:
+        await update.message.reply_text("📋 Nessun job report recente.")
+        return
+    
+    status_emoji = {"running": "⏳", "done": "✅", "failed": "❌"}
+    lines = ["📋 **Job report recenti**\n"]
+    for job in jobs[:10]:
+        lines.append(
+            f"{status_emoji.get(job.status, '•')} `{job.id[:8]}` - "
+            f"{job.completed_dates}/{len(job.dates)} date, "
+            f"inviati {job.sent_count}, errori {job.error_count}"
+        )
+    await update.message.reply_text("\n".join(lines), parse_mode='Markdown')
+
+
 async def info_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Comando /info - mostra tutti i comandi disponibili"""
     # Verifica autorizzazione (supporta utente privato e canale/gruppo)
@@ -500,7 +450,9 @@ async def info_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "  Esempi:\n"
         "  - `/report` - Report per oggi a tutti\n"
         "  - `/report 927230913` - Report per oggi a un utente\n"
-        "  - `/report all 2025-12-11` - Report per il 11 dicembre a tutti\n\n"
+        "  - `/report all 2025-12-11` - Report per il 11 dicembre a tutti\n"
+        "  - `/report all 2025-12-01..2025-12-31` - Backfill di un intervallo di date\n"
+        "• `/report status [job_id]` - Stato dei job report in background\n\n"
         "📁 **Upload Inventario:**\n"
         "• `/upload` - Carica file CSV inventario\n"
         "  Invia un file CSV con `/upload` come caption.\n"
@@ -516,6 +468,15 @@ async def info_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "  Se non c'è telegram_id, viene creato un utente solo con business_name.\n\n"
         "👥 **Utenti:**\n"
         "• `/users` - Mostra lista di tutti gli utenti registrati\n\n"
+        "📈 **Monitoraggio:**\n"
+        "• `/stats` - Coda notifiche, invii recenti, rate limit e latenze\n"
+        "• `/digest` - Riepilogo onboarding, inventari ed errori del periodo in corso\n"
+        "• `/lag` - Lag dell'event loop e callback che lo bloccano\n"
+        "• `/failed [pagina] [event_type] [periodo]` - Notifiche fallite con ultimo errore\n"
+        "• `/failed requeue [event_type] [periodo]` - Rimette in coda le notifiche fallite\n"
+        "  Periodo: `24h`, `7d`, `2025-12-11`, `2025-12-01..2025-12-05`\n"
+        "• `/trace [N]` - Ultimi update ricevuti (tracer campionato)\n"
+        "• `/trace on [10%]` / `/trace off` / `/trace chat <chat_id>` - Configura il tracer\n\n"
         "ℹ️ **Info:**\n"
         "• `/info` - Mostra questo messaggio di aiuto\n"
         "• `/start` - Messaggio di benvenuto\n\n"
@@ -617,6 +578,196 @@ async def users_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
 
 
+async def stats_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Comando /stats - stato coda notifiche, throughput e latenze"""
+    # Verifica autorizzazione (supporta utente privato e canale/gruppo)
+    if not is_authorized(update):
+        await update.message.reply_text("❌ Solo l'amministratore può usare questo comando.")
+        return
+    
+    try:
+        stats = await collect_stats()
+        await update.message.reply_text(format_stats(stats), parse_mode='Markdown')
+    except Exception as e:
+        logger.error(f"Errore comando /stats: {e}", exc_info=True)
+        await update.message.reply_text(
+            f"❌ **Errore durante il recupero delle statistiche**\n\n"
+            f"Errore: {str(e)[:200]}"
+        )
+
+
+async def digest_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Comando /digest - riepilogo del periodo in corso (dai contatori del worker)"""
+    # Verifica autorizzazione (supporta utente privato e canale/gruppo)
+    if not is_authorized(update):
+        await update.message.reply_text("❌ Solo l'amministratore può usare questo comando.")
+        return
+    
+    try:
+        await update.message.reply_text(await build_digest(), parse_mode='Markdown')
+    except Exception as e:
+        logger.error(f"Errore comando /digest: {e}", exc_info=True)
+        await update.message.reply_text(
+            f"❌ **Errore durante la generazione del digest**\n\n"
+            f"Errore: {str(e)[:200]}"
+        )
+
+
+def _parse_failed_args(args: List[str]) -> Dict[str, Any]:
+    """
+    Argomenti /failed: numero pagina, event_type e filtro temporale in qualsiasi ordine.
+
+    Raises:
+        ValueError: se compaiono più event_type o più filtri temporali
+    """
+    parsed = {"page": 1, "event_type": None, "since": None, "until": None, "filter_args": []}
+    for arg in args:
+        if arg.isdigit():
+            parsed["page"] = max(int(arg), 1)
+            continue
+        if arg.lower() in ("all", "tutti"):
+            continue
+        try:
+            since, until = parse_time_filter(arg)
+        except ValueError:
+            if parsed["event_type"]:
+                raise ValueError(f"Argomento non riconosciuto: {arg}")
+            parsed["event_type"] = arg
+        else:
+            if parsed["since"]:
+                raise ValueError(f"Filtro temporale duplicato: {arg}")
+            parsed["since"], parsed["until"] = since, until
+        parsed["filter_args"].append(arg)
+    return parsed
+
+
+async def lag_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Comando /lag - lag dell'event loop e callback lente per handler/task"""
+    # Verifica autorizzazione (supporta utente privato e canale/gruppo)
+    if not is_authorized(update):
+        await update.message.reply_text("❌ Solo l'amministratore può usare questo comando.")
+        return
+    
+    await update.message.reply_text(format_lag(loop_monitor.snapshot()), parse_mode='Markdown')
+
+
+async def failed_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Comando /failed - notifiche finite in dead-letter (status failed).
+    
+    /failed [pagina] [event_type] [periodo] - elenco paginato
+    /failed requeue [event_type] [periodo] - rimette in coda le notifiche filtrate
+    """
+    # Verifica autorizzazione (supporta utente privato e canale/gruppo)
+    if not is_authorized(update):
+        await update.message.reply_text("❌ Solo l'amministratore può usare questo comando.")
+        return
+    
+    args = context.args if context.args else []
+    requeue = bool(args) and args[0].lower() == "requeue"
+    if requeue:
+        args = args[1:]
+    
+    try:
+        parsed = _parse_failed_args(args)
+    except ValueError as e:
+        await update.message.reply_text(
+            f"❌ **Argomenti non validi**\n\n"
+            f"{e}\n\n"
+            f"Periodo: `24h`, `7d`, `YYYY-MM-DD`, `YYYY-MM-DD..YYYY-MM-DD`",
+            parse_mode='Markdown'
+        )
+        return
+    
+    try:
+        if requeue:
+            requeued = await requeue_failed_notifications(
+                event_type=parsed["event_type"],
+                since=parsed["since"],
+                until=parsed["until"]
+            )
+            await update.message.reply_text(
+                f"🔁 **{requeued} notifiche rimesse in coda**\n\n"
+                f"Il worker le invierà nei prossimi cicli (tentativi azzerati)."
+            )
+            return
+        
+        rows, total = await list_failed_notifications(
+            page=parsed["page"],
+            page_size=FAILED_PAGE_SIZE,
+            event_type=parsed["event_type"],
+            since=parsed["since"],
+            until=parsed["until"]
+        )
+        await update.message.reply_text(
+            format_failed_page(
+                rows, total, parsed["page"], FAILED_PAGE_SIZE,
+                filter_args=" ".join(parsed["filter_args"])
+            ),
+            parse_mode='Markdown'
+        )
+    except Exception as e:
+        logger.error(f"Errore comando /failed: {e}", exc_info=True)
+        await update.message.reply_text(
+            f"❌ **Errore durante il recupero delle notifiche fallite**\n\n"
+            f"Errore: {str(e)[:200]}"
+        )
+
+
+def _parse_sample_rate(value: str) -> float:
+    """Campionamento come frazione (0.1) o percentuale (10%)"""
+    if value.endswith("%"):
+        rate = float(value[:-1]) / 100
+    else:
+        rate = float(value)
+    if not 0 < rate <= 1:
+        raise ValueError(f"Campionamento fuori intervallo: {value}")
+    return rate
+
+
+async def trace_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Comando /trace - tracer campionato degli update ricevuti.
+    
+    /trace [N] - ultimi N update registrati (default 20)
+    /trace on [campionamento] - attiva (es. 0.1 o 10%, default 100%)
+    /trace off - disattiva
+    /trace chat <chat_id ...>|all - filtra per chat
+    /trace clear - svuota il buffer
+    """
+    # Verifica autorizzazione (supporta utente privato e canale/gruppo)
+    if not is_authorized(update):
+        await update.message.reply_text("❌ Solo l'amministratore può usare questo comando.")
+        return
+    
+    args = context.args if context.args else []
+    action = args[0].lower() if args else ""
+    
+    try:
+        if action == "on":
+            update_tracer.configure(sample_rate=_parse_sample_rate(args[1]) if len(args) > 1 else 1.0)
+        elif action == "off":
+            update_tracer.configure(sample_rate=0)
+        elif action == "chat":
+            if len(args) < 2 or args[1].lower() == "all":
+                update_tracer.configure(chat_ids=set())
+            else:
+                update_tracer.configure(chat_ids={int(chat_id) for chat_id in args[1:]})
+        elif action == "clear":
+            update_tracer.clear()
+        elif action and not action.isdigit():
+            raise ValueError(f"Azione non riconosciuta: {args[0]}")
+    except ValueError as e:
+        await update.message.reply_text(
+            f"❌ {e}\n\n"
+            f"Uso: /trace [N] | on [0.1|10%] | off | chat <chat_id ...>|all | clear"
+        )
+        return
+    
+    limit = int(action) if action.isdigit() else 20
+    await update.message.reply_text(format_trace(update_tracer, limit=limit))
+
+
 def parse_filename_for_upload(filename: str) -> Optional[Tuple[Optional[int], str]]:
     """
     Estrae telegram_id (opzionale) e business_name dal nome del file CSV.
@@ -691,7 +842,7 @@ async def upload_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     # Se c'è un documento, processalo come CSV
-    logger.info(f"[UPLOAD_CMD] Comando /upload ricevuto con documento")
+    logger.info("[UPLOAD_CMD] Comando /upload ricevuto con documento")
     await handle_csv_upload(update, context)
 
 
@@ -700,45 +851,32 @@ async def handle_csv_upload(update: Update, context: ContextTypes.DEFAULT_TYPE):
     Gestisce upload file CSV nel gruppo admin.
     
     Analizza ogni messaggio nel gruppo. Se è un file CSV con nome valido (contiene telegram_id e business_name),
-    lo scarica e lo invia al processor per upload e creazione tabelle.
+    lo aggiunge alla coda upload: download, validazione e invio al processor avvengono in background
+    (vedi upload_queue), aggiornando il messaggio di stato ad ogni stage.
     """
-    # Log per debug - logga SEMPRE per vedere se riceve update
-    chat_id = update.effective_chat.id if update.effective_chat else None
-    user_id = update.effective_user.id if update.effective_user else None
-    admin_chat_id = os.getenv('ADMIN_CHAT_ID')
-    
-    logger.info(f"[CSV_UPLOAD] Update ricevuto - chat_id: {chat_id}, user_id: {user_id}, message: {update.message is not None}, document: {update.message.document if update.message else None}")
-    logger.info(f"[CSV_UPLOAD] ADMIN_CHAT_ID configurato: {admin_chat_id}")
-    
-    # Verifica autorizzazione (deve essere nel gruppo admin configurato)
-    authorized = is_authorized(update)
-    logger.info(f"[CSV_UPLOAD] Autorizzazione: {authorized} (chat_id match: {str(chat_id) == str(admin_chat_id)})")
-    
-    if not authorized:
-        logger.warning(f"[CSV_UPLOAD] Messaggio non autorizzato - chat_id: {chat_id}, ADMIN_CHAT_ID: {admin_chat_id}")
+    # Filtri economici prima di qualsiasi log: nei gruppi admin passano molti documenti
+    # non CSV. Per diagnosticare gli update ricevuti usare /trace.
+    if not is_authorized(update):
+        logger.debug(
+            "[CSV_UPLOAD] Documento da chat non autorizzata ignorato (chat_id: %s)",
+            update.effective_chat.id if update.effective_chat else None
+        )
         return  # Ignora messaggi non autorizzati
     
-    # Verifica che ci sia un messaggio con documento
-    if not update.message:
-        logger.info("[CSV_UPLOAD] Nessun messaggio nell'update")
-        return
-    
-    if not update.message.document:
-        logger.info("[CSV_UPLOAD] Nessun documento nel messaggio")
+    if not update.message or not update.message.document:
         return
     
     document = update.message.document
     filename = document.file_name or ""
     
-    logger.info(f"[CSV_UPLOAD] File ricevuto: {filename}, mime_type: {document.mime_type}, file_id: {document.file_id}")
-    
     # Verifica che sia un file CSV
     if not filename.lower().endswith('.csv'):
-        logger.info(f"[CSV_UPLOAD] File non CSV ignorato: {filename}")
+        logger.debug("[CSV_UPLOAD] File non CSV ignorato: %s", filename)
         return
     
+    logger.info("[CSV_UPLOAD] File ricevuto: %s, mime_type: %s, file_id: %s", filename, document.mime_type, document.file_id)
+    
     # Estrai telegram_id (opzionale) e business_name dal nome file
-    logger.info(f"[CSV_UPLOAD] Parsing nome file: {filename}")
     parsed = parse_filename_for_upload(filename)
     if not parsed:
         error_msg = (
@@ -758,105 +896,46 @@ async def handle_csv_upload(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     telegram_id, business_name = parsed
-    logger.info(f"[CSV_UPLOAD] Parsing completato - telegram_id: {telegram_id or 'N/A'}, business_name: {business_name}")
+    logger.info("[CSV_UPLOAD] Accodamento file: %s (telegram_id: %s, business_name: %s)", filename, telegram_id or 'N/A', business_name)
     
-    # Notifica inizio elaborazione
-    logger.info(f"[CSV_UPLOAD] Inizio elaborazione file: {filename}")
+    # Notifica presa in carico (il messaggio viene aggiornato dal worker upload ad ogni stage)
     status_msg = await update.message.reply_text(
         f"⏳ **Elaborazione file CSV**\n\n"
         f"📁 File: `{filename}`\n"
         f"👤 Telegram ID: `{telegram_id}`\n"
         f"🏢 Business: `{business_name}`\n\n"
-        f"Scaricamento file...",
+        f"In coda per l'elaborazione...",
         parse_mode='Markdown'
     )
     
     try:
-        # Scarica file
-        logger.info(f"[CSV_UPLOAD] Download file da Telegram - file_id: {document.file_id}")
-        file_obj = await context.bot.get_file(document.file_id)
-        file_bytes = await file_obj.download_as_bytearray()
-        
-        logger.info(f"[CSV_UPLOAD] File scaricato con successo: {filename}, size: {len(file_bytes)} bytes")
-        
-        # Prepara richiesta per processor
-        file_content_b64 = base64.b64encode(file_bytes).decode('utf-8')
-        
-        json_data = {
-            'business_name': business_name,
-            'file_content_base64': file_content_b64,
-            'mode': 'add',  # Default: aggiungi, non sostituisce
-            'source': 'admin_bot'  # Indica che arriva dall'admin bot
-        }
-        
-        # Aggiungi telegram_id solo se presente
-        if telegram_id:
-            json_data['telegram_id'] = telegram_id
-        
-        url_json = f"{PROCESSOR_API_URL}/admin/insert-inventory-json"
-        
-        logger.info(f"[CSV_UPLOAD] Invio a processor: {url_json}")
-        logger.info(f"[CSV_UPLOAD] Parametri: telegram_id={telegram_id or 'N/A'}, business_name={business_name}")
+        job_id = await enqueue_upload_job(
+            file_id=document.file_id,
+            file_unique_id=document.file_unique_id,
+            filename=filename,
+            telegram_id=telegram_id,
+            business_name=business_name,
+            chat_id=status_msg.chat_id,
+            status_message_id=status_msg.message_id
+        )
         
-        # Invia al processor
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            response = await client.post(url_json, json=json_data)
-            
-            if response.status_code == 200:
-                result = response.json()
-                
-                saved_count = result.get('saved_wines', 0)
-                error_count = result.get('error_count', 0)
-                total_wines = result.get('total_wines', 0)
-                tables_created = result.get('tables_created', [])
-                
-                user_id = result.get('user_id', 'N/A')
-                telegram_id_display = telegram_id if telegram_id else 'N/A (nuovo utente)'
-                
-                success_msg = (
-                    f"✅ **Upload Completato**\n\n"
-                    f"📁 File: `{filename}`\n"
-                    f"👤 User ID: `{user_id}`\n"
-                    f"📱 Telegram ID: `{telegram_id_display}`\n"
-                    f"🏢 Business: `{business_name}`\n\n"
-                    f"📊 **Risultati:**\n"
-                    f"• Vini totali: {total_wines}\n"
-                    f"• Vini salvati: {saved_count}\n"
-                    f"• Errori: {error_count}\n"
-                )
-                
-                if tables_created:
-                    success_msg += f"\n📋 Tabelle create: {', '.join(tables_created)}"
-                
-                await status_msg.edit_text(success_msg, parse_mode='Markdown')
-                
-            elif response.status_code == 404:
-                error_msg = (
-                    f"❌ **Endpoint non disponibile**\n\n"
-                    f"L'endpoint JSON non è ancora disponibile sul processor.\n"
-                    f"Verifica che il deploy sia completato.\n\n"
-                    f"URL: `{url_json}`"
+        if job_id is None:
+            # Stesso file già in coda o in elaborazione (doppio invio)
+            existing_job = await get_upload_job_by_file(document.file_unique_id)
+            existing_info = ""
+            if existing_job:
+                existing_info = (
+                    f"\n\nStato: `{existing_job['status']}`\n"
+                    f"Caricato il: {existing_job['created_at'].strftime('%Y-%m-%d %H:%M:%S')} UTC"
                 )
-                await status_msg.edit_text(error_msg, parse_mode='Markdown')
-                
-            else:
-                error_text = response.text[:500] if response.text else "Nessun dettaglio"
-                error_msg = (
-                    f"❌ **Errore durante l'upload**\n\n"
-                    f"HTTP {response.status_code}\n\n"
-                    f"Errore: `{error_text}`"
-                )
-                await status_msg.edit_text(error_msg, parse_mode='Markdown')
-                logger.error(f"[CSV_UPLOAD] Errore HTTP {response.status_code}: {error_text}")
-    
-    except httpx.TimeoutException:
-        error_msg = (
-            f"❌ **Timeout**\n\n"
-            f"Il processor non ha risposto in tempo.\n"
-            f"Il file potrebbe essere troppo grande o il server potrebbe essere sovraccarico."
-        )
-        await status_msg.edit_text(error_msg, parse_mode='Markdown')
-        logger.error(f"[CSV_UPLOAD] Timeout durante upload file {filename}")
+            await status_msg.edit_text(
+                f"⚠️ **File già caricato**\n\n"
+                f"📁 File: `{filename}`\n\n"
+                f"Questo file è già in coda o in elaborazione e non verrà processato due volte.\n"
+                f"Potrai ricaricarlo quando l'elaborazione in corso sarà terminata."
+                f"{existing_info}",
+                parse_mode='Markdown'
+            )
     
     except Exception as e:
         error_msg = (
@@ -864,7 +943,7 @@ async def handle_csv_upload(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"Errore: `{str(e)[:300]}`"
         )
         await status_msg.edit_text(error_msg, parse_mode='Markdown')
-        logger.error(f"[CSV_UPLOAD] Errore durante upload file {filename}: {e}", exc_info=True)
+        logger.error(f"[CSV_UPLOAD] Errore accodamento file {filename}: {e}", exc_info=True)
 
 
 async def start_admin_cmd(update, context):
@@ -908,39 +987,36 @@ def setup_telegram_app(bot_token: str) -> Application:
     
     logger.info("Configurazione Telegram bot...")
     
-    # Crea applicazione
-    app = Application.builder().token(bot_token).build()
-    
-    # Handler di debug per vedere TUTTI i messaggi (solo logging, non blocca)
-    async def debug_all_messages(update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Debug: logga tutti i messaggi ricevuti"""
-        if update.message:
-            chat_id = update.effective_chat.id if update.effective_chat else None
-            has_document = update.message.document is not None
-            has_text = update.message.text is not None
-            filename = update.message.document.file_name if update.message.document else None
-            logger.info(f"[DEBUG_ALL] Messaggio ricevuto - chat_id: {chat_id}, has_document: {has_document}, has_text: {has_text}, filename: {filename}")
-    
-    # Handler di debug per TUTTI i messaggi (bassa priorità, solo logging)
-    app.add_handler(MessageHandler(
-        filters.ALL,
-        debug_all_messages
-    ), group=-1)  # group=-1 per eseguirlo per ultimo, dopo tutti gli altri handler
+    # Crea applicazione: update elaborati in parallelo (limite ADMIN_MAX_CONCURRENT_UPDATES),
+    # upload della stessa chat in ordine di arrivo
+    app = (
+        Application.builder()
+        .token(bot_token)
+        .base_url(f"{TELEGRAM_API_BASE_URL}/bot")
+        .base_file_url(f"{TELEGRAM_API_BASE_URL}/file/bot")
+        .concurrent_updates(ChatOrderedUpdateProcessor(MAX_CONCURRENT_UPDATES))
+        .build()
+    )
     
     # IMPORTANTE: Handler per file CSV deve essere PRIMA dei comandi per evitare conflitti
     # Handler per file CSV (documenti) - analizza ogni documento inviato nel gruppo
     app.add_handler(MessageHandler(
         filters.Document.ALL,
-        handle_csv_upload
+        instrumented("csv_upload")(handle_csv_upload)
     ))
     
-    # Aggiungi handler per comandi
-    app.add_handler(CommandHandler("start", start_admin_cmd))
-    app.add_handler(CommandHandler("info", info_cmd))
-    app.add_handler(CommandHandler("users", users_cmd))
-    app.add_handler(CommandHandler("all", all_cmd))
-    app.add_handler(CommandHandler("report", report_cmd))
-    app.add_handler(CommandHandler("upload", upload_cmd))  # Comando /upload per file CSV
+    # Aggiungi handler per comandi (durata misurata per comando)
+    app.add_handler(CommandHandler("start", instrumented("start")(start_admin_cmd)))
+    app.add_handler(CommandHandler("info", instrumented("info")(info_cmd)))
+    app.add_handler(CommandHandler("users", instrumented("users")(users_cmd)))
+    app.add_handler(CommandHandler("all", instrumented("all")(all_cmd)))
+    app.add_handler(CommandHandler("report", instrumented("report")(report_cmd)))
+    app.add_handler(CommandHandler("upload", instrumented("upload")(upload_cmd)))  # Comando /upload per file CSV
+    app.add_handler(CommandHandler("stats", instrumented("stats")(stats_cmd)))
+    app.add_handler(CommandHandler("digest", instrumented("digest")(digest_cmd)))
+    app.add_handler(CommandHandler("lag", instrumented("lag")(lag_cmd)))
+    app.add_handler(CommandHandler("failed", instrumented("failed")(failed_cmd)))
+    app.add_handler(CommandHandler("trace", instrumented("trace")(trace_cmd)))
     
     # Handler per comandi numerici (telegram_id) - cattura messaggi che iniziano con / seguito da solo numeri
     async def handle_numeric_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -961,9 +1037,9 @@ def setup_telegram_app(bot_token: str) -> Application:
     # Cattura messaggi che iniziano con / seguito da solo numeri (non lettere)
     app.add_handler(MessageHandler(
         filters.TEXT & filters.Regex(r'^/\d+(\s|$)'), 
-        handle_numeric_command
+        instrumented("user_message")(handle_numeric_command)
     ))
     
-    logger.info("✅ Telegram bot configurato con comandi /start, /info, /users, /all, /report, /<telegram_id> e upload CSV")
+    logger.info("✅ Telegram bot configurato con comandi /start, /info, /users, /all, /report, /stats, /failed, /trace, /<telegram_id> e upload CSV")
     
     return app
@@ -206,3 +206,55 @@ def format_batch_errors(
     message += f"\n📅 Timestamp: {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}"
     
     return message
+
+
+def _digest_line(event_type: str, telegram_id: int, payload: dict) -> str:
+    """Riga compatta di una notifica trattenuta (solo dati del payload, nessuna query utente)"""
+    if event_type == "onboarding_completed":
+        detail = payload.get("business_name") or "N/A"
+    elif event_type == "inventory_uploaded":
+        wines_saved = payload.get("wines_saved", payload.get("saved_count"))
+        detail = f"{payload.get('file_type', 'N/A')}, {wines_saved if wines_saved is not None else 'N/A'} vini"
+    elif event_type == "error":
+        detail = payload.get("error_code") or payload.get("source") or "errore"
+    else:
+        detail = ""
+    return f"• {telegram_id}" + (f" — {detail}" if detail else "")
+
+
+def format_quiet_hours_digest(notifications: list, max_lines: int = 30) -> str:
+    """
+    Formatta il digest delle notifiche trattenute durante le ore di silenzio.
+
+    Args:
+        notifications: lista di (event_type, telegram_id, payload, created_at)
+        max_lines: righe di dettaglio mostrate in totale
+    """
+    by_event_type = {}
+    for event_type, telegram_id, payload, created_at in notifications:
+        by_event_type.setdefault(event_type, []).append((telegram_id, payload, created_at))
+
+    created = [item[3] for item in notifications if item[3]]
+    period = ""
+    if created:
+        period = f"\n🕐 Periodo: {min(created).strftime('%d/%m %H:%M')} - {max(created).strftime('%H:%M')} UTC"
+
+    message = f"""🌙 **DIGEST ORE DI SILENZIO**
+
+📊 Notifiche trattenute: {len(notifications)}{period}
+"""
+
+    remaining = max_lines
+    for event_type, items in sorted(by_event_type.items(), key=lambda item: -len(item[1])):
+        message += f"\n`{event_type}`: {len(items)}\n"
+        shown = items[:max(remaining, 0)]
+        for telegram_id, payload, _ in shown:
+            message += _digest_line(event_type, telegram_id, payload or {}) + "\n"
+        remaining -= len(shown)
+        if len(items) > len(shown):
+            message += f"... e altri {len(items) - len(shown)}\n"
+
+    message += f"\n📅 Timestamp: {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}"
+
+    # Limite Telegram 4096 caratteri
+    return message if len(message) <= 4000 else message[:4000] + "\n…"
@@ -0,0 +1,166 @@
+"""
+Elaborazione concorrente degli update Telegram con ordinamento per chat
+"""
+import os
+import time
+import asyncio
+import logging
+from typing import Any, Awaitable, Dict, List, Optional
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+from utils.metrics import registry
+from update_tracer import update_tracer
+
+logger = logging.getLogger(__name__)
+
+# Update elaborati contemporaneamente (gli altri attendono uno slot)
+MAX_CONCURRENT_UPDATES = int(os.getenv("ADMIN_MAX_CONCURRENT_UPDATES", 8))
+
+# Attesa del lock della chat oltre la quale viene loggato un warning (secondi)
+QUEUE_DELAY_WARN_SEC = float(os.getenv("ADMIN_UPDATE_QUEUE_WARN_SEC", 2))
+
+# Metriche elaborazione update
+UPDATE_QUEUE_DELAY = registry.histogram(
+    "admin_bot_update_queue_delay_seconds",
+    "Attesa degli update Telegram (lock della chat) prima dell'esecuzione degli handler"
+)
+UPDATE_HANDLER_DURATION = registry.histogram(
+    "admin_bot_update_handler_duration_seconds",
+    "Durata complessiva degli handler per update Telegram"
+)
+UPDATES_IN_FLIGHT = registry.gauge(
+    "admin_bot_updates_in_flight",
+    "Update Telegram per stato (running, waiting = in attesa del lock della chat)",
+    ["state"]
+)
+
+
+def _ordering_key(update: object) -> Optional[int]:
+    """
+    Chiave di ordinamento: gli update con la stessa chiave vengono elaborati
+    uno alla volta nell'ordine di arrivo. None = nessun vincolo.
+
+    Oggi solo i documenti (upload CSV) sono ordinati per chat.
+    """
+    if not isinstance(update, Update):
+        return None
+    message = update.effective_message
+    if message is not None and message.document is not None and update.effective_chat:
+        return update.effective_chat.id
+    return None
+
+
+def _close_unstarted(coroutine: Awaitable[Any]):
+    """Chiude la coroutine degli handler mai avviata (evita 'coroutine was never awaited')"""
+    if asyncio.iscoroutine(coroutine):
+        coroutine.close()
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """
+    Update processor con limite di concorrenza e ordinamento per chat.
+
+    Il limite è applicato da process_update di PTB (slot prima di
+    do_process_update); qui si prende il lock della chat e si misurano
+    per ogni update l'attesa del lock (arrivo allo slot -> inizio handler)
+    e la durata degli handler.
+    """
+
+    def __init__(self, max_concurrent_updates: int = MAX_CONCURRENT_UPDATES):
+        super().__init__(max_concurrent_updates)
+        # chat_id -> [lock, update in attesa o in corso]
+        self._chat_locks: Dict[int, List[Any]] = {}
+
+        self.in_flight = 0
+        self.waiting = 0
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        """Slot di concorrenza già acquisito: lock della chat (se serve), poi handler misurati"""
+        received_at = time.perf_counter()
+        trace = update_tracer.record(update)
+        key = _ordering_key(update)
+
+        if key is None:
+            await self._measure(update, coroutine, received_at, trace)
+            return
+
+        entry = self._chat_locks.get(key)
+        if entry is None:
+            entry = self._chat_locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        self.waiting += 1
+        self._update_gauges()
+
+        try:
+            try:
+                await entry[0].acquire()
+            except BaseException:
+                # Annullato in attesa del lock: gli handler non partiranno
+                _close_unstarted(coroutine)
+                raise
+            finally:
+                self.waiting -= 1
+                self._update_gauges()
+
+            try:
+                await self._measure(update, coroutine, received_at, trace)
+            finally:
+                entry[0].release()
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                self._chat_locks.pop(key, None)
+
+    async def _measure(
+        self,
+        update: object,
+        coroutine: Awaitable[Any],
+        received_at: float,
+        trace: Optional[Dict[str, Any]] = None
+    ) -> None:
+        """Esegue gli handler registrando attesa e durata (anche nella voce del tracer)"""
+        started_at = time.perf_counter()
+        queue_delay = started_at - received_at
+        self.in_flight += 1
+        UPDATE_QUEUE_DELAY.observe(queue_delay)
+        self._update_gauges()
+
+        if queue_delay >= QUEUE_DELAY_WARN_SEC:
+            update_id = update.update_id if isinstance(update, Update) else None
+            logger.warning(
+                f"[UPDATES] Update {update_id} in attesa della chat per {queue_delay:.2f}s "
+                f"(in corso: {self.in_flight}, in attesa: {self.waiting})"
+            )
+
+        try:
+            await coroutine
+        finally:
+            duration = time.perf_counter() - started_at
+            self.in_flight -= 1
+            UPDATE_HANDLER_DURATION.observe(duration)
+            self._update_gauges()
+            if trace is not None:
+                trace["queue_delay"] = queue_delay
+                trace["duration"] = duration
+
+    def _update_gauges(self):
+        """Aggiorna gauge update in corso/in attesa"""
+        UPDATES_IN_FLIGHT.set(self.in_flight, state="running")
+        UPDATES_IN_FLIGHT.set(self.waiting, state="waiting")
+
+    async def initialize(self) -> None:
+        """Nessuna risorsa da inizializzare"""
+
+    async def shutdown(self) -> None:
+        """Nessuna risorsa da rilasciare"""
+
+    def stats(self) -> Dict[str, Any]:
+        """Riepilogo concorrenza e latenze update"""
+        return {
+            "max_concurrent_updates": self.max_concurrent_updates,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "ordered_chats": len(self._chat_locks),
+            "queue_delay": UPDATE_QUEUE_DELAY.merged().snapshot(),
+            "handler_duration": UPDATE_HANDLER_DURATION.merged().snapshot(),
+        }
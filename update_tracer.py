@@ -0,0 +1,177 @@
+"""
+Tracer campionato degli update Telegram (ring buffer consultabile con /trace)
+"""
+import os
+import time
+import random
+import logging
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional, Set
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+# Frazione di update registrati (0 = tracer spento, 1 = tutti)
+TRACE_SAMPLE_RATE = float(os.getenv("ADMIN_TRACE_SAMPLE_RATE", 0))
+
+# Chat tracciate (vuoto = tutte), es. "-1001234567890,927230913"
+TRACE_CHAT_IDS = os.getenv("ADMIN_TRACE_CHAT_IDS", "")
+
+# Update conservati nel ring buffer
+TRACE_BUFFER_SIZE = int(os.getenv("ADMIN_TRACE_BUFFER_SIZE", 200))
+
+
+def _parse_chat_ids(value: str) -> Set[int]:
+    """Lista chat_id separati da virgola (valori non numerici ignorati)"""
+    chat_ids = set()
+    for part in value.split(","):
+        part = part.strip()
+        if part.lstrip("-").isdigit():
+            chat_ids.add(int(part))
+    return chat_ids
+
+
+def _describe_update(update: Update) -> Dict[str, Any]:
+    """Riepilogo compatto dell'update (senza testo dei messaggi, solo comandi)"""
+    message = update.effective_message
+    kind = "other"
+    detail = None
+
+    if update.callback_query is not None:
+        kind = "callback"
+    elif message is not None:
+        if message.document is not None:
+            kind = "document"
+            detail = message.document.file_name
+        elif message.text:
+            if message.text.startswith("/"):
+                kind = "command"
+                detail = message.text.split(maxsplit=1)[0][:64]
+            else:
+                kind = "text"
+        else:
+            kind = "message"
+
+    return {
+        "update_id": update.update_id,
+        "chat_id": update.effective_chat.id if update.effective_chat else None,
+        "user_id": update.effective_user.id if update.effective_user else None,
+        "kind": kind,
+        "detail": detail,
+    }
+
+
+class UpdateTracer:
+    """
+    Registra un campione degli update ricevuti in un ring buffer.
+
+    Sostituisce il logging incondizionato di ogni update: a tracer spento il
+    costo per update è un confronto; a tracer acceso nessuna riga di log,
+    solo un dict nel buffer consultabile con /trace.
+    """
+
+    def __init__(
+        self,
+        sample_rate: float = TRACE_SAMPLE_RATE,
+        chat_ids: Optional[Set[int]] = None,
+        buffer_size: int = TRACE_BUFFER_SIZE
+    ):
+        self.sample_rate = sample_rate
+        self.chat_ids: Set[int] = set(chat_ids or ())
+        self._buffer: Deque[Dict[str, Any]] = deque(maxlen=buffer_size)
+        self.recorded = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0
+
+    def configure(self, sample_rate: Optional[float] = None, chat_ids: Optional[Set[int]] = None):
+        """Modifica a runtime campionamento e filtro chat (None = invariato)"""
+        if sample_rate is not None:
+            self.sample_rate = min(max(sample_rate, 0.0), 1.0)
+        if chat_ids is not None:
+            self.chat_ids = set(chat_ids)
+        logger.info(
+            "[TRACE] Tracer %s (campionamento %.0f%%, chat: %s)",
+            "attivo" if self.enabled else "spento",
+            self.sample_rate * 100,
+            ", ".join(str(c) for c in sorted(self.chat_ids)) or "tutte"
+        )
+
+    def record(self, update: object) -> Optional[Dict[str, Any]]:
+        """
+        Registra l'update se campionato.
+
+        Returns:
+            Voce del buffer (da completare con i tempi di elaborazione) o None
+        """
+        if self.sample_rate <= 0 or not isinstance(update, Update):
+            return None
+
+        if self.chat_ids:
+            chat = update.effective_chat
+            if chat is None or chat.id not in self.chat_ids:
+                return None
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return None
+
+        entry = _describe_update(update)
+        entry["received_at"] = time.time()
+        entry["queue_delay"] = None
+        entry["duration"] = None
+        self._buffer.append(entry)
+        self.recorded += 1
+        return entry
+
+    @property
+    def buffer_size(self) -> int:
+        return self._buffer.maxlen
+
+    def entries(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Ultimi update registrati, dal più recente"""
+        items = list(self._buffer)
+        items.reverse()
+        return items[:limit] if limit else items
+
+    def clear(self):
+        """Svuota il buffer"""
+        self._buffer.clear()
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+
+def format_trace(tracer: UpdateTracer, limit: int = 20) -> str:
+    """Dump testuale del buffer (senza Markdown: i nomi file possono contenere _ e *)"""
+    status = (
+        f"attivo, campionamento {tracer.sample_rate * 100:.0f}%"
+        if tracer.enabled else "spento"
+    )
+    chats = ", ".join(str(c) for c in sorted(tracer.chat_ids)) or "tutte"
+    lines = [
+        f"🔎 Update tracer: {status}",
+        f"Chat: {chats} | buffer {len(tracer)}/{tracer.buffer_size} | registrati {tracer.recorded}",
+        ""
+    ]
+
+    entries = tracer.entries(limit)
+    if not entries:
+        lines.append("Nessun update registrato.")
+
+    for entry in entries:
+        timestamp = datetime.fromtimestamp(entry["received_at"]).strftime("%H:%M:%S")
+        line = f"{timestamp} #{entry['update_id']} chat {entry['chat_id']} user {entry['user_id']} {entry['kind']}"
+        if entry["detail"]:
+            line += f" {entry['detail']}"
+        if entry["duration"] is not None:
+            line += f" | coda {entry['queue_delay'] * 1000:.0f}ms, handler {entry['duration'] * 1000:.0f}ms"
+        lines.append(line)
+
+    # Limite Telegram 4096 caratteri
+    text = "\n".join(lines)
+    return text if len(text) <= 4000 else text[:4000] + "\n…"
+
+
+# Tracer del processo (configurato da env, modificabile con /trace)
+update_tracer = UpdateTracer(chat_ids=_parse_chat_ids(TRACE_CHAT_IDS))
@@ -0,0 +1,463 @@
+"""
+Coda job upload CSV con elaborazione in background per admin bot
+"""
+import os
+import asyncio
+import base64
+import json
+import logging
+import httpx
+from typing import Optional, Dict, Any, List
+from db import get_db_pool
+from processor_client import get_processor_client, ProcessorUnavailableError
+from utils.loop_monitor import current_operation
+
+logger = logging.getLogger(__name__)
+
+# Numero massimo di upload elaborati in parallelo
+UPLOAD_CONCURRENCY = int(os.getenv("ADMIN_UPLOAD_CONCURRENCY", 2))
+
+# Durata della presa in carico di un job upload, rinnovata durante l'elaborazione (default: 300 secondi).
+# Un job 'processing' con lease scaduto (istanza terminata) viene ripreso da un altro worker
+UPLOAD_LEASE_SEC = float(os.getenv("ADMIN_UPLOAD_LEASE_SEC", 300))
+
+# Polling interval coda upload (secondi) - i job nuovi svegliano subito i worker
+UPLOAD_POLL_INTERVAL = 5
+
+# Timeout chiamata processor per insert inventario (secondi)
+UPLOAD_PROCESSOR_TIMEOUT = 120.0
+
+# Stage di elaborazione, nell'ordine in cui vengono completati
+UPLOAD_STAGES = [
+    ("downloaded", "File scaricato"),
+    ("validated", "File validato"),
+    ("submitted", "Inviato al processor"),
+    ("processed", "Elaborato dal processor"),
+]
+
+# Evento per svegliare i worker quando arriva un nuovo job
+_wakeup_event: Optional[asyncio.Event] = None
+
+
+def _get_wakeup_event() -> asyncio.Event:
+    """Evento condiviso tra i worker upload (creato nel loop corrente)"""
+    global _wakeup_event
+    if _wakeup_event is None:
+        _wakeup_event = asyncio.Event()
+    return _wakeup_event
+
+
+async def enqueue_upload_job(
+    file_id: str,
+    file_unique_id: str,
+    filename: str,
+    telegram_id: Optional[int],
+    business_name: str,
+    chat_id: int,
+    status_message_id: int
+) -> Optional[str]:
+    """
+    Aggiunge un job upload alla coda persistita.
+
+    Returns:
+        ID del job creato, oppure None se lo stesso file (file_unique_id)
+        è già in coda o in elaborazione (doppio invio accidentale)
+    """
+    pool = await get_db_pool()
+
+    async with pool.acquire() as conn:
+        job_id = await conn.fetchval("""
+            INSERT INTO admin_upload_jobs (
+                file_id, file_unique_id, filename, telegram_id,
+                business_name, chat_id, status_message_id
+            )
+            VALUES ($1, $2, $3, $4, $5, $6, $7)
+            ON CONFLICT (file_unique_id) WHERE status IN ('queued', 'processing') DO NOTHING
+            RETURNING id
+        """, file_id, file_unique_id, filename, telegram_id,
+            business_name, chat_id, status_message_id)
+
+    if job_id is None:
+        logger.info(f"[UPLOAD_QUEUE] Upload duplicato ignorato: {filename} (file_unique_id={file_unique_id})")
+        return None
+
+    logger.info(f"[UPLOAD_QUEUE] Job {job_id} in coda: {filename}")
+    _get_wakeup_event().set()
+    return str(job_id)
+
+
+async def get_upload_job_by_file(file_unique_id: str) -> Optional[Dict[str, Any]]:
+    """Recupera il job attivo (in coda o in elaborazione) per un file"""
+    pool = await get_db_pool()
+
+    async with pool.acquire() as conn:
+        row = await conn.fetchrow("""
+            SELECT id, created_at, status, stage, filename
+            FROM admin_upload_jobs
+            WHERE file_unique_id = $1
+            AND status IN ('queued', 'processing')
+        """, file_unique_id)
+
+    return dict(row) if row else None
+
+
+async def claim_upload_job() -> Optional[Dict[str, Any]]:
+    """
+    Prende in carico il job più vecchio (sicuro con più worker e più istanze):
+    in coda, oppure 'processing' con lease scaduto (istanza terminata durante
+    l'elaborazione). Job con lease valido restano all'istanza che li elabora.
+    """
+    pool = await get_db_pool()
+
+    async with pool.acquire() as conn:
+        row = await conn.fetchrow("""
+            UPDATE admin_upload_jobs
+            SET status = 'processing',
+                stage = CASE WHEN status = 'processing' THEN NULL ELSE stage END,
+                locked_until = now() + make_interval(secs => $1),
+                updated_at = now()
+            WHERE id = (
+                SELECT id
+                FROM admin_upload_jobs
+                WHERE status = 'queued'
+                OR (status = 'processing' AND (locked_until IS NULL OR locked_until < now()))
+                ORDER BY created_at ASC
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING *
+        """, UPLOAD_LEASE_SEC)
+
+    return dict(row) if row else None
+
+
+async def update_upload_job(
+    job_id,
+    status: Optional[str] = None,
+    stage: Optional[str] = None,
+    result: Optional[Dict[str, Any]] = None,
+    error: Optional[str] = None
+) -> None:
+    """Aggiorna stato/stage di un job upload"""
+    pool = await get_db_pool()
+
+    async with pool.acquire() as conn:
+        await conn.execute("""
+            UPDATE admin_upload_jobs
+            SET status = COALESCE($2, status),
+                stage = COALESCE($3, stage),
+                result = COALESCE($4::jsonb, result),
+                error = COALESCE($5, error),
+                locked_until = CASE WHEN $2 IS NULL OR $2 = 'processing' THEN locked_until END,
+                updated_at = now()
+            WHERE id = $1
+        """, job_id, status, stage, json.dumps(result) if result is not None else None, error)
+
+
+async def renew_upload_lease(job_id) -> None:
+    """Rinnova il lease di un job in elaborazione"""
+    pool = await get_db_pool()
+
+    async with pool.acquire() as conn:
+        await conn.execute("""
+            UPDATE admin_upload_jobs
+            SET locked_until = now() + make_interval(secs => $2)
+            WHERE id = $1
+            AND status = 'processing'
+        """, job_id, UPLOAD_LEASE_SEC)
+
+
+async def _keep_lease(job_id) -> None:
+    """Rinnova il lease ogni terzo della sua durata finché il job è in elaborazione"""
+    while True:
+        await asyncio.sleep(UPLOAD_LEASE_SEC / 3)
+        try:
+            await renew_upload_lease(job_id)
+        except Exception as e:
+            logger.warning(f"[UPLOAD_QUEUE] Rinnovo lease job {job_id} fallito: {e}")
+
+
+def validate_csv_bytes(file_bytes: bytes) -> Optional[str]:
+    """
+    Validazione minima del CSV prima dell'invio al processor.
+
+    Returns:
+        None se valido, altrimenti messaggio di errore
+    """
+    if not file_bytes:
+        return "File vuoto"
+
+    try:
+        text = bytes(file_bytes).decode('utf-8-sig')
+    except UnicodeDecodeError:
+        text = bytes(file_bytes).decode('latin-1')
+
+    lines = [line for line in text.splitlines() if line.strip()]
+    if not lines:
+        return "File vuoto"
+
+    header = lines[0]
+    if not any(sep in header for sep in (',', ';', '\t')):
+        return "Intestazione CSV non riconosciuta (separatore mancante)"
+
+    if len(lines) < 2:
+        return "Il file contiene solo l'intestazione"
+
+    return None
+
+
+def _format_progress(job: Dict[str, Any], completed_stage: str, detail: Optional[str] = None) -> str:
+    """Formatta messaggio di avanzamento con gli stage completati"""
+    stage_names = [name for name, _ in UPLOAD_STAGES]
+    completed_index = stage_names.index(completed_stage)
+
+    message = (
+        f"⏳ **Elaborazione file CSV**\n\n"
+        f"📁 File: `{job['filename']}`\n"
+        f"👤 Telegram ID: `{job['telegram_id']}`\n"
+        f"🏢 Business: `{job['business_name']}`\n\n"
+    )
+
+    for i, (_, label) in enumerate(UPLOAD_STAGES):
+        if i <= completed_index:
+            message += f"✅ {label}\n"
+        elif i == completed_index + 1:
+            message += f"⏳ {label}...\n"
+        else:
+            message += f"▫️ {label}\n"
+
+    if detail:
+        message += f"\n{detail}"
+
+    return message
+
+
+async def _edit_status(bot, job: Dict[str, Any], text: str) -> None:
+    """Aggiorna il messaggio di stato dell'upload (errori di edit non bloccano il job)"""
+    if not job.get("status_message_id"):
+        return
+
+    try:
+        await bot.edit_message_text(
+            chat_id=job["chat_id"],
+            message_id=job["status_message_id"],
+            text=text,
+            parse_mode='Markdown'
+        )
+    except Exception as e:
+        logger.warning(f"[UPLOAD_QUEUE] Impossibile aggiornare messaggio stato job {job['id']}: {e}")
+
+
+async def process_upload_job(bot, job: Dict[str, Any]) -> None:
+    """Elabora un job upload: download, validazione, invio al processor, esito"""
+    job_id = job["id"]
+    filename = job["filename"]
+    telegram_id = job["telegram_id"]
+    business_name = job["business_name"]
+    processor = get_processor_client()
+    url_json = processor.url("/admin/insert-inventory-json")
+
+    try:
+        # Stage 1: download da Telegram
+        file_obj = await bot.get_file(job["file_id"])
+        file_bytes = await file_obj.download_as_bytearray()
+        await update_upload_job(job_id, stage="downloaded")
+        await _edit_status(bot, job, _format_progress(job, "downloaded", f"📦 Dimensione: {len(file_bytes)} bytes"))
+        logger.info(f"[UPLOAD_QUEUE] Job {job_id} scaricato: {filename}, size: {len(file_bytes)} bytes")
+
+        # Stage 2: validazione
+        validation_error = validate_csv_bytes(file_bytes)
+        if validation_error:
+            await update_upload_job(job_id, status="failed", error=validation_error)
+            await _edit_status(bot, job, (
+                f"❌ **File CSV non valido**\n\n"
+                f"📁 File: `{filename}`\n\n"
+                f"Errore: {validation_error}"
+            ))
+            return
+        await update_upload_job(job_id, stage="validated")
+        await _edit_status(bot, job, _format_progress(job, "validated"))
+
+        # Stage 3: invio al processor
+        json_data = {
+            'business_name': business_name,
+            'file_content_base64': base64.b64encode(file_bytes).decode('utf-8'),
+            'mode': 'add',  # Default: aggiungi, non sostituisce
+            'source': 'admin_bot'  # Indica che arriva dall'admin bot
+        }
+
+        # Aggiungi telegram_id solo se presente
+        if telegram_id:
+            json_data['telegram_id'] = telegram_id
+
+        logger.info(f"[UPLOAD_QUEUE] Job {job_id} invio a processor: {url_json}")
+
+        request_task = asyncio.create_task(processor.post(
+            "/admin/insert-inventory-json",
+            json=json_data,
+            timeout=UPLOAD_PROCESSOR_TIMEOUT
+        ))
+        # Da qui il processor può aver ricevuto il file: allo shutdown il job resta sotto lease
+        job["stage"] = "submitted"
+        await update_upload_job(job_id, stage="submitted")
+        await _edit_status(bot, job, _format_progress(job, "submitted"))
+        response = await request_task
+
+        # Stage 4: esito processor
+        if response.status_code == 200:
+            result = response.json()
+
+            saved_count = result.get('saved_wines', 0)
+            error_count = result.get('error_count', 0)
+            total_wines = result.get('total_wines', 0)
+            tables_created = result.get('tables_created', [])
+
+            user_id = result.get('user_id', 'N/A')
+            telegram_id_display = telegram_id if telegram_id else 'N/A (nuovo utente)'
+
+            success_msg = (
+                f"✅ **Upload Completato**\n\n"
+                f"📁 File: `{filename}`\n"
+                f"👤 User ID: `{user_id}`\n"
+                f"📱 Telegram ID: `{telegram_id_display}`\n"
+                f"🏢 Business: `{business_name}`\n\n"
+                f"📊 **Risultati:**\n"
+                f"• Vini totali: {total_wines}\n"
+                f"• Vini salvati: {saved_count}\n"
+                f"• Errori: {error_count}\n"
+            )
+
+            if tables_created:
+                success_msg += f"\n📋 Tabelle create: {', '.join(tables_created)}"
+
+            await update_upload_job(job_id, status="done", stage="processed", result=result)
+            await _edit_status(bot, job, success_msg)
+            logger.info(f"[UPLOAD_QUEUE] Job {job_id} completato: {saved_count}/{total_wines} vini salvati")
+
+        elif response.status_code == 404:
+            await update_upload_job(job_id, status="failed", error="HTTP 404")
+            await _edit_status(bot, job, (
+                f"❌ **Endpoint non disponibile**\n\n"
+                f"L'endpoint JSON non è ancora disponibile sul processor.\n"
+                f"Verifica che il deploy sia completato.\n\n"
+                f"URL: `{url_json}`"
+            ))
+
+        else:
+            error_text = response.text[:500] if response.text else "Nessun dettaglio"
+            await update_upload_job(job_id, status="failed", error=f"HTTP {response.status_code}: {error_text}")
+            await _edit_status(bot, job, (
+                f"❌ **Errore durante l'upload**\n\n"
+                f"HTTP {response.status_code}\n\n"
+                f"Errore: `{error_text}`"
+            ))
+            logger.error(f"[UPLOAD_QUEUE] Job {job_id} errore HTTP {response.status_code}: {error_text}")
+
+    except ProcessorUnavailableError as e:
+        # Processor giù: il job torna in coda e verrà ripreso quando il circuito si richiude
+        await update_upload_job(job_id, status="queued", stage=None)
+        await _edit_status(bot, job, (
+            f"⚠️ **Processor non disponibile**\n\n"
+            f"📁 File: `{filename}`\n\n"
+            f"Il file resta in coda e verrà elaborato appena il processor torna raggiungibile.\n"
+            f"Dettaglio: {e}"
+        ))
+        logger.warning(f"[UPLOAD_QUEUE] Job {job_id} rimesso in coda: {e}")
+
+    except httpx.TimeoutException:
+        await update_upload_job(job_id, status="failed", error="Timeout processor")
+        await _edit_status(bot, job, (
+            "❌ **Timeout**\n\n"
+            "Il processor non ha risposto in tempo.\n"
+            "Il file potrebbe essere troppo grande o il server potrebbe essere sovraccarico."
+        ))
+        logger.error(f"[UPLOAD_QUEUE] Timeout durante upload file {filename} (job {job_id})")
+
+    except Exception as e:
+        await update_upload_job(job_id, status="failed", error=str(e)[:500])
+        await _edit_status(bot, job, (
+            f"❌ **Errore durante l'upload**\n\n"
+            f"Errore: `{str(e)[:300]}`"
+        ))
+        logger.error(f"[UPLOAD_QUEUE] Errore durante upload file {filename} (job {job_id}): {e}", exc_info=True)
+
+
+async def _release_unsubmitted(bot, job: Dict[str, Any]) -> None:
+    """
+    Shutdown: un job non ancora inviato al processor torna subito in coda
+    (nessun lease da attendere al riavvio). Dopo l'invio resta sotto lease:
+    il processor potrebbe averlo già elaborato.
+    """
+    if job.get("stage") in ("submitted", "processed"):
+        return
+    try:
+        await update_upload_job(job["id"], status="queued")
+        await _edit_status(bot, job, (
+            f"⏸️ **Riavvio in corso**\n\n"
+            f"📁 File: `{job['filename']}`\n\n"
+            f"Il file resta in coda e verrà elaborato al riavvio."
+        ))
+        logger.info(f"[UPLOAD_QUEUE] Shutdown: job {job['id']} restituito alla coda")
+    except Exception as e:
+        # Resta 'processing': ripreso alla scadenza del lease
+        logger.warning(f"[UPLOAD_QUEUE] Job {job['id']} non restituito alla coda allo shutdown: {e}")
+
+
+async def upload_worker(bot, worker_index: int):
+    """Loop worker upload: prende job dalla coda e li elabora uno alla volta"""
+    logger.info(f"[UPLOAD_QUEUE] Worker upload #{worker_index} avviato")
+    current_operation.set("upload")
+    wakeup_event = _get_wakeup_event()
+    processor = get_processor_client()
+
+    while True:
+        try:
+            # Processor non disponibile: lascia i job in coda senza prenderli in carico
+            if not processor.is_available():
+                await asyncio.sleep(UPLOAD_POLL_INTERVAL)
+                continue
+
+            job = await claim_upload_job()
+
+            if job is None:
+                # Coda vuota - attendi nuovo job o timeout polling
+                try:
+                    await asyncio.wait_for(wakeup_event.wait(), timeout=UPLOAD_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                wakeup_event.clear()
+                continue
+
+            logger.info(f"[UPLOAD_QUEUE] Worker #{worker_index} elabora job {job['id']}: {job['filename']}")
+            lease_task = asyncio.create_task(_keep_lease(job["id"]))
+            try:
+                await process_upload_job(bot, job)
+            except asyncio.CancelledError:
+                await _release_unsubmitted(bot, job)
+                raise
+            finally:
+                lease_task.cancel()
+                await asyncio.gather(lease_task, return_exceptions=True)
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"[UPLOAD_QUEUE] Errore nel worker upload #{worker_index}: {e}", exc_info=True)
+            await asyncio.sleep(UPLOAD_POLL_INTERVAL)
+
+
+async def start_upload_workers(bot) -> List[asyncio.Task]:
+    """
+    Avvia il pool di worker upload.
+
+    Args:
+        bot: Bot Telegram (per download file e modifica messaggi di stato)
+
+    Returns:
+        Lista task worker (da cancellare allo shutdown)
+    """
+    logger.info(f"[UPLOAD_QUEUE] Avvio {UPLOAD_CONCURRENCY} worker upload")
+    return [
+        asyncio.create_task(upload_worker(bot, i + 1), name=f"upload-worker-{i + 1}")
+        for i in range(UPLOAD_CONCURRENCY)
+    ]
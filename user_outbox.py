@@ -0,0 +1,504 @@
+"""
+Outbox messaggi admin -> utenti (/<telegram_id>, /all) con invio in background:
+pacing per chat, retry via next_attempt_at ed esito sul messaggio di conferma
+"""
+import os
+import time
+import uuid
+import asyncio
+import logging
+import httpx
+from typing import Optional, Dict, Any, List, Sequence
+from db import get_db_pool
+from notifier import TELEGRAM_API_BASE_URL
+from utils.backoff import calculate_backoff
+from utils.loop_monitor import current_operation
+from utils.metrics import registry
+from utils.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Token del telegram-ai-bot per inviare messaggi agli utenti
+TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+
+# Intervallo minimo tra due messaggi alla stessa chat (Telegram: ~1 msg/s per chat)
+USER_CHAT_INTERVAL_SEC = float(os.getenv("ADMIN_USER_MESSAGE_CHAT_INTERVAL_SEC", 1.0))
+
+# Messaggi al secondo verso utenti in totale (Telegram: ~30 msg/s per bot)
+USER_SEND_RATE_PER_SEC = float(os.getenv("ADMIN_USER_MESSAGE_RATE_PER_SEC", 25))
+
+# Tentativi dopo il primo per errori temporanei (429, 5xx, rete)
+USER_MAX_RETRIES = int(os.getenv("ADMIN_USER_MESSAGE_MAX_RETRIES", 5))
+
+# Durata della presa in carico dei messaggi in invio, rinnovata dal worker (default: 120 secondi).
+# Un messaggio 'sending' con lease scaduto (istanza terminata) viene ripreso da un altro worker
+USER_MESSAGE_LEASE_SEC = float(os.getenv("ADMIN_USER_MESSAGE_LEASE_SEC", 120))
+
+# Base backoff retry (secondi): 5s, 10s, 20s, ...
+USER_RETRY_BASE_SEC = 5
+
+# Messaggi presi per claim e polling interval (i nuovi messaggi svegliano subito il worker)
+OUTBOX_CLAIM_SIZE = 50
+OUTBOX_POLL_INTERVAL = 5
+
+# Avanzamento di un /all aggiornato al massimo ogni N secondi (più l'esito finale)
+PROGRESS_EDIT_INTERVAL_SEC = 5.0
+
+USER_MESSAGES = registry.counter(
+    "admin_bot_user_messages_total",
+    "Messaggi admin -> utenti per esito (sent, retry, failed, paced)",
+    ["outcome"]
+)
+
+# Evento per svegliare il worker quando arriva un nuovo messaggio
+_wakeup_event: Optional[asyncio.Event] = None
+
+# Ultimo invio per chat (scade dopo USER_CHAT_INTERVAL_SEC: chat di nuovo libera)
+_chat_last_sent = TTLCache(ttl_seconds=USER_CHAT_INTERVAL_SEC, max_size=10000)
+
+# Ultimo aggiornamento del messaggio di avanzamento per batch
+_batch_progress_edited: Dict[str, float] = {}
+
+
+def _get_wakeup_event() -> asyncio.Event:
+    """Evento condiviso con il worker outbox (creato nel loop corrente)"""
+    global _wakeup_event
+    if _wakeup_event is None:
+        _wakeup_event = asyncio.Event()
+    return _wakeup_event
+
+
+def _preview(text: str, limit: int = 100) -> str:
+    return f"{text[:limit]}{'...' if len(text) > limit else ''}"
+
+
+async def send_message_to_user(telegram_id: int, message: str) -> Dict[str, Any]:
+    """
+    Invia un messaggio a un utente tramite telegram-ai-bot.
+
+    Args:
+        telegram_id: ID Telegram dell'utente destinatario
+        message: Messaggio da inviare
+
+    Returns:
+        Dict con status ("sent" o "error"), eventuale errore, retryable
+        (errore temporaneo: 429, 5xx, rete) e retry_after indicato da Telegram
+    """
+    if not TELEGRAM_BOT_TOKEN:
+        return {"status": "error", "error": "TELEGRAM_BOT_TOKEN non configurato", "retryable": False}
+
+    url = f"{TELEGRAM_API_BASE_URL}/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
+
+    try:
+        payload = {
+            "chat_id": telegram_id,
+            "text": message,
+            "parse_mode": "Markdown"
+        }
+
+        async with httpx.AsyncClient(timeout=10.0) as client:
+            response = await client.post(url, json=payload)
+            response.raise_for_status()
+
+            return {"status": "sent", "telegram_id": telegram_id}
+
+    except httpx.HTTPStatusError as e:
+        status_code = e.response.status_code
+        error_msg = f"HTTP {status_code}: {e.response.text}"
+        retry_after = None
+        if status_code == 429:
+            try:
+                retry_after = e.response.json().get("parameters", {}).get("retry_after")
+            except Exception:
+                pass
+        logger.warning(f"[USER_OUTBOX] Errore invio messaggio a {telegram_id}: {error_msg}")
+        return {
+            "status": "error",
+            "error": error_msg,
+            "telegram_id": telegram_id,
+            # 400/403 (chat non trovata, bot bloccato, Markdown non valido): inutile riprovare
+            "retryable": status_code == 429 or status_code >= 500,
+            "retry_after": float(retry_after) if retry_after is not None else None,
+        }
+
+    except Exception as e:
+        error_msg = f"Errore generico: {str(e)}"
+        logger.warning(f"[USER_OUTBOX] Errore invio messaggio a {telegram_id}: {error_msg}")
+        return {"status": "error", "error": error_msg, "telegram_id": telegram_id, "retryable": True}
+
+
+async def enqueue_user_messages(
+    telegram_ids: Sequence[int],
+    text: str,
+    admin_chat_id: int,
+    status_message_id: Optional[int]
+) -> Optional[str]:
+    """
+    Scrive nell'outbox un messaggio per ogni destinatario (una sola INSERT).
+
+    Returns:
+        batch_id se i destinatari sono più di uno (/all), altrimenti None
+    """
+    batch_id = uuid.uuid4() if len(telegram_ids) > 1 else None
+    pool = await get_db_pool()
+
+    async with pool.acquire() as conn:
+        await conn.execute("""
+            INSERT INTO admin_user_outbox (telegram_id, text, batch_id, admin_chat_id, status_message_id)
+            SELECT telegram_id, $2, $3, $4, $5
+            FROM unnest($1::bigint[]) WITH ORDINALITY AS t(telegram_id, position)
+            ORDER BY position
+        """, list(telegram_ids), text, batch_id, admin_chat_id, status_message_id)
+
+    logger.info(f"[USER_OUTBOX] {len(telegram_ids)} messaggi in coda" + (f" (batch {batch_id})" if batch_id else ""))
+    _get_wakeup_event().set()
+    return str(batch_id) if batch_id else None
+
+
+async def claim_user_messages(limit: int = OUTBOX_CLAIM_SIZE) -> List[Dict[str, Any]]:
+    """
+    Prende in carico i messaggi pronti, dal più vecchio (sicuro con più istanze):
+    pending, oppure 'sending' con lease scaduto (istanza terminata durante
+    l'invio). Messaggi con lease valido restano all'istanza che li sta inviando.
+    """
+    pool = await get_db_pool()
+
+    async with pool.acquire() as conn:
+        rows = await conn.fetch("""
+            UPDATE admin_user_outbox AS o
+            SET status = 'sending',
+                locked_until = now() + make_interval(secs => $2),
+                updated_at = now()
+            FROM (
+                SELECT id
+                FROM admin_user_outbox
+                WHERE (status = 'pending' AND next_attempt_at <= now())
+                OR (status = 'sending' AND locked_until < now())
+                ORDER BY next_attempt_at ASC, created_at ASC
+                LIMIT $1
+                FOR UPDATE SKIP LOCKED
+            ) AS claimed
+            WHERE o.id = claimed.id
+            RETURNING o.*
+        """, limit, USER_MESSAGE_LEASE_SEC)
+
+    # RETURNING non garantisce l'ordine della subquery
+    return sorted((dict(row) for row in rows), key=lambda row: (row["next_attempt_at"], row["created_at"]))
+
+
+async def _update_user_message(
+    message_id,
+    status: str,
+    delay_seconds: float = 0,
+    retry_count: Optional[int] = None,
+    error: Optional[str] = None
+) -> None:
+    """Aggiorna stato di un messaggio (pending: riprogrammato tra delay_seconds)"""
+    pool = await get_db_pool()
+
+    async with pool.acquire() as conn:
+        await conn.execute("""
+            UPDATE admin_user_outbox
+            SET status = $2,
+                next_attempt_at = now() + make_interval(secs => $3),
+                retry_count = COALESCE($4, retry_count),
+                last_error = COALESCE($5, last_error),
+                sent_at = CASE WHEN $2 = 'sent' THEN now() ELSE sent_at END,
+                locked_until = NULL,
+                updated_at = now()
+            WHERE id = $1
+        """, message_id, status, float(delay_seconds), retry_count, error)
+
+
+async def renew_user_message_lease(message_ids: List) -> None:
+    """Rinnova il lease dei messaggi ancora in invio"""
+    pool = await get_db_pool()
+
+    async with pool.acquire() as conn:
+        await conn.execute("""
+            UPDATE admin_user_outbox
+            SET locked_until = now() + make_interval(secs => $2)
+            WHERE id = ANY($1::uuid[])
+            AND status = 'sending'
+        """, message_ids, USER_MESSAGE_LEASE_SEC)
+
+
+async def release_user_messages(message_ids: List) -> None:
+    """Restituisce alla coda messaggi presi ma non ancora inviati (senza contare un tentativo)"""
+    pool = await get_db_pool()
+
+    async with pool.acquire() as conn:
+        await conn.execute("""
+            UPDATE admin_user_outbox
+            SET status = 'pending',
+                locked_until = NULL,
+                updated_at = now()
+            WHERE id = ANY($1::uuid[])
+            AND status = 'sending'
+        """, message_ids)
+
+
+async def _release_unsent(message_ids: List) -> None:
+    """Shutdown: i messaggi non ancora inviati tornano subito disponibili alla prossima istanza"""
+    if not message_ids:
+        return
+    try:
+        await release_user_messages(message_ids)
+        logger.info(f"[USER_OUTBOX] Shutdown: {len(message_ids)} messaggi restituiti alla coda")
+    except Exception as e:
+        # Restano 'sending': ripresi alla scadenza del lease
+        logger.warning(f"[USER_OUTBOX] Messaggi non restituiti alla coda allo shutdown: {e}")
+
+
+async def _keep_lease(message_ids: List) -> None:
+    """Rinnova il lease ogni terzo della sua durata finché i messaggi presi sono in invio"""
+    while True:
+        await asyncio.sleep(USER_MESSAGE_LEASE_SEC / 3)
+        try:
+            await renew_user_message_lease(message_ids)
+        except Exception as e:
+            logger.warning(f"[USER_OUTBOX] Rinnovo lease fallito: {e}")
+
+
+async def _edit_status(bot, chat_id: int, message_id: Optional[int], text: str, parse_mode: Optional[str] = None) -> None:
+    """Aggiorna il messaggio di conferma all'admin (errori di edit non bloccano l'invio)"""
+    if not message_id:
+        return
+
+    try:
+        await bot.edit_message_text(chat_id=chat_id, message_id=message_id, text=text, parse_mode=parse_mode)
+    except Exception as e:
+        # "message is not modified": stesso testo dell'aggiornamento precedente
+        if "not modified" not in str(e).lower():
+            logger.warning(f"[USER_OUTBOX] Impossibile aggiornare messaggio di conferma {message_id}: {e}")
+
+
+async def _report_single(bot, row: Dict[str, Any], outcome: str, detail: Optional[str] = None) -> None:
+    """Esito di un /<telegram_id> sul messaggio di conferma (testo libero: niente Markdown)"""
+    telegram_id = row["telegram_id"]
+    if outcome == "sent":
+        text = (
+            f"✅ Messaggio inviato con successo\n\n"
+            f"👤 Utente: {telegram_id}\n"
+            f"📝 Messaggio: {_preview(row['text'])}"
+        )
+    elif outcome == "retry":
+        text = (
+            f"⏳ Invio non riuscito, nuovo tentativo {row['retry_count'] + 1}/{USER_MAX_RETRIES} {detail}\n\n"
+            f"👤 Utente: {telegram_id}\n"
+            f"❌ Errore: {(row.get('last_error') or '')[:200]}"
+        )
+    else:
+        text = (
+            f"❌ Errore durante l'invio\n\n"
+            f"👤 Utente: {telegram_id}\n"
+            f"❌ Errore: {(row.get('last_error') or 'Errore sconosciuto')[:200]}"
+        )
+    await _edit_status(bot, row["admin_chat_id"], row["status_message_id"], text)
+
+
+async def _report_batch(bot, batch_id, admin_chat_id: int, status_message_id: Optional[int]) -> None:
+    """Avanzamento di un /all (limitato a PROGRESS_EDIT_INTERVAL_SEC) ed esito finale"""
+    pool = await get_db_pool()
+
+    async with pool.acquire() as conn:
+        rows = await conn.fetch("""
+            SELECT status, COUNT(*) AS count
+            FROM admin_user_outbox
+            WHERE batch_id = $1
+            GROUP BY status
+        """, batch_id)
+        counts = {row["status"]: row["count"] for row in rows}
+        total = sum(counts.values())
+        in_progress = counts.get("pending", 0) + counts.get("sending", 0)
+
+        key = str(batch_id)
+        now = time.monotonic()
+        if in_progress and now - _batch_progress_edited.get(key, 0.0) < PROGRESS_EDIT_INTERVAL_SEC:
+            return
+
+        failed_users = []
+        if not in_progress and counts.get("failed"):
+            failed_users = await conn.fetch("""
+                SELECT telegram_id, last_error
+                FROM admin_user_outbox
+                WHERE batch_id = $1 AND status = 'failed'
+                ORDER BY created_at
+                LIMIT 5
+            """, batch_id)
+
+    sent_count = counts.get("sent", 0)
+    failed_count = counts.get("failed", 0)
+
+    if in_progress:
+        _batch_progress_edited[key] = now
+        await _edit_status(bot, admin_chat_id, status_message_id, (
+            f"⏳ **Invio in corso...**\n\n"
+            f"📊 **Avanzamento:**\n"
+            f"• ✅ Inviati: {sent_count}/{total}\n"
+            f"• ❌ Falliti: {failed_count}/{total}\n"
+            f"• ⏳ In coda: {in_progress}/{total}"
+        ), parse_mode='Markdown')
+        return
+
+    _batch_progress_edited.pop(key, None)
+    report = (
+        f"✅ **Invio Completato**\n\n"
+        f"📊 **Statistiche:**\n"
+        f"• ✅ Inviati: {sent_count}/{total}\n"
+        f"• ❌ Falliti: {failed_count}/{total}\n\n"
+    )
+
+    if failed_users:
+        report += "**Errori:**\n"
+        for failed in failed_users:
+            error = (failed['last_error'] or '')[:50].replace('`', "'")
+            report += f"• ID {failed['telegram_id']}: `{error}`\n"
+        if failed_count > len(failed_users):
+            report += f"\n... e altri {failed_count - len(failed_users)} errori"
+
+    await _edit_status(bot, admin_chat_id, status_message_id, report, parse_mode='Markdown')
+
+
+async def process_user_message(bot, row: Dict[str, Any]) -> bool:
+    """
+    Invia un messaggio dell'outbox rispettando il pacing per chat.
+
+    Returns:
+        True se è stata fatta una richiesta a Telegram (conta per il pacing globale)
+    """
+    telegram_id = row["telegram_id"]
+
+    # Chat servita da meno di USER_CHAT_INTERVAL_SEC: riprogrammato, non è un retry
+    last_sent = _chat_last_sent.get(telegram_id)
+    if last_sent is not None:
+        wait = max(0.0, last_sent + USER_CHAT_INTERVAL_SEC - time.monotonic())
+        await _update_user_message(row["id"], "pending", delay_seconds=wait)
+        USER_MESSAGES.inc(outcome="paced")
+        return False
+
+    result = await send_message_to_user(telegram_id, row["text"])
+    _chat_last_sent.set(telegram_id, time.monotonic())
+
+    if result["status"] == "sent":
+        await _update_user_message(row["id"], "sent")
+        USER_MESSAGES.inc(outcome="sent")
+        if row["batch_id"] is None:
+            await _report_single(bot, row, "sent")
+        logger.info(f"[USER_OUTBOX] Messaggio {row['id']} inviato a {telegram_id}")
+        return True
+
+    error = result.get("error", "Errore sconosciuto")[:500]
+    row["last_error"] = error
+    if result.get("retryable") and row["retry_count"] < USER_MAX_RETRIES:
+        retry_count = row["retry_count"] + 1
+        delay = result.get("retry_after") or calculate_backoff(retry_count, base_seconds=USER_RETRY_BASE_SEC)
+        await _update_user_message(row["id"], "pending", delay_seconds=delay, retry_count=retry_count, error=error)
+        USER_MESSAGES.inc(outcome="retry")
+        if row["batch_id"] is None:
+            await _report_single(bot, row, "retry", f"tra {delay:.0f}s")
+        logger.warning(f"[USER_OUTBOX] Messaggio {row['id']} a {telegram_id}: retry {retry_count}/{USER_MAX_RETRIES} tra {delay:.0f}s")
+        return True
+
+    await _update_user_message(row["id"], "failed", error=error)
+    USER_MESSAGES.inc(outcome="failed")
+    if row["batch_id"] is None:
+        await _report_single(bot, row, "failed")
+    logger.error(f"[USER_OUTBOX] Messaggio {row['id']} a {telegram_id} fallito: {error}")
+    return True
+
+
+async def _fail_unexpected(bot, row: Dict[str, Any], error: Exception) -> None:
+    """Segna fallito un messaggio interrotto da un errore imprevisto (se il database risponde)"""
+    row["last_error"] = f"Errore imprevisto: {str(error)[:450]}"
+    try:
+        await _update_user_message(row["id"], "failed", error=row["last_error"])
+    except Exception as e:
+        # Resta 'sending': ripreso a lease scaduto
+        logger.error(f"[USER_OUTBOX] Impossibile segnare fallito il messaggio {row['id']}: {e}")
+        return
+    USER_MESSAGES.inc(outcome="failed")
+    if row["batch_id"] is None:
+        await _report_single(bot, row, "failed")
+
+
+async def user_outbox_worker(bot):
+    """Loop worker outbox: invia i messaggi in coda con pacing globale e per chat"""
+    logger.info("[USER_OUTBOX] Worker outbox utenti avviato")
+    current_operation.set("user_outbox")
+    wakeup_event = _get_wakeup_event()
+    send_interval = 1.0 / USER_SEND_RATE_PER_SEC if USER_SEND_RATE_PER_SEC > 0 else 0.0
+
+    while True:
+        try:
+            rows = await claim_user_messages()
+
+            if not rows:
+                # Coda vuota - attendi nuovo messaggio o timeout polling
+                try:
+                    await asyncio.wait_for(wakeup_event.wait(), timeout=OUTBOX_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                wakeup_event.clear()
+                continue
+
+            batches: Dict[str, Dict[str, Any]] = {}
+            requests_made = 0
+            # Messaggi presi non ancora avviati: restituiti alla coda se il worker viene fermato
+            unsent = [row["id"] for row in rows]
+            lease_task = asyncio.create_task(_keep_lease(list(unsent)))
+            try:
+                for row in rows:
+                    started = time.monotonic()
+                    # Da qui l'invio può essere partito: allo shutdown resta sotto lease
+                    unsent.remove(row["id"])
+                    try:
+                        requested = await process_user_message(bot, row)
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as e:
+                        # Esito incerto (il messaggio potrebbe essere partito): fallito, non
+                        # rimesso in coda, così l'admin lo vede e decide se reinviarlo
+                        logger.error(f"[USER_OUTBOX] Errore messaggio {row['id']}: {e}", exc_info=True)
+                        await _fail_unexpected(bot, row, e)
+                        requested = True
+                    if row["batch_id"] is not None:
+                        batches[str(row["batch_id"])] = row
+                    # Pacing globale tra richieste a Telegram
+                    if requested:
+                        requests_made += 1
+                        if send_interval:
+                            await asyncio.sleep(max(0.0, send_interval - (time.monotonic() - started)))
+            except asyncio.CancelledError:
+                await _release_unsent(unsent)
+                raise
+            finally:
+                lease_task.cancel()
+                await asyncio.gather(lease_task, return_exceptions=True)
+
+            # Un aggiornamento di avanzamento per /all toccato in questo giro
+            for row in batches.values():
+                await _report_batch(bot, row["batch_id"], row["admin_chat_id"], row["status_message_id"])
+
+            # Solo messaggi riprogrammati per pacing: attendi che una chat si liberi
+            if not requests_made:
+                await asyncio.sleep(min(USER_CHAT_INTERVAL_SEC, OUTBOX_POLL_INTERVAL))
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"[USER_OUTBOX] Errore nel worker outbox: {e}", exc_info=True)
+            await asyncio.sleep(OUTBOX_POLL_INTERVAL)
+
+
+async def start_user_outbox_worker(bot) -> asyncio.Task:
+    """
+    Avvia il worker outbox utenti.
+
+    Args:
+        bot: Bot Telegram admin (per modificare i messaggi di conferma)
+
+    Returns:
+        Task worker (da cancellare allo shutdown)
+    """
+    return asyncio.create_task(user_outbox_worker(bot), name="user-outbox-worker")
@@ -0,0 +1,32 @@
+"""
+Dimensione batch adattiva per il worker notifiche
+"""
+
+
+class AdaptiveBatchSize:
+    """
+    Quante notifiche prendere al prossimo claim.
+    
+    Claim pieno = backlog: la dimensione raddoppia fino a maximum, così una
+    coda accumulata (es. dopo un outage) si svuota alla velocità consentita
+    da Telegram. Claim parziale = coda quasi vuota: si torna a quanto
+    effettivamente trovato (mai sotto minimum). Il limite non supera mai gli
+    invii disponibili nel rate limiter: righe che verrebbero solo rilasciate
+    non vengono lette.
+    """
+    
+    def __init__(self, minimum: int = 20, maximum: int = 500):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.current = self.minimum
+    
+    def limit(self, headroom: int) -> int:
+        """Dimensione del prossimo claim dati gli invii disponibili (headroom > 0)"""
+        return max(1, min(self.current, headroom))
+    
+    def observe(self, claimed: int, limit: int):
+        """Aggiorna la dimensione in base a quante notifiche ha restituito il claim"""
+        if claimed >= limit:
+            self.current = min(self.maximum, max(self.current, limit) * 2)
+        else:
+            self.current = max(self.minimum, claimed)
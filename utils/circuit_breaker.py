@@ -0,0 +1,81 @@
+"""
+Circuit breaker per chiamate verso servizi esterni (es. processor)
+"""
+import time
+from typing import Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Circuito aperto: la chiamata viene rifiutata senza contattare il servizio"""
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker a tre stati.
+    
+    - closed: le chiamate passano, gli errori consecutivi vengono contati
+    - open: dopo failure_threshold errori consecutivi le chiamate falliscono subito
+    - half_open: dopo reset_timeout passa una sola chiamata di prova;
+      se va a buon fine il circuito si richiude, altrimenti si riapre
+    """
+    
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        
+        self._state = CLOSED
+        self._consecutive_failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self.last_error: Optional[str] = None
+    
+    @property
+    def state(self) -> str:
+        """Stato corrente (open diventa half_open allo scadere di reset_timeout)"""
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._trial_in_flight = False
+        return self._state
+    
+    def allow_request(self) -> bool:
+        """Verifica se una chiamata può partire"""
+        state = self.state
+        if state == CLOSED:
+            return True
+        if state == HALF_OPEN and not self._trial_in_flight:
+            # Una sola chiamata di prova alla volta
+            self._trial_in_flight = True
+            return True
+        return False
+    
+    def record_success(self):
+        """Chiamata riuscita: azzera errori e chiude il circuito"""
+        self._consecutive_failures = 0
+        self._state = CLOSED
+        self._opened_at = None
+        self._trial_in_flight = False
+        self.last_error = None
+    
+    def record_failure(self, error: Optional[str] = None):
+        """Chiamata fallita: apre il circuito oltre la soglia (o subito se in prova)"""
+        self._consecutive_failures += 1
+        self.last_error = error
+        
+        if self._state == HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+            self._state = OPEN
+            self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+    
+    def release_trial(self):
+        """Libera lo slot di prova senza esito (chiamata annullata)"""
+        self._trial_in_flight = False
+    
+    def seconds_until_retry(self) -> float:
+        """Secondi mancanti alla prossima chiamata di prova (0 se non aperto)"""
+        if self._state != OPEN or self._opened_at is None:
+            return 0.0
+        return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
@@ -0,0 +1,50 @@
+"""
+Deduplicazione in memoria su finestra temporale scorrevole
+"""
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+
+class SlidingWindowDeduplicator:
+    """
+    Ricorda le chiavi viste negli ultimi window_seconds.
+    
+    Le chiavi sono in ordine di registrazione: quelle scadute vengono rimosse
+    dalla testa ad ogni controllo, senza scansioni complete.
+    """
+    
+    def __init__(self, window_seconds: float = 600, max_size: int = 10000):
+        self.window_seconds = window_seconds
+        self.max_size = max_size
+        self._seen: "OrderedDict[Hashable, float]" = OrderedDict()
+        self.duplicates = 0
+    
+    def _evict(self, now: float):
+        """Rimuove chiavi fuori finestra e oltre max_size"""
+        cutoff = now - self.window_seconds
+        while self._seen:
+            key, seen_at = next(iter(self._seen.items()))
+            if seen_at > cutoff and len(self._seen) <= self.max_size:
+                break
+            self._seen.popitem(last=False)
+    
+    def check_and_record(self, key: Hashable, now: Optional[float] = None) -> bool:
+        """
+        True se la chiave è un duplicato (già vista nella finestra).
+        Altrimenti la registra e restituisce False.
+        """
+        now = time.monotonic() if now is None else now
+        self._evict(now)
+        if key in self._seen:
+            self.duplicates += 1
+            return True
+        self._seen[key] = now
+        return False
+    
+    def forget(self, key: Hashable):
+        """Dimentica una chiave (es. invio non riuscito: la prossima occorrenza va inviata)"""
+        self._seen.pop(key, None)
+    
+    def __len__(self) -> int:
+        return len(self._seen)
@@ -0,0 +1,63 @@
+"""
+Selezione event loop all'avvio: asyncio standard o uvloop (opzionale)
+"""
+import os
+import asyncio
+import logging
+from typing import Any, Callable, Coroutine, Optional, Tuple
+from utils.metrics import registry
+
+try:
+    import uvloop
+    UVLOOP_AVAILABLE = True
+except ImportError:
+    uvloop = None
+    UVLOOP_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Event loop: asyncio (default), uvloop (fallback ad asyncio se non installato) o auto (uvloop se disponibile)
+EVENT_LOOP = os.getenv("ADMIN_EVENT_LOOP", "asyncio").lower()
+
+EVENT_LOOP_INFO = registry.gauge(
+    "admin_bot_event_loop_info",
+    "Implementazione event loop in uso (valore 1)",
+    ["loop"]
+)
+
+LoopFactory = Callable[[], asyncio.AbstractEventLoop]
+
+
+def select_event_loop(name: str = EVENT_LOOP) -> Tuple[str, Optional[LoopFactory]]:
+    """
+    Implementazione richiesta -> (nome effettivo, factory del loop).
+    Factory None = loop asyncio standard. Valori non validi o uvloop non
+    installato ricadono su asyncio con un warning, senza bloccare l'avvio.
+    """
+    name = (name or "asyncio").lower()
+    if name == "asyncio":
+        return "asyncio", None
+    if name in ("uvloop", "auto"):
+        if UVLOOP_AVAILABLE:
+            return "uvloop", uvloop.new_event_loop
+        if name == "uvloop":
+            logger.warning("⚠️ ADMIN_EVENT_LOOP=uvloop ma uvloop non è installato: uso asyncio")
+        return "asyncio", None
+    logger.warning(f"⚠️ ADMIN_EVENT_LOOP={name} non valido (asyncio, uvloop, auto): uso asyncio")
+    return "asyncio", None
+
+
+def run(main: Coroutine[Any, Any, Any], name: str = EVENT_LOOP) -> Any:
+    """asyncio.run() sul loop selezionato"""
+    selected, loop_factory = select_event_loop(name)
+    logger.info(f"Event loop: {selected}")
+    EVENT_LOOP_INFO.set(1, loop=selected)
+
+    if loop_factory is None:
+        return asyncio.run(main)
+    if hasattr(asyncio, "Runner"):
+        # Python 3.11+: factory esplicita, nessuna policy globale
+        with asyncio.Runner(loop_factory=loop_factory) as runner:
+            return runner.run(main)
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return asyncio.run(main)
@@ -0,0 +1,74 @@
+"""
+Istogramma latenze a bucket fissi (leggero, senza dipendenze)
+"""
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence
+
+# Bucket default in secondi (da 5ms a 5 minuti)
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0
+)
+
+
+class LatencyHistogram:
+    """Istogramma cumulabile di latenze (secondi)"""
+    
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets: List[float] = sorted(buckets)
+        # Un contatore per bucket + overflow (+Inf)
+        self._counts: List[int] = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+    
+    def observe(self, value: float):
+        """Registra una latenza"""
+        self._counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+    
+    def merge(self, other: 'LatencyHistogram'):
+        """Somma un altro istogramma con gli stessi bucket"""
+        if other.buckets != self.buckets:
+            raise ValueError("Bucket istogrammi non compatibili")
+        for i, bucket_count in enumerate(other._counts):
+            self._counts[i] += bucket_count
+        self.count += other.count
+        self.sum += other.sum
+    
+    def percentile(self, q: float) -> Optional[float]:
+        """
+        Stima del percentile q (0-1) come limite superiore del bucket.
+        
+        Returns:
+            Latenza stimata in secondi, None se non ci sono osservazioni
+        """
+        if self.count == 0:
+            return None
+        
+        target = q * self.count
+        cumulative = 0
+        for i, bucket_count in enumerate(self._counts):
+            cumulative += bucket_count
+            if cumulative >= target:
+                return self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+        return self.buckets[-1]
+    
+    def cumulative_counts(self) -> List[int]:
+        """Conteggi cumulativi per bucket (formato Prometheus, ultimo = +Inf)"""
+        result = []
+        cumulative = 0
+        for bucket_count in self._counts:
+            cumulative += bucket_count
+            result.append(cumulative)
+        return result
+    
+    def snapshot(self) -> Dict[str, Optional[float]]:
+        """Riepilogo: count, media, p50, p95, p99"""
+        return {
+            "count": self.count,
+            "avg": (self.sum / self.count) if self.count else None,
+            "p50": self.percentile(0.50),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+        }
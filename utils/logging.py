@@ -2,17 +2,54 @@
 Logging strutturato con correlation_id per gioia-admin-bot
 """
 import json
+import time
 import logging
 import uuid
-from typing import Optional
+from typing import Any, Dict, Optional
 from datetime import datetime
 
 logger = logging.getLogger("app")
 
+_LEVELS = {
+    "debug": logging.DEBUG,
+    "info": logging.INFO,
+    "warning": logging.WARNING,
+    "error": logging.ERROR,
+    "critical": logging.CRITICAL,
+}
+
+
+class StructuredMessage:
+    """
+    Messaggio JSON serializzato solo quando il record viene emesso.
+    
+    Con il QueueHandler di logging_config la serializzazione avviene nel thread
+    del QueueListener, fuori dall'event loop.
+    """
+    __slots__ = ("payload", "args", "created", "_rendered")
+    
+    def __init__(self, payload: Dict[str, Any], args: tuple = ()):
+        self.payload = payload
+        self.args = args
+        self.created = time.time()
+        self._rendered: Optional[str] = None
+    
+    def __str__(self) -> str:
+        if self._rendered is None:
+            payload = self.payload
+            if self.args:
+                payload["message"] = payload["message"] % self.args
+            if payload.get("correlation_id") is None:
+                payload["correlation_id"] = str(uuid.uuid4())
+            payload["timestamp"] = datetime.utcfromtimestamp(self.created).isoformat()
+            self._rendered = json.dumps(payload, default=str)
+        return self._rendered
+
 
 def log_with_context(
     level: str,
     message: str,
+    *args,
     correlation_id: Optional[str] = None,
     notification_id: Optional[str] = None,
     **extra
@@ -20,20 +57,24 @@ def log_with_context(
     """
     Log strutturato JSON con contesto notifica.
     
+    Se il livello è disabilitato non viene costruito nulla; altrimenti
+    formattazione del messaggio, timestamp e JSON sono rimandati all'emissione.
+    
     Args:
         level: 'info', 'warning', 'error', 'debug'
-        message: Messaggio log
+        message: Messaggio log (eventuali args con formattazione %, come logging)
         correlation_id: ID correlazione request (genera se None)
         notification_id: ID notifica admin
         **extra: Campi aggiuntivi per log
     """
-    if correlation_id is None:
-        correlation_id = str(uuid.uuid4())
+    numeric_level = _LEVELS.get(level.lower(), logging.INFO)
+    if not logger.isEnabledFor(numeric_level):
+        return
     
     payload = {
-        "level": level.upper(),
+        "level": logging.getLevelName(numeric_level),
         "message": message,
-        "timestamp": datetime.utcnow().isoformat(),
+        "timestamp": None,
         "correlation_id": correlation_id,
         **extra
     }
@@ -41,10 +82,4 @@ def log_with_context(
     if notification_id:
         payload["notification_id"] = notification_id
     
-    # Log come JSON per parsing strutturato
-    logger.log(
-        getattr(logging, level.upper(), logging.INFO),
-        json.dumps(payload)
-    )
-
-
+    logger.log(numeric_level, StructuredMessage(payload, args))
@@ -0,0 +1,226 @@
+"""
+Monitor event loop: campionatore di lag e rilevatore di callback lente
+"""
+import os
+import time
+import asyncio
+import logging
+from collections import Counter as TallyCounter, deque
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Monitor attivo (default: true)
+LOOP_MONITOR_ENABLED = os.getenv("ADMIN_LOOP_MONITOR", "true").lower() == "true"
+
+# Intervallo di campionamento del lag (default: 0.5 secondi)
+LOOP_LAG_INTERVAL_SEC = float(os.getenv("ADMIN_LOOP_LAG_INTERVAL_SEC", 0.5))
+
+# Callback che tengono il loop oltre questa soglia vengono registrate (default: 100 ms)
+SLOW_CALLBACK_MS = float(os.getenv("ADMIN_SLOW_CALLBACK_MS", 100))
+
+# Campioni di lag e callback lente tenuti per /lag
+LAG_HISTORY = 240
+SLOW_CALLBACK_HISTORY = 50
+
+# Operazione in corso nel task (handler comando, worker, ...): attribuisce le callback lente
+current_operation: ContextVar[Optional[str]] = ContextVar("admin_current_operation", default=None)
+
+LOOP_LAG = registry.histogram(
+    "admin_bot_event_loop_lag_seconds",
+    "Ritardo dell'event loop rispetto al risveglio programmato",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+LOOP_LAG_MAX = registry.gauge(
+    "admin_bot_event_loop_lag_max_seconds",
+    "Lag massimo dell'event loop negli ultimi campioni"
+)
+SLOW_CALLBACKS = registry.counter(
+    "admin_bot_slow_callbacks_total",
+    "Callback che hanno bloccato l'event loop oltre ADMIN_SLOW_CALLBACK_MS, per sorgente",
+    ["source"]
+)
+SLOW_CALLBACK_SECONDS = registry.counter(
+    "admin_bot_slow_callbacks_seconds_total",
+    "Tempo totale di blocco dell'event loop da callback lente, per sorgente",
+    ["source"]
+)
+
+
+def _describe(handle: asyncio.Handle) -> Tuple[str, str]:
+    """
+    (sorgente, dettaglio) della callback: operazione del contesto se impostata,
+    altrimenti la coroutine del task o il nome della funzione.
+    """
+    callback = handle._callback
+    owner = getattr(callback, "__self__", None)
+    if isinstance(owner, asyncio.Task):
+        coro = owner.get_coro()
+        target = getattr(coro, "__qualname__", None) or repr(coro)
+        detail = f"{owner.get_name()} {target}"
+    else:
+        target = getattr(callback, "__qualname__", None) or repr(callback)
+        detail = target
+
+    context = handle._context
+    operation = context.get(current_operation) if context is not None else None
+    return operation or target, detail
+
+
+class LoopMonitor:
+    """
+    Lag: un task dorme LOOP_LAG_INTERVAL_SEC e misura di quanto si sveglia in
+    ritardo (tempo in cui il loop era occupato da altro).
+
+    Callback lente: Handle._run di asyncio viene avvolto per misurare ogni
+    callback (due perf_counter); oltre la soglia la callback viene attribuita
+    a operazione/task responsabile. Come il debug mode di asyncio
+    (slow_callback_duration), ma sempre attivo e con costo trascurabile.
+    Con loop che non usano asyncio.Handle (es. uvloop) resta solo il lag.
+    """
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL_SEC, slow_callback_ms: float = SLOW_CALLBACK_MS):
+        self.interval = interval
+        self.slow_callback_sec = slow_callback_ms / 1000
+        self._lags: Deque[float] = deque(maxlen=LAG_HISTORY)
+        self._slow: Deque[Tuple[float, float, str, str]] = deque(maxlen=SLOW_CALLBACK_HISTORY)
+        self._original_run = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def installed(self) -> bool:
+        """True se il rilevatore di callback lente è attivo"""
+        return self._original_run is not None
+
+    def _record_slow(self, handle: asyncio.Handle, duration: float):
+        source, detail = _describe(handle)
+        self._slow.append((time.time(), duration, source, detail))
+        SLOW_CALLBACKS.inc(source=source)
+        SLOW_CALLBACK_SECONDS.inc(duration, source=source)
+        logger.warning(f"[LOOP] Callback lenta {duration * 1000:.0f} ms: {source} ({detail})")
+
+    def install_slow_callback_hook(self):
+        """Avvolge asyncio.Handle._run (una sola volta per processo)"""
+        if self.installed:
+            return
+        original_run = asyncio.Handle._run
+        monitor = self
+
+        def _timed_run(handle):
+            start = time.perf_counter()
+            try:
+                original_run(handle)
+            finally:
+                duration = time.perf_counter() - start
+                if duration >= monitor.slow_callback_sec:
+                    monitor._record_slow(handle, duration)
+
+        asyncio.Handle._run = _timed_run
+        self._original_run = original_run
+
+    def uninstall_slow_callback_hook(self):
+        if self._original_run is not None:
+            asyncio.Handle._run = self._original_run
+            self._original_run = None
+
+    async def _sample_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            scheduled = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - scheduled)
+            self._lags.append(lag)
+            LOOP_LAG.observe(lag)
+            LOOP_LAG_MAX.set(max(self._lags))
+
+    def start(self) -> asyncio.Task:
+        """Avvia campionamento lag e rilevatore callback lente nel loop corrente"""
+        if isinstance(asyncio.get_running_loop(), asyncio.BaseEventLoop):
+            self.install_slow_callback_hook()
+        else:
+            logger.info("[LOOP] Event loop non asyncio: solo campionamento lag, nessun rilevatore callback lente")
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._sample_loop(), name="loop-monitor")
+        logger.info(
+            f"[LOOP] Monitor event loop attivo: lag ogni {self.interval}s, "
+            f"callback lente >= {self.slow_callback_sec * 1000:.0f} ms"
+        )
+        return self._task
+
+    async def stop(self):
+        self.uninstall_slow_callback_hook()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Lag recente (ultimi LAG_HISTORY campioni) e callback lente più recenti e per sorgente"""
+        lags = sorted(self._lags)
+        by_source: TallyCounter = TallyCounter()
+        blocked_by_source: Dict[str, float] = {}
+        for _, duration, source, _ in self._slow:
+            by_source[source] += 1
+            blocked_by_source[source] = blocked_by_source.get(source, 0.0) + duration
+
+        def percentile(q: float) -> Optional[float]:
+            if not lags:
+                return None
+            return lags[min(len(lags) - 1, int(q * len(lags)))]
+
+        return {
+            "samples": len(lags),
+            "window_sec": len(lags) * self.interval,
+            "last": self._lags[-1] if self._lags else None,
+            "p50": percentile(0.5),
+            "p99": percentile(0.99),
+            "max": lags[-1] if lags else None,
+            "slow_callback_ms": self.slow_callback_sec * 1000,
+            "slow_hook_installed": self.installed,
+            "slow_recent": list(reversed(self._slow)),
+            "slow_by_source": sorted(
+                ((source, count, blocked_by_source[source]) for source, count in by_source.items()),
+                key=lambda item: item[2],
+                reverse=True
+            ),
+        }
+
+
+def format_lag(snapshot: Dict[str, Any], max_recent: int = 10) -> str:
+    """Messaggio /lag (Markdown)"""
+    def ms(value: Optional[float]) -> str:
+        return f"{value * 1000:.1f} ms" if value is not None else "N/A"
+
+    lines = [
+        "⏱️ **Event loop**",
+        "",
+        f"Lag ultimi {snapshot['window_sec']:.0f}s ({snapshot['samples']} campioni):",
+        f"• ultimo: {ms(snapshot['last'])}",
+        f"• p50: {ms(snapshot['p50'])} · p99: {ms(snapshot['p99'])} · max: {ms(snapshot['max'])}",
+        "",
+    ]
+
+    if not snapshot["slow_hook_installed"]:
+        lines.append("ℹ️ Rilevatore callback lente non attivo su questo event loop")
+        return "\n".join(lines)
+
+    threshold = f"{snapshot['slow_callback_ms']:.0f} ms"
+    if not snapshot["slow_recent"]:
+        lines.append(f"✅ Nessuna callback oltre {threshold}")
+        return "\n".join(lines)
+
+    lines.append(f"🐢 **Callback oltre {threshold} per sorgente:**")
+    for source, count, blocked in snapshot["slow_by_source"]:
+        lines.append(f"• `{source}`: {count}× · {blocked * 1000:.0f} ms totali")
+    lines.append("")
+    lines.append("**Più recenti:**")
+    recent: List[Tuple[float, float, str, str]] = snapshot["slow_recent"][:max_recent]
+    for at, duration, source, detail in recent:
+        lines.append(f"• {time.strftime('%H:%M:%S', time.localtime(at))} {duration * 1000:.0f} ms `{detail}`")
+    return "\n".join(lines)
+
+
+# Monitor del processo
+loop_monitor = LoopMonitor()
@@ -0,0 +1,219 @@
+"""
+Registry metriche in-process con esposizione formato Prometheus (testo)
+"""
+import logging
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from utils.histogram import LatencyHistogram, DEFAULT_BUCKETS
+
+logger = logging.getLogger(__name__)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape_label_value(value: object) -> str:
+    """Escape valore label (backslash, doppi apici, a capo)"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames: Sequence[str], values: LabelValues, extra: Optional[Tuple[str, str]] = None) -> str:
+    """Formatta label Prometheus: {a="1",b="2"}"""
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label_value(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    """Formatta valore numerico (interi senza decimali)"""
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """Base metrica con label"""
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict[str, object]) -> LabelValues:
+        """Valori label nell'ordine dichiarato"""
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        """Righe formato Prometheus"""
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Contatore monotono"""
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        """Incrementa il contatore"""
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        """Valore corrente"""
+        return self._values.get(self._key(labels), 0)
+
+    def items(self) -> Iterator[Tuple[LabelValues, float]]:
+        """Coppie (label, valore)"""
+        return iter(list(self._values.items()))
+
+    def render(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in self._values.items()
+        ]
+
+
+class Gauge(_Metric):
+    """Valore istantaneo"""
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels):
+        """Imposta valore"""
+        self._values[self._key(labels)] = value
+
+    def get(self, **labels) -> Optional[float]:
+        """Valore corrente (None se mai impostato)"""
+        return self._values.get(self._key(labels))
+
+    def clear(self):
+        """Rimuove tutti i valori (per gauge ricalcolati ad ogni scrape)"""
+        self._values.clear()
+
+    def render(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in self._values.items()
+        ]
+
+
+class Histogram(_Metric):
+    """Istogramma latenze (un LatencyHistogram per combinazione di label)"""
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        self._histograms: Dict[LabelValues, LatencyHistogram] = {}
+
+    def observe(self, value: float, **labels):
+        """Registra un'osservazione"""
+        key = self._key(labels)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = LatencyHistogram(self.buckets)
+        histogram.observe(value)
+
+    def get(self, **labels) -> Optional[LatencyHistogram]:
+        """Istogramma per label (None se nessuna osservazione)"""
+        return self._histograms.get(self._key(labels))
+
+    def items(self) -> Iterator[Tuple[LabelValues, LatencyHistogram]]:
+        """Coppie (label, istogramma)"""
+        return iter(list(self._histograms.items()))
+
+    def merged(self) -> LatencyHistogram:
+        """Istogramma aggregato su tutte le label"""
+        merged = LatencyHistogram(self.buckets)
+        for histogram in self._histograms.values():
+            merged.merge(histogram)
+        return merged
+
+    def render(self) -> List[str]:
+        lines = []
+        for key, histogram in self._histograms.items():
+            cumulative = histogram.cumulative_counts()
+            for bound, count in zip(histogram.buckets, cumulative):
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(self.labelnames, key, ("le", "+Inf"))
+            lines.append(f"{self.name}_bucket{labels} {cumulative[-1]}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(histogram.sum)}")
+            lines.append(f"{self.name}_count{labels} {histogram.count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Registry metriche: definizioni + collector eseguiti ad ogni scrape"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Awaitable[None]]] = []
+
+    def _register(self, metric: _Metric) -> _Metric:
+        """Registra metrica (idempotente per nome: restituisce quella esistente)"""
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        """Crea (o recupera) un contatore"""
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        """Crea (o recupera) un gauge"""
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        """Crea (o recupera) un istogramma"""
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector: Callable[[], Awaitable[None]]):
+        """Aggiunge collector async eseguito prima di ogni render (es. query DB)"""
+        if collector not in self._collectors:
+            self._collectors.append(collector)
+
+    async def collect(self):
+        """Esegue i collector (un collector in errore non blocca gli altri)"""
+        for collector in self._collectors:
+            try:
+                await collector()
+            except Exception as e:
+                logger.warning(f"Errore collector metriche {getattr(collector, '__name__', collector)}: {e}")
+
+    async def render(self) -> str:
+        """Esegue i collector e restituisce tutte le metriche in formato Prometheus"""
+        await self.collect()
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Registry globale del processo
+registry = MetricsRegistry()
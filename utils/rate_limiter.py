@@ -5,10 +5,23 @@ import time
 from typing import Dict, Optional
 from collections import defaultdict
 from datetime import datetime, timedelta
+from utils.metrics import registry
+
+# Notifiche rifiutate dal rate limiter (reason: global, error_antispam)
+RATE_LIMIT_REJECTIONS = registry.counter(
+    "admin_bot_rate_limiter_rejections_total",
+    "Notifiche rifiutate dal rate limiter",
+    ["reason"]
+)
 
 
 class RateLimiter:
-    """Rate limiter per notifiche admin"""
+    """
+    Rate limiter per notifiche admin.
+    
+    Il limite globale è per bucket (una chat di destinazione): con il routing
+    su più chat ognuna ha il proprio limite al minuto. bucket=None è la chat di default.
+    """
     
     def __init__(
         self,
@@ -18,8 +31,8 @@ class RateLimiter:
         self.global_limit_per_min = global_limit_per_min
         self.min_error_interval_sec = min_error_interval_sec
         
-        # Track globale: lista timestamp ultimi invii
-        self._global_sends: list = []
+        # Track globale: timestamp ultimi invii per bucket
+        self._global_sends: Dict[Optional[str], list] = defaultdict(list)
         
         # Track per utente: ultimo errore notificato per telegram_id
         self._last_error_notified: Dict[int, datetime] = {}
@@ -27,25 +40,51 @@ class RateLimiter:
         # Track batch errori: errori accumulati per utente
         self._pending_errors: Dict[int, list] = defaultdict(list)
     
-    def can_send_globally(self) -> bool:
+    def can_send_globally(self, bucket: Optional[str] = None) -> bool:
         """
-        Verifica se possiamo inviare una notifica (limite globale).
+        Verifica se possiamo inviare una notifica (limite globale del bucket).
         """
         now = datetime.utcnow()
         cutoff = now - timedelta(minutes=1)
         
         # Rimuovi timestamp vecchi (> 1 minuto)
-        self._global_sends = [ts for ts in self._global_sends if ts > cutoff]
+        sends = [ts for ts in self._global_sends[bucket] if ts > cutoff]
+        self._global_sends[bucket] = sends
         
         # Verifica limite
-        if len(self._global_sends) >= self.global_limit_per_min:
+        if len(sends) >= self.global_limit_per_min:
+            RATE_LIMIT_REJECTIONS.inc(reason="global")
             return False
         
         return True
     
-    def record_send(self):
-        """Registra un invio (per limite globale)"""
-        self._global_sends.append(datetime.utcnow())
+    def headroom(self, bucket: Optional[str] = None) -> int:
+        """Invii ancora disponibili nella finestra dell'ultimo minuto per il bucket"""
+        cutoff = datetime.utcnow() - timedelta(minutes=1)
+        recent = sum(1 for ts in self._global_sends.get(bucket, ()) if ts > cutoff)
+        return max(0, self.global_limit_per_min - recent)
+    
+    def next_available_in(self, bucket: Optional[str] = None) -> float:
+        """Secondi al prossimo invio consentito nel bucket (0 se c'è headroom)"""
+        now = datetime.utcnow()
+        cutoff = now - timedelta(minutes=1)
+        # Timestamp in ordine di invio: il posto si libera quando scade quello
+        # che eccede il limite contando dal più recente
+        recent = [ts for ts in self._global_sends.get(bucket, ()) if ts > cutoff]
+        if len(recent) < self.global_limit_per_min:
+            return 0.0
+        if self.global_limit_per_min <= 0:
+            return 60.0
+        blocking = recent[len(recent) - self.global_limit_per_min]
+        return max(0.0, (blocking + timedelta(minutes=1) - now).total_seconds())
+    
+    def headroom_by_bucket(self) -> Dict[Optional[str], int]:
+        """Invii disponibili per ogni bucket usato"""
+        return {bucket: self.headroom(bucket) for bucket in list(self._global_sends)}
+    
+    def record_send(self, bucket: Optional[str] = None):
+        """Registra un invio (per limite globale del bucket)"""
+        self._global_sends[bucket].append(datetime.utcnow())
     
     def can_notify_error(self, telegram_id: int) -> bool:
         """
@@ -59,7 +98,10 @@ class RateLimiter:
             return True
         
         elapsed = (now - last_notified).total_seconds()
-        return elapsed >= self.min_error_interval_sec
+        if elapsed < self.min_error_interval_sec:
+            RATE_LIMIT_REJECTIONS.inc(reason="error_antispam")
+            return False
+        return True
     
     def record_error_notification(self, telegram_id: int):
         """Registra che abbiamo notificato un errore per questo utente"""
@@ -0,0 +1,37 @@
+"""
+Contatore su finestra scorrevole a bucket di un secondo
+"""
+import time
+from typing import List
+
+
+class RollingCounter:
+    """
+    Conta eventi negli ultimi N secondi con costo O(1) per evento.
+    
+    Usa un buffer circolare di bucket da 1 secondo: i bucket scaduti
+    vengono azzerati quando vengono riutilizzati.
+    """
+    
+    def __init__(self, window_seconds: int = 3600):
+        self.window_seconds = window_seconds
+        self._counts: List[int] = [0] * window_seconds
+        self._stamps: List[int] = [-1] * window_seconds
+    
+    def record(self, amount: int = 1, now: float = None):
+        """Registra amount eventi al secondo corrente"""
+        second = int(now if now is not None else time.time())
+        index = second % self.window_seconds
+        if self._stamps[index] != second:
+            self._stamps[index] = second
+            self._counts[index] = 0
+        self._counts[index] += amount
+    
+    def count(self, seconds: int, now: float = None) -> int:
+        """Eventi negli ultimi `seconds` secondi (max window_seconds)"""
+        current = int(now if now is not None else time.time())
+        oldest = current - min(seconds, self.window_seconds) + 1
+        return sum(
+            count for count, stamp in zip(self._counts, self._stamps)
+            if oldest <= stamp <= current
+        )
@@ -0,0 +1,49 @@
+"""
+Cache in memoria con scadenza (TTL) e statistiche hit/miss
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+
+
+class TTLCache:
+    """Cache LRU con TTL per valori letti spesso e aggiornati raramente (es. info utente)"""
+    
+    def __init__(self, ttl_seconds: float = 300, max_size: int = 1024):
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Valore in cache (None se assente o scaduto)"""
+        entry = self._data.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+    
+    def set(self, key: Hashable, value: Any):
+        """Inserisce valore (rimuove il meno recente oltre max_size)"""
+        self._data[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+    
+    def invalidate(self, key: Hashable):
+        """Rimuove una chiave"""
+        self._data.pop(key, None)
+    
+    def __len__(self) -> int:
+        return len(self._data)
+    
+    @property
+    def hit_rate(self) -> Optional[float]:
+        """Percentuale hit (0-1), None se mai interrogata"""
+        total = self.hits + self.misses
+        return (self.hits / total) if total else None
@@ -5,28 +5,104 @@ import os
 import asyncio
 import logging
 import json
-from datetime import datetime, timedelta
-from typing import List, Optional
+from datetime import datetime
+from typing import List, Optional, Set
 from db import get_db_pool
 from models import AdminNotification
+from notification_queue import get_notification_queue
 from notifier import send_notification_with_retry
 from templates import (
     format_onboarding_completed,
     format_inventory_uploaded,
     format_error,
-    format_batch_errors
+    format_batch_errors,
+    format_quiet_hours_digest
 )
+from quiet_hours import quiet_hours, QUIET_DIGEST_MAX
+from digest import digest_counters
+from routing import router, Destination
+from lifecycle_cards import lifecycle_cards, LifecycleCard, LIFECYCLE_EVENTS
+from health import worker_heartbeat
 from utils.rate_limiter import RateLimiter
+from utils.adaptive_batch import AdaptiveBatchSize
 from utils.logging import log_with_context
 from utils.backoff import calculate_backoff
+from utils.metrics import registry
+from utils.loop_monitor import current_operation
+from utils.rolling_counter import RollingCounter
+from utils.ttl_cache import TTLCache
+from utils.dedup import SlidingWindowDeduplicator
 
 logger = logging.getLogger(__name__)
 
 # Polling interval (secondi)
 POLLING_INTERVAL = 5
 
+# Notifiche lette per batch (minimo; cresce fino al massimo se c'è backlog e
+# rate limit disponibile) e pausa tra batch consecutivi non pieni (secondi)
+BATCH_SIZE = int(os.getenv("ADMIN_WORKER_BATCH_SIZE", 20))
+MAX_BATCH_SIZE = int(os.getenv("ADMIN_WORKER_MAX_BATCH_SIZE", 500))
+BATCH_PAUSE = float(os.getenv("ADMIN_WORKER_BATCH_PAUSE_SEC", 1))
+
+# Attesa minima quando il rate limit è esaurito (evita risvegli a vuoto)
+MIN_RATE_LIMIT_WAIT = 0.05
+
+# Metriche coda notifiche
+QUEUE_PENDING = registry.gauge(
+    "admin_bot_notifications_pending",
+    "Notifiche admin in stato pending"
+)
+QUEUE_OLDEST_PENDING_AGE = registry.gauge(
+    "admin_bot_notifications_oldest_pending_age_seconds",
+    "Età della notifica pending più vecchia"
+)
+WORKER_BATCH_SIZE = registry.gauge(
+    "admin_bot_worker_batch_size",
+    "Dimensione attuale del batch adattivo del worker"
+)
+DISPATCH_LATENCY = registry.histogram(
+    "admin_bot_notification_dispatch_latency_seconds",
+    "Latenza da inserimento in coda (created_at) a invio riuscito",
+    ["event_type"]
+)
+NOTIFICATIONS_PROCESSED = registry.counter(
+    "admin_bot_notifications_processed_total",
+    "Notifiche processate per esito (sent, edited, suppressed, duplicate, held, digested, rate_limited, edit_fallback, retry, failed, error)",
+    ["event_type", "outcome"]
+)
+
+# Invii riusciti nell'ultima ora (per /stats)
+RECENT_SENDS = RollingCounter(window_seconds=3600)
+
+# Cache info utente: ogni notifica richiederebbe una query su users
+USER_INFO_CACHE_TTL = int(os.getenv("ADMIN_USER_CACHE_TTL_SEC", 300))
+user_info_cache = TTLCache(ttl_seconds=USER_INFO_CACHE_TTL, max_size=2048)
+
+# Dedup eventi ripetuti dai producer (stesso event_type, telegram_id, correlation_id, stage)
+DEDUP_WINDOW_SEC = int(os.getenv("ADMIN_DEDUP_WINDOW_SEC", 600))
+notification_deduplicator = SlidingWindowDeduplicator(window_seconds=DEDUP_WINDOW_SEC, max_size=10000)
+
+# Rate limiter del worker (condiviso con /stats)
+_rate_limiter: Optional[RateLimiter] = None
+
+
+def get_rate_limiter() -> Optional[RateLimiter]:
+    """Rate limiter del worker (None se il worker non è avviato)"""
+    return _rate_limiter
+
 
 async def get_user_info(telegram_id: int) -> dict:
+    """Recupera informazioni utente (cache TTL, poi database)"""
+    cached = user_info_cache.get(telegram_id)
+    if cached is not None:
+        return cached
+    
+    user_info = await _fetch_user_info(telegram_id)
+    user_info_cache.set(telegram_id, user_info)
+    return user_info
+
+
+async def _fetch_user_info(telegram_id: int) -> dict:
     """Recupera informazioni utente dal database"""
     pool = await get_db_pool()
     
@@ -58,9 +134,8 @@ async def get_user_info(telegram_id: int) -> dict:
             }
 
 
-async def format_notification_message(notification: AdminNotification) -> str:
-    """Formatta messaggio notifica in base al tipo evento"""
-    user_info = await get_user_info(notification.telegram_id)
+def _payload_dict(notification: AdminNotification) -> dict:
+    """Payload della notifica come dict (stringhe JSON e valori non validi normalizzati)"""
     payload = notification.payload
     
     # Safety check: assicura che payload sia sempre un dict
@@ -75,6 +150,13 @@ async def format_notification_message(notification: AdminNotification) -> str:
     elif not isinstance(payload, dict):
         logger.warning(f"Payload non è dict per notifica {notification.id}: {type(payload)}")
         payload = {}
+    return payload
+
+
+async def format_notification_message(notification: AdminNotification) -> str:
+    """Formatta messaggio notifica in base al tipo evento"""
+    user_info = await get_user_info(notification.telegram_id)
+    payload = _payload_dict(notification)
     
     if notification.event_type == "onboarding_completed":
         return format_onboarding_completed(
@@ -126,55 +208,183 @@ async def format_notification_message(notification: AdminNotification) -> str:
 🔗 CorrID: {notification.correlation_id or 'N/A'}"""
 
 
+def dedup_key(notification: AdminNotification) -> Optional[tuple]:
+    """
+    Chiave dedup (None se manca correlation_id: evento non deduplicabile).
+    Include lo stage: tables_created e completamento dello stesso onboarding
+    condividono la correlation_id ma sono eventi distinti della card.
+    """
+    if not notification.correlation_id:
+        return None
+    stage = _payload_dict(notification).get("stage")
+    return (notification.event_type, notification.telegram_id, notification.correlation_id, stage)
+
+
+def _record_digest(notification: AdminNotification):
+    """Contatori del digest periodico (una volta per notifica: dedup per id, anche con retry)"""
+    digest_counters.record(
+        notification.id,
+        notification.event_type,
+        notification.telegram_id,
+        _payload_dict(notification),
+        notification.created_at
+    )
+
+
 async def process_notification(notification: AdminNotification, rate_limiter: RateLimiter) -> bool:
     """
-    Processa una singola notifica.
+    Processa una singola notifica, scartando i duplicati prima di formattare e inviare.
+    Durante le ore di silenzio del suo event_type la notifica viene trattenuta
+    e inviata nel digest a fine finestra.
+    
+    Returns:
+        True se processata con successo (scartata come duplicato o trattenuta), False altrimenti
+    """
+    if notification.held_until is None:
+        window_end = quiet_hours.window_end(notification.event_type)
+        if window_end is not None:
+            logger.debug(
+                "Notifica %s (%s) trattenuta fino a %s UTC (ore di silenzio)",
+                notification.id, notification.event_type, window_end
+            )
+            await get_notification_queue().hold(notification.id, window_end)
+            # Trattenuta ma avvenuta: conta nel digest come le notifiche inviate subito
+            _record_digest(notification)
+            NOTIFICATIONS_PROCESSED.inc(event_type=notification.event_type, outcome="held")
+            return True
+    
+    key = dedup_key(notification)
+    if key is not None and notification_deduplicator.check_and_record(key):
+        logger.info(
+            f"Notifica {notification.id} duplicata ({notification.event_type}, "
+            f"utente {notification.telegram_id}, corrID {notification.correlation_id}): non inviata"
+        )
+        await mark_notification_sent(notification.id)
+        NOTIFICATIONS_PROCESSED.inc(event_type=notification.event_type, outcome="duplicate")
+        return True
+    
+    _record_digest(notification)
+    
+    processed = False
+    try:
+        processed = await _deliver_notification(notification, rate_limiter)
+        return processed
+    finally:
+        # Non inviata (rate limit, errore): la prossima occorrenza non è un duplicato
+        if key is not None and not processed:
+            notification_deduplicator.forget(key)
+
+
+async def _deliver_notification(notification: AdminNotification, rate_limiter: RateLimiter) -> bool:
+    """
+    Verifica rate limit, formatta e invia una notifica.
+    Gli eventi di ciclo di vita (onboarding, inventario) modificano la card
+    già inviata per lo stesso utente/correlation_id invece di inviare un nuovo messaggio.
     
     Returns:
         True se processata con successo, False altrimenti
     """
     try:
-        # Verifica rate limit globale
-        if not rate_limiter.can_send_globally():
+        # Chat (e topic) di destinazione: ognuna ha il proprio rate limit
+        destination = router.resolve(notification.event_type, _payload_dict(notification))
+        
+        # Card da modificare: le modifiche hanno un bucket rate limit separato dagli invii
+        card = None
+        if notification.event_type in LIFECYCLE_EVENTS:
+            card = lifecycle_cards.lookup(notification.correlation_id, notification.telegram_id, destination)
+        bucket = f"edit:{destination.chat_id}" if card else destination.bucket
+        
+        # Verifica rate limit globale della destinazione
+        if not rate_limiter.can_send_globally(bucket):
             # Log solo ogni 10 notifiche per evitare spam di log
             if notification.retry_count % 10 == 0:
                 logger.debug(
-                    f"Rate limit globale raggiunto ({rate_limiter.global_limit_per_min}/min), "
+                    f"Rate limit globale raggiunto ({rate_limiter.global_limit_per_min}/min) per chat {destination.chat_id}, "
                     f"notifica {notification.id} in attesa (retry: {notification.retry_count})"
                 )
+            NOTIFICATIONS_PROCESSED.inc(event_type=notification.event_type, outcome="rate_limited")
+            await release_notification(notification.id)
             return False
         
         # Per errori, verifica anti-spam per utente
         if notification.event_type == "error":
             if not rate_limiter.can_notify_error(notification.telegram_id):
-                logger.info(f"Anti-spam: errore per utente {notification.telegram_id} già notificato recentemente")
+                logger.info("Anti-spam: errore per utente %s già notificato recentemente", notification.telegram_id)
                 # Aggiorna notifica come "sent" ma non inviare (batching futuro)
                 await mark_notification_sent(notification.id)
+                NOTIFICATIONS_PROCESSED.inc(event_type=notification.event_type, outcome="suppressed")
                 return True
         
         # Formatta messaggio
         message = await format_notification_message(notification)
         
-        # Invia notifica
-        result = await send_notification_with_retry(
-            message=message,
-            notification_id=str(notification.id),
-            correlation_id=notification.correlation_id,
-            max_retries=10
-        )
+        if card is not None:
+            card_text = card.extended(message)
+            if card_text is None:
+                # Card piena: il prossimo tentativo apre una nuova card
+                lifecycle_cards.forget(card)
+                await release_notification(notification.id)
+                return False
+            result = await send_notification_with_retry(
+                message=card_text,
+                notification_id=str(notification.id),
+                correlation_id=notification.correlation_id,
+                max_retries=3,
+                chat_id=card.chat_id,
+                edit_message_id=card.message_id
+            )
+            if result["status"] != "sent":
+                # Messaggio non più modificabile: nuova card al prossimo tentativo
+                logger.info(
+                    "[LIFECYCLE] Card utente %s non modificabile, nuovo messaggio per notifica %s",
+                    notification.telegram_id, notification.id
+                )
+                lifecycle_cards.forget(card)
+                NOTIFICATIONS_PROCESSED.inc(event_type=notification.event_type, outcome="edit_fallback")
+                await release_notification(notification.id)
+                return False
+            card.text = card_text
+            await lifecycle_cards.save(card, notification.correlation_id)
+        else:
+            # Invia notifica
+            result = await send_notification_with_retry(
+                message=message,
+                notification_id=str(notification.id),
+                correlation_id=notification.correlation_id,
+                max_retries=10,
+                chat_id=destination.chat_id,
+                message_thread_id=destination.thread_id
+            )
+            if result["status"] == "sent" and notification.event_type in LIFECYCLE_EVENTS and result.get("message_id"):
+                await lifecycle_cards.save(LifecycleCard(
+                    telegram_id=notification.telegram_id,
+                    chat_id=destination.chat_id,
+                    thread_id=destination.thread_id,
+                    message_id=result["message_id"],
+                    text=message
+                ), notification.correlation_id)
         
         if result["status"] == "sent":
             # Registra invio
-            rate_limiter.record_send()
+            rate_limiter.record_send(bucket)
             if notification.event_type == "error":
                 rate_limiter.record_error_notification(notification.telegram_id)
             
             # Aggiorna status
             await mark_notification_sent(notification.id)
             
+            NOTIFICATIONS_PROCESSED.inc(event_type=notification.event_type, outcome="edited" if card else "sent")
+            RECENT_SENDS.record()
+            if notification.created_at:
+                DISPATCH_LATENCY.observe(
+                    max(0.0, (datetime.utcnow() - notification.created_at).total_seconds()),
+                    event_type=notification.event_type
+                )
+            
             log_with_context(
                 "info",
-                f"Notifica {notification.id} processata con successo",
+                "Notifica %s processata con successo",
+                notification.id,
                 correlation_id=notification.correlation_id,
                 notification_id=str(notification.id),
                 event_type=notification.event_type
@@ -183,110 +393,264 @@ async def process_notification(notification: AdminNotification, rate_limiter: Ra
         
         else:
             # Errore - aggiorna per retry
+            NOTIFICATIONS_PROCESSED.inc(event_type=notification.event_type, outcome="retry")
             await update_notification_retry(
                 notification.id,
                 notification.retry_count + 1,
-                result["error"]
+                result["error"],
+                event_type=notification.event_type
             )
             return False
             
     except Exception as e:
         logger.error(f"Errore processamento notifica {notification.id}: {e}", exc_info=True)
+        NOTIFICATIONS_PROCESSED.inc(event_type=notification.event_type, outcome="error")
         
         # Aggiorna per retry
         await update_notification_retry(
             notification.id,
             notification.retry_count + 1,
-            str(e)
+            str(e),
+            event_type=notification.event_type
         )
         return False
 
 
 async def mark_notification_sent(notification_id) -> None:
     """Marca notifica come inviata"""
-    pool = await get_db_pool()
-    
-    async with pool.acquire() as conn:
-        await conn.execute("""
-            UPDATE admin_notifications
-            SET status = 'sent'
-            WHERE id = $1
-        """, notification_id)
+    await get_notification_queue().ack(notification_id)
+
 
+async def release_notification(notification_id) -> None:
+    """Rimette subito disponibile una notifica presa ma non processata (es. rate limit)"""
+    await get_notification_queue().release(notification_id)
 
-async def update_notification_retry(notification_id, retry_count: int, error: Optional[str]) -> None:
+
+async def update_notification_retry(
+    notification_id,
+    retry_count: int,
+    error: Optional[str],
+    event_type: Optional[str] = None
+) -> None:
     """Aggiorna notifica con retry count e next_attempt_at"""
-    pool = await get_db_pool()
-    
     max_retries = int(os.getenv("ADMIN_MAX_RETRY", 10))
     base_backoff = int(os.getenv("ADMIN_BACKOFF_BASE", 10))
     
     if retry_count >= max_retries:
         # Marca come failed
-        status = "failed"
-        next_attempt = None
+        delay_seconds = None
+        NOTIFICATIONS_PROCESSED.inc(event_type=event_type or "unknown", outcome="failed")
     else:
-        # Calcola prossimo tentativo
-        backoff_seconds = calculate_backoff(retry_count, base_backoff)
-        next_attempt = datetime.utcnow() + timedelta(seconds=backoff_seconds)
-        status = "pending"  # Rimane pending per retry
+        # Calcola prossimo tentativo (rimane pending per retry)
+        delay_seconds = calculate_backoff(retry_count, base_backoff)
     
-    async with pool.acquire() as conn:
-        await conn.execute("""
-            UPDATE admin_notifications
-            SET retry_count = $1,
-                next_attempt_at = $2,
-                status = $3
-            WHERE id = $4
-        """, retry_count, next_attempt, status, notification_id)
+    # Ultimo errore conservato per la vista dead-letter (/failed)
+    last_error = error[:1000] if error else None
+    
+    await get_notification_queue().nack(notification_id, retry_count, delay_seconds, last_error)
+
+
+def send_headroom(rate_limiter: RateLimiter) -> int:
+    """Invii disponibili ora sommati sulle destinazioni configurate"""
+    return sum(rate_limiter.headroom(destination.bucket) for destination in router.destinations())
+
+
+def next_token_in(rate_limiter: RateLimiter) -> float:
+    """Secondi al primo invio di nuovo consentito su una delle destinazioni"""
+    return min(rate_limiter.next_available_in(destination.bucket) for destination in router.destinations())
+
+
+async def _renew_leases(in_flight: Set) -> None:
+    """
+    Rinnova ogni terzo del lease le notifiche prese e non ancora concluse:
+    i retry interni di send_notification_with_retry (backoff fino a minuti)
+    superano il lease, e senza rinnovo un'altra istanza la riprenderebbe
+    durante l'invio (doppio messaggio).
+    """
+    queue = get_notification_queue()
+    while True:
+        await asyncio.sleep(queue.lease_seconds / 3)
+        if not in_flight:
+            continue
+        try:
+            await queue.renew(list(in_flight))
+        except Exception as e:
+            logger.warning(f"Rinnovo lease di {len(in_flight)} notifiche fallito: {e}")
+
+
+async def _stop_lease_renewal(task: asyncio.Task) -> None:
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
 
 
 async def fetch_pending_notifications(limit: int = 50) -> List[AdminNotification]:
-    """Recupera notifiche pending pronte per invio"""
-    pool = await get_db_pool()
+    """Prende (claim) le notifiche pending pronte per invio"""
+    return await get_notification_queue().claim(limit)
+
+
+async def release_held_notifications(rate_limiter: RateLimiter) -> int:
+    """
+    Invia le notifiche trattenute la cui finestra di silenzio è finita,
+    come un unico digest per chat di destinazione.
     
-    now = datetime.utcnow()
+    Returns:
+        Numero di notifiche incluse nei digest inviati (0 se nessuna o invio rimandato)
+    """
+    held = await get_notification_queue().claim(QUIET_DIGEST_MAX, held=True)
+    if not held:
+        return 0
     
-    async with pool.acquire() as conn:
-        rows = await conn.fetch("""
-            SELECT *
-            FROM admin_notifications
-            WHERE status = 'pending'
-            AND next_attempt_at <= $1
-            ORDER BY created_at ASC
-            LIMIT $2
-        """, now, limit)
-        
-        return [AdminNotification.from_row(row) for row in rows]
+    by_destination = {}
+    for notification in held:
+        destination = router.resolve(notification.event_type, _payload_dict(notification))
+        by_destination.setdefault(destination, []).append(notification)
+    
+    in_flight = {notification.id for notification in held}
+    lease_task = asyncio.create_task(_renew_leases(in_flight))
+    released = 0
+    try:
+        for destination, notifications in by_destination.items():
+            released += await _send_held_digest(destination, notifications, rate_limiter)
+            in_flight.difference_update(notification.id for notification in notifications)
+    finally:
+        await _stop_lease_renewal(lease_task)
+    return released
+
+
+async def _send_held_digest(destination: Destination, held: List[AdminNotification], rate_limiter: RateLimiter) -> int:
+    """Digest delle notifiche trattenute per una destinazione (ack se inviato, retry altrimenti)"""
+    queue = get_notification_queue()
+    if not rate_limiter.can_send_globally(destination.bucket):
+        for notification in held:
+            await queue.release(notification.id)
+        return 0
+    
+    message = format_quiet_hours_digest([
+        (n.event_type, n.telegram_id, _payload_dict(n), n.created_at)
+        for n in held
+    ])
+    result = await send_notification_with_retry(
+        message=message,
+        notification_id=f"quiet-digest-{held[0].id}",
+        max_retries=10,
+        chat_id=destination.chat_id,
+        message_thread_id=destination.thread_id
+    )
+    
+    if result["status"] != "sent":
+        logger.warning("[QUIET_HOURS] Digest di %d notifiche non inviato: %s", len(held), result["error"])
+        for notification in held:
+            await update_notification_retry(
+                notification.id,
+                notification.retry_count + 1,
+                result["error"],
+                event_type=notification.event_type
+            )
+        return 0
+    
+    rate_limiter.record_send(destination.bucket)
+    RECENT_SENDS.record()
+    for notification in held:
+        await queue.ack(notification.id)
+        NOTIFICATIONS_PROCESSED.inc(event_type=notification.event_type, outcome="digested")
+    logger.info("[QUIET_HOURS] Digest inviato con %d notifiche trattenute", len(held))
+    return len(held)
+
+
+async def collect_queue_metrics():
+    """Collector metriche: pending e età della più vecchia"""
+    stats = await get_notification_queue().stats()
+    
+    QUEUE_PENDING.set(stats["pending"])
+    oldest = stats["oldest_pending_at"]
+    oldest_age = (datetime.utcnow() - oldest).total_seconds() if oldest else 0
+    QUEUE_OLDEST_PENDING_AGE.set(max(0.0, oldest_age))
 
 
-async def worker_loop(rate_limiter: RateLimiter):
-    """Loop principale worker per processare notifiche"""
+async def _release_unprocessed(notifications: List[AdminNotification]) -> None:
+    """Restituisce alla coda notifiche prese ma non processate (shutdown)"""
+    for notification in notifications:
+        try:
+            await release_notification(notification.id)
+        except Exception as e:
+            # Claim non rilasciato: torna disponibile alla scadenza del lease
+            logger.warning(f"Notifica {notification.id} non rilasciata allo shutdown: {e}")
+
+
+async def _wait_or_stop(stop_event: asyncio.Event, timeout: float) -> None:
+    """Attesa interrotta subito dalla richiesta di stop"""
+    try:
+        await asyncio.wait_for(stop_event.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+
+
+async def worker_loop(rate_limiter: RateLimiter, stop_event: Optional[asyncio.Event] = None):
+    """
+    Loop principale worker per processare notifiche.
+    
+    Con stop_event impostato smette di prendere nuove notifiche, termina quella
+    in corso e restituisce subito alla coda le altre del batch. Se viene
+    cancellato (deadline di shutdown superata) restituisce anche quella in corso.
+    """
+    stop_event = stop_event or asyncio.Event()
+    current_operation.set("worker")
+    batch_size = AdaptiveBatchSize(BATCH_SIZE, MAX_BATCH_SIZE)
     logger.info("🚀 Worker notifiche admin avviato")
     
-    while True:
+    while not stop_event.is_set():
+        worker_heartbeat.beat()
         try:
-            # Recupera notifiche pending
-            notifications = await fetch_pending_notifications(limit=20)
+            # Digest notifiche trattenute a fine ore di silenzio (anche se le
+            # finestre sono state rimosse nel frattempo: nessuna resta bloccata)
+            await release_held_notifications(rate_limiter)
+            
+            # Rate limit esaurito: nessuna lettura finché non si libera un invio
+            headroom = send_headroom(rate_limiter)
+            if headroom <= 0:
+                wait = min(max(next_token_in(rate_limiter), MIN_RATE_LIMIT_WAIT), POLLING_INTERVAL)
+                await _wait_or_stop(stop_event, wait)
+                continue
+            
+            # Recupera notifiche pending (al massimo quante se ne possono inviare)
+            limit = batch_size.limit(headroom)
+            notifications = await fetch_pending_notifications(limit=limit)
+            batch_size.observe(len(notifications), limit)
+            WORKER_BATCH_SIZE.set(batch_size.current)
             
             if notifications:
-                logger.info(f"Trovate {len(notifications)} notifiche pending")
+                logger.info("Trovate %d notifiche pending", len(notifications))
                 
-                # Processa ogni notifica
+                # Processa ogni notifica (lease rinnovato finché non è conclusa)
                 processed_count = 0
                 skipped_count = 0
+                in_flight = {notification.id for notification in notifications}
+                lease_task = asyncio.create_task(_renew_leases(in_flight))
                 
-                for notification in notifications:
-                    try:
-                        result = await process_notification(notification, rate_limiter)
-                        if result:
-                            processed_count += 1
-                        else:
+                try:
+                    for index, notification in enumerate(notifications):
+                        if stop_event.is_set():
+                            logger.info("Shutdown: %d notifiche del batch restituite alla coda", len(notifications) - index)
+                            await _release_unprocessed(notifications[index:])
+                            break
+                        worker_heartbeat.beat()
+                        try:
+                            result = await process_notification(notification, rate_limiter)
+                            if result:
+                                processed_count += 1
+                            else:
+                                skipped_count += 1
+                        except asyncio.CancelledError:
+                            await _release_unprocessed(notifications[index:])
+                            raise
+                        except Exception as e:
+                            logger.error(f"Errore processamento notifica {notification.id}: {e}", exc_info=True)
                             skipped_count += 1
-                    except Exception as e:
-                        logger.error(f"Errore processamento notifica {notification.id}: {e}", exc_info=True)
-                        skipped_count += 1
-                        continue
+                            continue
+                        finally:
+                            in_flight.discard(notification.id)
+                finally:
+                    await _stop_lease_renewal(lease_task)
                 
                 if skipped_count > 0:
                     logger.debug(
@@ -295,18 +659,23 @@ async def worker_loop(rate_limiter: RateLimiter):
                     )
             else:
                 # Nessuna notifica - attesa breve
-                await asyncio.sleep(POLLING_INTERVAL)
+                await _wait_or_stop(stop_event, POLLING_INTERVAL)
                 continue
             
-            # Piccola pausa tra batch
-            await asyncio.sleep(1)
+            # Batch pieno e tutto processato = backlog: subito il prossimo (il rate
+            # limit è controllato prima del claim); altrimenti piccola pausa tra batch
+            if len(notifications) < limit or skipped_count:
+                await _wait_or_stop(stop_event, BATCH_PAUSE)
             
         except Exception as e:
             logger.error(f"Errore nel worker loop: {e}", exc_info=True)
-            await asyncio.sleep(POLLING_INTERVAL)
+            await _wait_or_stop(stop_event, POLLING_INTERVAL)
+    
+    worker_heartbeat.stop()
+    logger.info("🛑 Worker notifiche admin fermato")
 
 
-async def start_worker():
+async def start_worker(stop_event: Optional[asyncio.Event] = None):
     """Avvia worker notifiche"""
     # Verifica configurazione
     if not os.getenv("ADMIN_BOT_TOKEN"):
@@ -326,10 +695,12 @@ async def start_worker():
         f"{min_error_interval}s intervallo minimo errori"
     )
     
+    global _rate_limiter
     rate_limiter = RateLimiter(
         global_limit_per_min=rate_limit_per_min,
         min_error_interval_sec=min_error_interval
     )
+    _rate_limiter = rate_limiter
     
     # Avvia loop
-    await worker_loop(rate_limiter)
+    await worker_loop(rate_limiter, stop_event)